@@ -17,15 +17,39 @@ class Expr(object):
         self._dependencies = get_dependencies(expression)
 
     def evaluate(self, context):
-        return eval(self._expression, context)
+        return eval(self._code, context)
 
 
 class ExpressionNamespace(Atom):
+    '''
+    Evaluates a set of interdependent expressions
+
+    The dependencies between expressions are resolved once (whenever the set
+    of expressions changes) into a topologically-sorted evaluation plan. Values
+    are then computed by evaluating the compiled expressions in plan order
+    against a single shared namespace containing the globals and the values
+    computed so far.
+    '''
 
     _locals = Typed(dict, {})
     _expressions = Typed(dict, {})
     _globals = Typed(dict, {})
 
+    #: Namespace used for evaluating expressions (globals plus locals).
+    _namespace = Typed(dict, {})
+
+    #: Maps each expression to the names (in evaluation order) that must be
+    #: evaluated to compute it. The expression itself is the last entry.
+    _plan = Typed(dict, {})
+
+    #: Maps each name to the expressions that depend on it (directly or
+    #: indirectly).
+    _dependents = Typed(dict, {})
+
+    #: Names in `_locals` that were computed from an expression (rather than
+    #: set directly).
+    _computed = Typed(set, ())
+
     def __init__(self, expressions=None, globals=None):
         if globals is None:
             globals = {}
@@ -33,13 +57,34 @@ class ExpressionNamespace(Atom):
             expressions = {}
         self._locals = {}
         self._globals = globals
+        self._namespace = globals.copy()
+        self._computed = set()
         self._expressions = {k: Expr(str(v)) for k, v in expressions.items()}
+        self._build_plan()
 
     def update_expressions(self, expressions):
-        self._expressions.update({k: Expr(str(v)) for k, v in expressions.items()})
+        expressions = {k: Expr(str(v)) for k, v in expressions.items()}
+        rebuild = False
+        for k, v in expressions.items():
+            old = self._expressions.get(k, None)
+            if old is None or old._dependencies != v._dependencies:
+                rebuild = True
+                break
+        if rebuild:
+            old_expressions = self._expressions.copy()
+            self._expressions.update(expressions)
+            try:
+                self._build_plan()
+            except ValueError:
+                self._expressions = old_expressions
+                raise
+        else:
+            self._expressions.update(expressions)
 
     def update_symbols(self, symbols):
         self._globals.update(symbols)
+        self._namespace.update(symbols)
+        self._namespace.update(self._locals)
 
     def reset(self, context_item_names=None):
         '''
@@ -47,6 +92,8 @@ class ExpressionNamespace(Atom):
         preparation for the next cycle.
         '''
         self._locals = {}
+        self._namespace = self._globals.copy()
+        self._computed = set()
 
     def get_value(self, name, context=None):
         if name not in self._locals:
@@ -62,14 +109,71 @@ class ExpressionNamespace(Atom):
         return dict(self._locals.copy())
 
     def set_value(self, name, value):
-        _locals = self._locals.copy()
-        _locals[name] = value
-        self._locals = _locals
+        self.set_values({name: value})
 
     def set_values(self, values):
+        # Any values that were computed from the prior value need to be
+        # recomputed. Values that were set directly are left alone.
+        invalid = set()
+        for name in values:
+            invalid.update(self._dependents.get(name, ()))
+        invalid &= self._computed
+        invalid -= set(values)
+
         _locals = self._locals.copy()
+        for name in invalid:
+            del _locals[name]
+            self._namespace.pop(name, None)
         _locals.update(values)
         self._locals = _locals
+        self._namespace.update(values)
+        self._computed -= invalid
+        self._computed -= set(values)
+
+    def _build_plan(self):
+        '''
+        Resolve the dependencies between expressions into an evaluation plan
+
+        Raises a ValueError if the expressions contain a circular dependency.
+        '''
+        expressions = self._expressions
+        graph = {}
+        for name, expr in expressions.items():
+            deps = []
+            for d in expr._dependencies:
+                if d not in expressions:
+                    d = d.split('.', 1)[0]
+                if d in expressions and d not in deps:
+                    deps.append(d)
+            graph[name] = deps
+
+        plan = {}
+        dependents = {}
+
+        def visit(name, path):
+            if name in plan:
+                return plan[name]
+            if name in path:
+                cycle = ' -> '.join(path[path.index(name):] + [name])
+                raise ValueError(f'Circular dependency detected: {cycle}')
+            path.append(name)
+            order = []
+            for d in graph[name]:
+                for n in visit(d, path):
+                    if n not in order:
+                        order.append(n)
+            path.pop()
+            order.append(name)
+            plan[name] = order
+            return order
+
+        for name in graph:
+            visit(name, [])
+            for d in plan[name][:-1]:
+                dependents.setdefault(d, set()).add(name)
+
+        self._plan = plan
+        self._dependents = dependents
 
     def _evaluate_value(self, name, context=None):
         if context is None:
@@ -77,20 +181,24 @@ class ExpressionNamespace(Atom):
 
         if name in context:
             self._locals[name] = context[name]
+            self._namespace[name] = context[name]
             return
 
-        expr = self._expressions[name]
-        c = self._globals.copy()
-        c.update(self._locals)
-        c.update(context)
-
-        # Build a context dictionary containing the dependencies required for
-        # evaluating the expression.
-        for d in expr._dependencies:
-            if d not in c and d in self._expressions:
-                c[d] = self.get_value(d, c)
-        
+        plan = self._plan[name]
+        if context:
+            namespace = self._namespace.copy()
+            namespace.update(context)
+        else:
+            namespace = self._namespace
+
         # Note that in the past I was forcing a copy of self._locals to ensure
         # that the GUI was updated as needed; however, this proved to be a very
-        # slow process since it triggered a cascade of GUI updates. 
-        self._locals[name] = expr.evaluate(c)
+        # slow process since it triggered a cascade of GUI updates.
+        for n in plan:
+            if n in self._locals or n in context:
+                continue
+            value = self._expressions[n].evaluate(namespace)
+            self._locals[n] = value
+            self._namespace[n] = value
+            namespace[n] = value
+            self._computed.add(n)
@@ -6,9 +6,10 @@ from .engine import Engine
 
 from .input import (Input, ContinuousInput, EventInput, EpochInput, Callback,
                     CalibratedInput, RMS, SPL, IIRFilter, Blocked, Accumulate,
-                    Capture, Downsample, Decimate, Discard, Threshold, Average,
-                    Delay, Transform, Edges, ExtractEpochs, RejectEpochs,
-                    Detrend, concatenate, coroutine)
+                    Capture, Downsample, Decimate, Resample, Discard,
+                    Threshold, Average, SpectralAverage, Delay, Transform,
+                    Edges, ExtractEpochs, RejectEpochs, Detrend, concatenate,
+                    coroutine)
 
 from .output import (Synchronized, ContinuousOutput, EpochOutput,
                      QueuedEpochOutput, SelectorQueuedEpochOutput,
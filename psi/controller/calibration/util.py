@@ -81,17 +81,25 @@ def csd(s, fs, window=None, waveform_averages=None):
         s = w/w.mean()*s
     return np.fft.rfft(s, axis=-1)/n
 
-def phase(s, fs, window=None, waveform_averages=None, unwrap=True):
-    c = csd(s, fs, window, waveform_averages)
+def csd_to_phase(c, unwrap=True):
     p = np.angle(c)
     if unwrap:
         p = np.unwrap(p)
     return p
 
 
+def csd_to_psd(c):
+    return 2*np.abs(c)/np.sqrt(2.0)
+
+
+def phase(s, fs, window=None, waveform_averages=None, unwrap=True):
+    c = csd(s, fs, window, waveform_averages)
+    return csd_to_phase(c, unwrap)
+
+
 def psd(s, fs, window=None, waveform_averages=None):
     c = csd(s, fs, window, waveform_averages)
-    return 2*np.abs(c)/np.sqrt(2.0)
+    return csd_to_psd(c)
 
 
 def psd_freq(s, fs):
@@ -109,9 +109,9 @@ class InputMixin(Declarative):
             log.debug('Configuring input {}'.format(input.name))
             input.configure()
 
-    def add_callback(self, cb):
+    def add_callback(self, cb, copy_data=True):
         from .input import Callback
-        callback = Callback(function=cb)
+        callback = Callback(function=cb, copy_data=copy_data)
         self.add_input(callback)
 
 
@@ -169,14 +169,31 @@ class CounterChannel(CounterMixin, Channel):
 
 class HardwareAOChannel(AnalogMixin, OutputMixin, HardwareMixin, Channel):
 
+    #: Scratch space used to sum the outputs if there is more than one output.
+    _scratch = Typed(np.ndarray)
+
     def get_samples(self, offset, samples, out=None):
+        '''
+        Write the sum of all outputs into `out`
+
+        The first output is rendered directly into `out`. Remaining outputs are
+        rendered into a scratch buffer that is reused on each call and then
+        added to `out`.
+        '''
         if out is None:
             out = np.empty(samples, dtype=np.double)
-        n_outputs = len(self.outputs)
-        waveforms = np.empty((n_outputs, samples))
-        for output, waveform in zip(self.outputs, waveforms):
-            output.get_samples(offset, samples, out=waveform)
-        return np.sum(waveforms, axis=0, out=out)
+        if not self.outputs:
+            out[:] = 0
+            return out
+        self.outputs[0].get_samples(offset, samples, out=out)
+        if len(self.outputs) > 1:
+            if self._scratch is None or self._scratch.shape[-1] < samples:
+                self._scratch = np.empty(samples, dtype=np.double)
+            scratch = self._scratch[:samples]
+            for output in self.outputs[1:]:
+                output.get_samples(offset, samples, out=scratch)
+                out += scratch
+        return out
 
 
 class SoftwareAOChannel(AnalogMixin, OutputMixin, SoftwareMixin, Channel):
@@ -0,0 +1,179 @@
+'''
+Offloads processing of acquired data to worker threads
+
+By default, engines pass data read from the hardware to the input graph in
+the thread that reads the data. If processing the data takes longer than the
+engine's poll period, the hardware buffer eventually overflows. When an engine
+is configured with `hw_ai_workers`, each block of data read from the hardware
+is placed on a queue and the engine returns immediately. Worker threads take
+the blocks off the queue and pass them to the input graph.
+
+Each channel is assigned to a single worker, so the blocks for a channel are
+always processed in the order they were acquired.
+
+If the workers fall behind and a queue fills up, the block is dropped for that
+worker (by default) so that the thread reading from the hardware is never
+blocked. Dropped blocks are reported as overflows by `get_metrics`.
+'''
+import logging
+log = logging.getLogger(__name__)
+
+from queue import Full, Queue
+import threading
+import time
+
+
+class WorkerStats:
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.blocks = 0
+        self.max_queued = 0
+        self.overflows = 0
+        self.total_lag = 0
+        self.max_lag = 0
+        self.busy_time = 0
+
+
+class AIDispatcher:
+    '''
+    Passes blocks of acquired data to worker threads for processing
+
+    Parameters
+    ----------
+    dispatch : callable
+        Called by the worker threads with the block of data and a list of
+        channel names. Should pass the data for those channels to the
+        callbacks that were registered for them.
+    channel_names : list
+        Names of channels to assign to workers. Channels are assigned in
+        round-robin fashion. Callbacks registered for all channels (i.e., with
+        a channel name of None) are processed by the first worker.
+    n_workers : int
+        Number of worker threads. This is reduced if there are not enough
+        channels to assign at least one to each worker.
+    queue_size : int
+        Maximum number of blocks that can wait in the queue of each worker.
+    overflow : {'drop', 'block'}
+        What to do when the queue of a worker is full. If 'drop', the block
+        is discarded for that worker. If 'block', `put` waits until space is
+        available (this stalls the thread that reads from the hardware, which
+        may cause the hardware buffer to overflow). In both cases, the
+        overflow is counted (see `get_metrics`).
+    name : str
+        Used to name the worker threads.
+    '''
+
+    def __init__(self, dispatch, channel_names, n_workers=1, queue_size=100,
+                 overflow='drop', name='ai'):
+        if overflow not in ('drop', 'block'):
+            raise ValueError('Unsupported overflow policy {}'.format(overflow))
+        groups = [None] + list(channel_names)
+        n_workers = max(1, min(n_workers, len(groups)))
+        self.dispatch = dispatch
+        self.channel_names = [groups[i::n_workers] for i in range(n_workers)]
+        self.queues = [Queue(queue_size) for i in range(n_workers)]
+        self.stats = [WorkerStats() for i in range(n_workers)]
+        self.overflow = overflow
+        self.name = name
+        self._threads = []
+
+    def start(self):
+        if self._threads:
+            raise SystemError('Dispatcher already started')
+        for stats in self.stats:
+            stats.reset()
+        for i, (queue, names, stats) in \
+                enumerate(zip(self.queues, self.channel_names, self.stats)):
+            name = '{}_ai_worker_{}'.format(self.name, i)
+            thread = threading.Thread(target=self._run, name=name,
+                                      args=(queue, names, stats), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def put(self, data):
+        '''
+        Queue block of data for processing
+
+        The block must not be modified after it is queued.
+        '''
+        t = time.perf_counter()
+        for queue, stats in zip(self.queues, self.stats):
+            try:
+                queue.put_nowait((data, t))
+            except Full:
+                if stats.overflows == 0:
+                    log.warning('Queue for %s is full. Processing of acquired '
+                                'data is falling behind (overflow policy is '
+                                '%s).', self.name, self.overflow)
+                stats.overflows += 1
+                if self.overflow == 'block':
+                    queue.put((data, t))
+            stats.max_queued = max(stats.max_queued, queue.qsize())
+
+    def join(self):
+        '''
+        Wait until all queued blocks have been processed
+        '''
+        if threading.current_thread() in self._threads:
+            return
+        for queue in self.queues:
+            queue.join()
+
+    def stop(self):
+        '''
+        Process remaining blocks and stop worker threads
+        '''
+        for queue in self.queues:
+            queue.put(None)
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join()
+        self._threads = []
+
+    def _run(self, queue, channel_names, stats):
+        while True:
+            item = queue.get()
+            try:
+                if item is None:
+                    break
+                data, t = item
+                start = time.perf_counter()
+                lag = start - t
+                stats.total_lag += lag
+                stats.max_lag = max(stats.max_lag, lag)
+                try:
+                    self.dispatch(data, channel_names)
+                except Exception as e:
+                    log.exception(e)
+                stats.busy_time += time.perf_counter() - start
+                stats.blocks += 1
+            finally:
+                queue.task_done()
+
+    def get_metrics(self):
+        '''
+        Return metrics for each worker
+
+        Returns
+        -------
+        metrics : list of dict
+            Lag is the time (in seconds) from when a block was queued until the
+            worker started processing it.
+        '''
+        metrics = []
+        for queue, names, stats in \
+                zip(self.queues, self.channel_names, self.stats):
+            metrics.append({
+                'channels': names,
+                'blocks': stats.blocks,
+                'queued': queue.qsize(),
+                'max_queued': stats.max_queued,
+                'overflows': stats.overflows,
+                'mean_lag': stats.total_lag/stats.blocks if stats.blocks else 0,
+                'max_lag': stats.max_lag,
+                'busy_time': stats.busy_time,
+            })
+        return metrics
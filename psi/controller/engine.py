@@ -5,14 +5,18 @@ import threading
 
 import numpy as np
 
-from atom.api import (Unicode, Float, Bool, observe, Property, Int, Typed,
-                      Long, Value)
+from atom.api import (Unicode, Float, Bool, Enum, observe, Property, Int,
+                      Typed, Long, Value)
 from enaml.core.api import Declarative, d_
 
 from psi.core.enaml.api import PSIContribution
 from ..util import copy_declarative
 from .channel import (Channel, AnalogMixin, DigitalMixin, HardwareMixin,
                       SoftwareMixin, OutputMixin, InputMixin, CounterMixin)
+from .dispatch import AIDispatcher
+from .input import InputData
+from .profiler import InputProfiler
+from .read_buffer import AIReadBuffer
 
 
 def log_configuration(engine):
@@ -59,11 +63,42 @@ class Engine(PSIContribution):
         analog outputs are notified (i.e., to generate additional samples for
         playout).  If the poll period is too long, then the analog output may
         run out of samples. This poll period is a suggestion, not a contract.
+    hw_ai_workers : int
+        Number of worker threads used to pass data acquired from the
+        hardware-timed analog inputs to the inputs. If 0, data is passed to
+        the inputs by the thread that reads the data from the hardware, so
+        the next read cannot begin until all inputs have processed the data.
+    hw_ai_queue_size : int
+        Maximum number of blocks (one per read) that can wait for each worker.
+    hw_ai_queue_overflow : {'drop', 'block'}
+        What to do when a worker falls behind and its queue is full. By
+        default, the block is dropped for that worker so that reading from
+        the hardware is never stalled. If 'block', the engine waits for the
+        worker, which may cause the hardware buffer to overflow.
+    hw_ai_reuse_buffers : bool
+        If True, data read from the hardware-timed analog inputs is written to
+        preallocated buffers that are reused (see `psi.controller.read_buffer`).
+        Callbacks receive views that are only valid for the duration of the
+        call. Callbacks that keep a reference to the data (e.g., to process it
+        in another thread) must be registered with `copy=True` (inputs do so
+        when `Input.copy_data` is set anywhere in the graph). Ignored if
+        `hw_ai_workers` is greater than 0 since queued blocks cannot be reused.
 
     Attributes
     ----------
     configured : bool
         True if the hardware has been configured.
+    input_profiler : InputProfiler
+        If set before the engine is configured, the callbacks of all inputs
+        acquiring data from this engine are instrumented (see
+        `psi.controller.profiler`).
+    ai_dispatcher : AIDispatcher
+        Passes acquired data to the worker threads if `hw_ai_workers` is
+        greater than 0 (see `psi.controller.dispatch`).
+    ai_read_buffer : AIReadBuffer
+        Buffers used to read data from the hardware-timed analog inputs if
+        `hw_ai_reuse_buffers` is True. Use `ai_read_buffer.get_stats()` to
+        verify that acquisition does not allocate memory.
 
     Notes
     -----
@@ -80,10 +115,24 @@ class Engine(PSIContribution):
 
     configured = Bool(False)
 
+    input_profiler = Typed(InputProfiler)
+
     hw_ai_monitor_period = d_(Float(0.1)).tag(metadata=True)
 
     hw_ao_monitor_period = d_(Float(1)).tag(metadata=True)
 
+    hw_ai_workers = d_(Int(0)).tag(metadata=True)
+
+    hw_ai_queue_size = d_(Int(100)).tag(metadata=True)
+
+    hw_ai_queue_overflow = d_(Enum('drop', 'block')).tag(metadata=True)
+
+    hw_ai_reuse_buffers = d_(Bool(False)).tag(metadata=True)
+
+    ai_dispatcher = Typed(AIDispatcher)
+
+    ai_read_buffer = Typed(AIReadBuffer)
+
     def _default_lock(self):
         return threading.Lock()
 
@@ -154,9 +203,110 @@ class Engine(PSIContribution):
         for channel in self.get_channels():
             log.debug('Configuring channel {}'.format(channel.name))
             channel.configure()
+        if self.hw_ai_workers > 0:
+            channels = self.get_channels('analog', 'input', 'hardware',
+                                         active=False)
+            self.ai_dispatcher = AIDispatcher(self._dispatch_hw_ai,
+                                              [c.name for c in channels],
+                                              self.hw_ai_workers,
+                                              self.hw_ai_queue_size,
+                                              self.hw_ai_queue_overflow,
+                                              self.name)
+        else:
+            self.ai_dispatcher = None
         self.configured = True
 
-    def register_ai_callback(self, callback, channel_name=None):
+    def _get_hw_ai_sf(self):
+        '''
+        Return factor to divide data read from the hardware-timed analog
+        inputs by before it is passed to the callbacks
+
+        Can be a scalar or an array with one value per channel (shape
+        channel x 1). Return None if the data does not need to be scaled.
+        '''
+        return None
+
+    def _hw_ai_callback(self, samples):
+        '''
+        Scale data read from the hardware-timed analog inputs and pass it on
+
+        Engines call this with each block of data they read. The data is
+        passed to the worker threads if `hw_ai_workers` is greater than 0 and
+        to the callbacks otherwise.
+
+        Parameters
+        ----------
+        samples : 2D array
+            Data read (format channel x time). Scaled in place.
+        '''
+        sf = self._get_hw_ai_sf()
+        if sf is not None:
+            samples /= sf
+        samples = InputData(samples)
+        if self.ai_dispatcher is not None:
+            self.ai_dispatcher.put(samples)
+        else:
+            self._dispatch_hw_ai(samples)
+
+    def _dispatch_hw_ai(self, samples, channel_names=None):
+        '''
+        Pass data acquired from the hardware-timed analog inputs to callbacks
+
+        Parameters
+        ----------
+        samples : 2D array
+            Data to pass (format channel x time).
+        channel_names : {None, list}
+            If provided, only callbacks registered for these channels are
+            called (a channel name of None refers to callbacks registered for
+            all channels).
+        '''
+        # Callbacks receive views of the data. Copies are only needed if the
+        # data is in a buffer that will be reused.
+        buffer = self.ai_read_buffer
+        copy = self._callbacks.get('ai_copy', ()) if buffer is not None else ()
+        for channel_name, s, cb in self._callbacks.get('ai', [])[:]:
+            if channel_names is not None and channel_name not in channel_names:
+                continue
+            try:
+                data = samples[s]
+                if cb in copy:
+                    data = buffer.copy(data)
+                cb(data)
+            except Exception as e:
+                log.exception(e)
+                self.unregister_ai_callback(cb, channel_name)
+
+    def create_ai_read_buffer(self, n_channels, samples):
+        '''
+        Create buffers for reading hardware-timed analog input data
+
+        Returns None if `hw_ai_reuse_buffers` is False (or cannot be honored),
+        in which case a new array should be allocated for each read.
+        '''
+        if not self.hw_ai_reuse_buffers:
+            return None
+        if self.hw_ai_workers > 0:
+            log.warning('Engine %s cannot reuse analog input buffers when '
+                        'hw_ai_workers is set', self.name)
+            return None
+        return AIReadBuffer(n_channels, samples)
+
+    def register_ai_callback(self, callback, channel_name=None, copy=False):
+        '''
+        Register callback for data acquired from hardware-timed analog input
+
+        Parameters
+        ----------
+        callback : callable
+            Called with each block of data acquired.
+        channel_name : {None, str}
+            Channel to acquire data from. If None, callback receives data from
+            all channels.
+        copy : bool
+            If True and `hw_ai_reuse_buffers` is set, the callback receives a
+            copy of the data rather than a view into a buffer that is reused.
+        '''
         raise NotImplementedError
 
     def register_et_callback(self, callback, channel_name=None):
@@ -178,7 +178,8 @@ def read_digital_lines(task, size=1):
     return data.T
 
 
-def read_hw_ai(task, available_samples=None, channels=1, block_size=1):
+def read_hw_ai(task, available_samples=None, channels=1, block_size=1,
+               buffer=None):
     if available_samples is None:
         uint32 = ctypes.c_uint32()
         mx.DAQmxGetReadAvailSampPerChan(task, uint32)
@@ -188,7 +189,10 @@ def read_hw_ai(task, available_samples=None, channels=1, block_size=1):
     if blocks == 0:
         return
     samples = blocks*block_size
-    data = np.empty((channels, samples), dtype=np.double)
+    if buffer is None:
+        data = np.empty((channels, samples), dtype=np.double)
+    else:
+        data = buffer.get(samples)
     int32 = ctypes.c_int32()
     mx.DAQmxReadAnalogF64(task, samples, 0, mx.DAQmx_Val_GroupByChannel, data,
                           data.size, int32, None)
@@ -237,7 +241,7 @@ def hw_ao_helper(cb, task, event_type, cb_samples, cb_data):
 
 
 def hw_ai_helper(cb, channels, discard, task, event_type=None, cb_samples=None,
-                 cb_data=None):
+                 cb_data=None, buffer=None):
     uint32 = ctypes.c_uint32()
     mx.DAQmxGetReadAvailSampPerChan(task, uint32)
     available_samples = uint32.value
@@ -253,7 +257,7 @@ def hw_ai_helper(cb, channels, discard, task, event_type=None, cb_samples=None,
 
     if read_position < discard:
         samples = min(discard-read_position, available_samples)
-        read_hw_ai(task, samples, channels)
+        read_hw_ai(task, samples, channels, buffer=buffer)
         available_samples -= samples
         log_ai.debug('Discarded %d samples from beginning, %d available',
                      samples, available_samples)
@@ -261,7 +265,7 @@ def hw_ai_helper(cb, channels, discard, task, event_type=None, cb_samples=None,
     if available_samples == 0:
         return 0
 
-    data = read_hw_ai(task, available_samples, channels, cb_samples)
+    data = read_hw_ai(task, available_samples, channels, cb_samples, buffer)
     if data is not None:
         data = InputData(data)
         cb(data)
@@ -502,7 +506,8 @@ def get_timing_config(task):
     return properties
 
 
-def setup_hw_ai(channels, callback_duration, callback, task_name='hw_ao'):
+def setup_hw_ai(channels, callback_duration, callback, task_name='hw_ao',
+                buffer_factory=None):
     log.debug('Configuring HW AI channels')
 
     # These properties can vary on a per-channel basis
@@ -565,7 +570,15 @@ def setup_hw_ai(channels, callback_duration, callback, task_name='hw_ao'):
         # Not a supported property. Set filter delay to 0 by default.
         filter_delay = 0
 
-    task._cb = partial(hw_ai_helper, callback, n_channels, filter_delay)
+    # If provided, data is read into reusable buffers rather than a new array
+    # for each read.
+    if buffer_factory is not None:
+        task._read_buffer = buffer_factory(n_channels, callback_samples)
+    else:
+        task._read_buffer = None
+
+    task._cb = partial(hw_ai_helper, callback, n_channels, filter_delay,
+                       buffer=task._read_buffer)
     task._cb_ptr = mx.DAQmxEveryNSamplesEventCallbackPtr(task._cb)
     mx.DAQmxRegisterEveryNSamplesEvent(
         task, mx.DAQmx_Val_Acquired_Into_Buffer, int(callback_samples), 0,
@@ -710,6 +723,7 @@ class NIDAQEngine(Engine):
 
     _tasks = Typed(dict)
     _task_done = Typed(dict)
+    _ao_staging = Typed(np.ndarray)
     _callbacks = Typed(dict)
     _timers = Typed(dict)
     _uint32 = Typed(ctypes.c_uint32)
@@ -865,6 +879,9 @@ class NIDAQEngine(Engine):
         # Software-timed tasks must be explicitly canceled by the user.
         done = [v for t, v in self._task_done.items() if t.startswith('hw')]
         if all(done):
+            # Ensure all acquired data has been processed.
+            if self.ai_dispatcher is not None:
+                self.ai_dispatcher.join()
             for cb in self._callbacks.get('done', []):
                 cb()
 
@@ -900,9 +917,11 @@ class NIDAQEngine(Engine):
     def configure_hw_ai(self, channels):
         task_name = '{}_hw_ai'.format(self.name)
         task = setup_hw_ai(channels, self.hw_ai_monitor_period,
-                           self._hw_ai_callback, task_name)
+                           self._hw_ai_callback, task_name,
+                           self.create_ai_read_buffer)
         self._tasks['hw_ai'] = task
         self.ai_fs = task._fs
+        self.ai_read_buffer = task._read_buffer
 
     def configure_sw_ao(self, lines, expected_range, names=None,
                         initial_state=None):
@@ -1003,9 +1022,11 @@ class NIDAQEngine(Engine):
         s = self._get_channel_slice('hw_ao', channel_name)
         self._callbacks.setdefault('ao', []).append((channel_name, s, callback))
 
-    def register_ai_callback(self, callback, channel_name=None):
+    def register_ai_callback(self, callback, channel_name=None, copy=False):
         s = self._get_channel_slice('hw_ai', channel_name)
         self._callbacks.setdefault('ai', []).append((channel_name, s, callback))
+        if copy:
+            self._callbacks.setdefault('ai_copy', set()).add(callback)
 
     def register_di_callback(self, callback, channel_name=None):
         s = self._get_channel_slice('hw_di', channel_name)
@@ -1032,6 +1053,7 @@ class NIDAQEngine(Engine):
         try:
             s = self._get_channel_slice('hw_ai', channel_name)
             self._callbacks['ai'].remove((channel_name, s, callback))
+            self._callbacks.get('ai_copy', set()).discard(callback)
         except (KeyError, AttributeError):
             log.warning('Callback no longer exists.')
 
@@ -1087,22 +1109,22 @@ class NIDAQEngine(Engine):
             if i == line_index:
                 cb(change, event_time)
 
-    def _hw_ai_callback(self, samples):
-        samples /= self._tasks['hw_ai']._sf
-        for channel_name, s, cb in self._callbacks.get('ai', []):
-            try:
-                cb(samples[s])
-            except Exception as e:
-                log.exception(e)
-                self.unregister_ai_callback(cb, channel_name)
+    def _get_hw_ai_sf(self):
+        return self._tasks['hw_ai']._sf
 
     def _hw_di_callback(self, samples):
         for i, cb in self._callbacks.get('di', []):
             cb(samples[i])
 
     def _get_hw_ao_samples(self, offset, samples):
+        # The channels render directly into a staging buffer that is reused
+        # for each update. The returned array is only valid until the next
+        # call.
         channels = self.get_channels('analog', 'output', 'hardware')
-        data = np.empty((len(channels), samples), dtype=np.double)
+        size = len(channels)*samples
+        if self._ao_staging is None or self._ao_staging.size < size:
+            self._ao_staging = np.empty(size, dtype=np.double)
+        data = self._ao_staging[:size].reshape((len(channels), samples))
         for channel, ch_data in zip(channels, data):
             channel.get_samples(offset, samples, out=ch_data)
         return data
@@ -1199,9 +1221,12 @@ class NIDAQEngine(Engine):
             log.debug('%d samples generated at offset %d', generated, offset)
             #raise SystemError('Insufficient time to update output')
 
+        # Only copies the data if it is not already a contiguous float64
+        # array (e.g., the staging buffer filled by `_get_hw_ao_samples`).
+        data = np.ascontiguousarray(data, dtype=np.float64)
         mx.DAQmxWriteAnalogF64(task, data.shape[-1], False, timeout,
-                               mx.DAQmx_Val_GroupByChannel,
-                               data.astype(np.float64), self._int32, None)
+                               mx.DAQmx_Val_GroupByChannel, data, self._int32,
+                               None)
 
         # Now, reset it back to 0
         if offset is not None:
@@ -1228,6 +1253,9 @@ class NIDAQEngine(Engine):
             samples = self.get_space_available()
             self.hw_ao_callback(samples)
 
+        if self.ai_dispatcher is not None:
+            self.ai_dispatcher.start()
+
         log.debug('Starting NIDAQmx tasks')
         for task in self._tasks.values():
             log.debug('Starting task {}'.format(task._name))
@@ -1243,6 +1271,8 @@ class NIDAQEngine(Engine):
         log.debug('Stopping engine')
         for task in self._tasks.values():
             mx.DAQmxClearTask(task)
+        if self.ai_dispatcher is not None:
+            self.ai_dispatcher.stop()
         self._callbacks = {}
         self._configured = False
 
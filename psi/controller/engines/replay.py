@@ -0,0 +1,409 @@
+'''
+Defines an engine that replays a saved recording
+
+The replay engine reads continuous signals saved by `BColzStore` and passes
+them to the analog input callbacks in blocks of `hw_ai_monitor_period`, exactly
+as a hardware engine would. This allows a recording to be reprocessed by the
+same input graph (e.g., `IIRFilter` -> `ExtractEpochs` -> `RejectEpochs`) that
+the experiment used to acquire it.
+
+Epoch-based inputs need to know when each stimulus started. During an
+experiment, the output queue provides this information as each trial is
+uploaded. During replay, the information is read from tables saved with the
+recording (e.g., the `erp_metadata` table saved for the `erp` epoch input or
+the event log) and passed to the callbacks registered via
+`ReplayEngine.register_event_callback` just before the engine passes along the
+block of data containing the start of the epoch. For example::
+
+    ReplayEngine: engine:
+        name = 'replay'
+        base_path = '/path/to/recording'
+        initialized ::
+            self.register_event_callback(extract.queue.append, 'erp_metadata')
+
+        ReplayHardwareAIChannel:
+            name = 'eeg'
+
+The recording can be replayed in real time, at a multiple of real time or as
+fast as possible (see `ReplayEngine.speed`). When replaying as fast as
+possible, the metrics returned by `ReplayEngine.get_metrics` provide a
+benchmark of the throughput of the input graph.
+'''
+
+import logging
+log = logging.getLogger(__name__)
+
+from collections import deque
+import threading
+import time
+
+import numpy as np
+from atom.api import Bool, Float, Int, List, Typed, Unicode, Value
+from enaml.core.api import d_
+
+from psi.data.io import Recording
+from ..engine import Engine
+from ..channel import HardwareAIChannel
+
+
+################################################################################
+# Engine-specific channels
+################################################################################
+class ReplayHardwareAIChannel(HardwareAIChannel):
+
+    #: Name of the signal in the recording to replay. If blank, the name of the
+    #: channel is used.
+    signal_name = d_(Unicode()).tag(metadata=True)
+
+    def _default_signal_name(self):
+        return self.name
+
+
+################################################################################
+# PSI utility
+################################################################################
+def load_events(table):
+    '''
+    Convert table saved with recording to a list of events sorted by time
+
+    The time of each event is read from the `t0` column (epoch metadata) or,
+    if missing, the `timestamp` column (event log). The remaining columns are
+    stored as the metadata of the event. Each event has the same format as the
+    information provided by the output queue as each trial is uploaded.
+    '''
+    if 't0' in table:
+        t0 = table['t0']
+    elif 'timestamp' in table:
+        t0 = table['timestamp']
+    else:
+        raise ValueError('Table must have a t0 or timestamp column')
+
+    duration = table['duration'] if 'duration' in table else None
+    md = table.drop(columns=['t0', 'timestamp', 'duration'], errors='ignore')
+    events = []
+    for i, row in enumerate(md.to_dict('records')):
+        events.append({
+            't0': float(t0.iat[i]),
+            'duration': 0 if duration is None else float(duration.iat[i]),
+            'key': i,
+            'metadata': row,
+        })
+    events.sort(key=lambda e: e['t0'])
+    return deque(events)
+
+
+################################################################################
+# Engine
+################################################################################
+class ReplayEngine(Engine):
+    '''
+    Replays continuous signals saved with a recording
+
+    All analog input channels must have the same sampling rate. If the
+    sampling rate of a channel is not specified, it is set to the sampling rate
+    of the signal it replays. The engine stops (and calls the done callbacks)
+    once the shortest signal has been replayed.
+    '''
+    engine_name = 'replay'
+
+    #: Folder containing the recording.
+    base_path = d_(Unicode()).tag(metadata=True)
+
+    #: Speed of the replay relative to the wall clock. A value of 1 replays in
+    #: real time, a value of 10 replays ten times faster than real time. If 0,
+    #: the data is replayed as fast as possible.
+    speed = d_(Float(0)).tag(metadata=True)
+
+    #: Amount of data (in seconds) read from the recording at a time. The data
+    #: is then passed to the callbacks in blocks of `hw_ai_monitor_period`.
+    #: Reading larger blocks ensures that compressed chunks on disk are only
+    #: decompressed once.
+    read_duration = d_(Float(10)).tag(metadata=True)
+
+    #: Recording to replay. Defaults to the recording at `base_path`.
+    recording = d_(Value())
+
+    ai_fs = Typed(float).tag(metadata=True)
+
+    _configured = Bool(False)
+    _signals = List()
+    _names = List()
+    _samples = Int()
+    _samples_done = Int()
+    _callbacks = Typed(dict)
+    _event_callbacks = Typed(dict)
+    _events = Typed(dict)
+    _thread = Typed(threading.Thread)
+    _stop_requested = Typed(threading.Event)
+    _metrics = Typed(dict)
+
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        self._callbacks = {}
+        self._event_callbacks = {}
+        self._events = {}
+        self._metrics = {}
+
+    def _default_recording(self):
+        return Recording(self.base_path)
+
+    def configure(self, active=True):
+        log.debug('Configuring {} engine'.format(self.name))
+        channels = self.get_channels('analog', 'input', 'hardware',
+                                     active=active)
+        if channels:
+            self.configure_hw_ai(channels)
+        super().configure()
+        self._configured = True
+        log.debug('Completed engine configuration')
+
+    def configure_hw_ai(self, channels):
+        signals = [getattr(self.recording, c.signal_name) for c in channels]
+        fs = set(s.fs for s in signals)
+        if len(fs) != 1:
+            m = 'ReplayEngine requires all signals to have the same ' \
+                'sampling rate. Found {}.'
+            raise ValueError(m.format(fs))
+        fs = float(fs.pop())
+        for channel in channels:
+            if not channel.fs:
+                channel.fs = fs
+            elif channel.fs != fs:
+                m = 'Sampling rate of {} ({}) does not match recording ({})'
+                raise ValueError(m.format(channel.name, channel.fs, fs))
+
+        self._signals = signals
+        self._names = [c.name for c in channels]
+        self._samples = min(s.shape[-1] for s in signals)
+        self.ai_fs = fs
+        samples = max(1, round(fs*self.hw_ai_monitor_period))
+        self.ai_read_buffer = self.create_ai_read_buffer(len(channels), samples)
+
+    def _get_channel_slice(self, channel_name):
+        if channel_name is None:
+            return Ellipsis
+        else:
+            return self._names.index(channel_name)
+
+    def register_done_callback(self, callback):
+        self._callbacks.setdefault('done', []).append(callback)
+
+    def register_ao_callback(self, callback, channel_name=None):
+        pass
+
+    def register_ai_callback(self, callback, channel_name=None, copy=False):
+        s = self._get_channel_slice(channel_name)
+        self._callbacks.setdefault('ai', []).append((channel_name, s, callback))
+        if copy:
+            self._callbacks.setdefault('ai_copy', set()).add(callback)
+
+    def register_et_callback(self, callback, channel_name=None):
+        pass
+
+    def register_event_callback(self, callback, table_name):
+        '''
+        Pass events saved in table to callback as they are replayed
+
+        Parameters
+        ----------
+        callback : callable
+            Called with a dictionary for each event (see `load_events` for
+            the format).
+        table_name : str
+            Name of the table in the recording. Must contain a `t0` or
+            `timestamp` column.
+        '''
+        self._event_callbacks.setdefault(table_name, []).append(callback)
+
+    def unregister_done_callback(self, callback):
+        try:
+            self._callbacks['done'].remove(callback)
+        except (KeyError, ValueError):
+            log.warning('Callback no longer exists.')
+
+    def unregister_ao_callback(self, callback, channel_name):
+        pass
+
+    def unregister_ai_callback(self, callback, channel_name):
+        try:
+            s = self._get_channel_slice(channel_name)
+            self._callbacks['ai'].remove((channel_name, s, callback))
+            self._callbacks.get('ai_copy', set()).discard(callback)
+        except (KeyError, ValueError):
+            log.warning('Callback no longer exists.')
+
+    def unregister_et_callback(self, callback, channel_name):
+        pass
+
+    def unregister_event_callback(self, callback, table_name):
+        try:
+            self._event_callbacks[table_name].remove(callback)
+        except (KeyError, ValueError):
+            log.warning('Callback no longer exists.')
+
+    def _notify_events(self, t):
+        # Pass along all events that start before time `t`.
+        for table_name, events in self._events.items():
+            while events and events[0]['t0'] < t:
+                event = events.popleft()
+                for cb in self._event_callbacks.get(table_name, [])[:]:
+                    cb(event.copy())
+
+    def get_ts(self):
+        with self.lock:
+            return self.ai_sample_time()
+
+    def ai_sample_clock(self):
+        return self._samples_done
+
+    def ai_sample_time(self):
+        return self._samples_done/self.ai_fs if self.ai_fs else 0
+
+    def get_buffer_size(self, channel_name):
+        return self.read_duration
+
+    def start(self):
+        if not self._configured:
+            log.debug('Tasks were not configured yet')
+            self.configure()
+
+        self._metrics = {
+            'ai_callback_time': 0,
+            'max_callback_time': 0,
+            'read_time': 0,
+            'ticks': 0,
+        }
+        self._samples_done = 0
+        self._events = {}
+        for table_name in self._event_callbacks:
+            table = getattr(self.recording, table_name)
+            self._events[table_name] = load_events(table)
+
+        if self.ai_dispatcher is not None:
+            self.ai_dispatcher.start()
+
+        self._stop_requested = threading.Event()
+        self._thread = threading.Thread(target=self._run,
+                                        name='{}_clock'.format(self.name),
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self._configured:
+            return
+        log.debug('Stopping engine')
+        if self._stop_requested is not None:
+            self._stop_requested.set()
+        if self._thread is not None \
+                and self._thread is not threading.current_thread():
+            self._thread.join()
+        if self.ai_dispatcher is not None:
+            self.ai_dispatcher.stop()
+        self._callbacks = {}
+        self._configured = False
+
+    def join(self, timeout=None):
+        '''
+        Wait for the replay to finish
+
+        Returns
+        -------
+        done : bool
+            False if the timeout elapsed before the replay finished.
+        '''
+        if self._thread is None:
+            return True
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def get_metrics(self):
+        '''
+        Return throughput metrics for the replay
+
+        The real-time factor is the ratio of replayed time to wall time. A value
+        greater than 1 when replaying as fast as possible indicates that the
+        input graph can keep up with real-time acquisition.
+        '''
+        metrics = self._metrics.copy()
+        wall_time = metrics.pop('wall_time', 0)
+        replayed_time = self.ai_sample_time()
+        metrics['wall_time'] = wall_time
+        metrics['replayed_time'] = replayed_time
+        metrics['realtime_factor'] = \
+            replayed_time/wall_time if wall_time else 0
+        metrics['hw_ai_samples'] = self._samples_done
+        if self.ai_dispatcher is not None:
+            metrics['ai_workers'] = self.ai_dispatcher.get_metrics()
+        if self.ai_read_buffer is not None:
+            metrics['ai_read_buffer'] = self.ai_read_buffer.get_stats()
+        return metrics
+
+    def _read(self, lb, ub):
+        t0 = time.perf_counter()
+        data = np.empty((len(self._signals), ub-lb))
+        for signal, ch_data in zip(self._signals, data):
+            ch_data[:] = signal[lb:ub]
+        self._metrics['read_time'] += time.perf_counter()-t0
+        return data
+
+    def _run(self):
+        fs = self.ai_fs
+        block_samples = max(1, round(fs*self.hw_ai_monitor_period))
+        read_samples = max(block_samples, round(fs*self.read_duration))
+        wall_start = time.perf_counter()
+        data, data_lb = None, 0
+        tick = 0
+
+        while self._samples_done < self._samples:
+            lb = self._samples_done
+            ub = min(lb + block_samples, self._samples)
+            if self.speed > 0:
+                delay = wall_start + ub/fs/self.speed - time.perf_counter()
+                if delay > 0 and self._stop_requested.wait(delay):
+                    break
+            elif self._stop_requested.is_set():
+                break
+
+            if data is None or ub > (data_lb + data.shape[-1]):
+                data_lb = lb
+                data = self._read(lb, min(lb + read_samples, self._samples))
+
+            try:
+                t0 = time.perf_counter()
+                self._notify_events(ub/fs)
+                # The block is copied (to a reused buffer if available) since
+                # the callbacks may hold on to the data.
+                block = data[:, lb-data_lb:ub-data_lb]
+                if self.ai_read_buffer is None:
+                    block = block.copy()
+                else:
+                    block = self._copy_to_buffer(block)
+                self._hw_ai_callback(block)
+                self._update_callback_time('ai_callback_time', t0)
+            except Exception as e:
+                log.exception(e)
+                break
+
+            with self.lock:
+                self._samples_done = ub
+            tick += 1
+            self._metrics['ticks'] = tick
+            self._metrics['wall_time'] = time.perf_counter()-wall_start
+        else:
+            log.debug('Replay complete')
+            if self.ai_dispatcher is not None:
+                self.ai_dispatcher.join()
+            self._metrics['wall_time'] = time.perf_counter()-wall_start
+            for cb in self._callbacks.get('done', []):
+                cb()
+
+    def _copy_to_buffer(self, block):
+        out = self.ai_read_buffer.get(block.shape[-1])
+        out[:] = block
+        return out
+
+    def _update_callback_time(self, name, t0):
+        elapsed = time.perf_counter()-t0
+        self._metrics[name] += elapsed
+        if elapsed > self._metrics['max_callback_time']:
+            self._metrics['max_callback_time'] = elapsed
@@ -0,0 +1,659 @@
+'''
+Defines a simulated hardware engine
+
+The simulated engine emulates the clocking and buffering behavior of a
+hardware-timed acquisition system (modeled after the NIDAQmx engine) without
+requiring any hardware. A background thread advances a simulated sample clock
+and, on each tick, consumes samples from the analog output buffer, notifies the
+analog output callbacks when space becomes available and generates analog
+input data. Analog input channels can be configured to acquire a delayed,
+scaled and noisy copy of an analog output channel (i.e., a loopback), making it
+possible to run a full experiment paradigm headless (e.g., for end-to-end
+throughput benchmarks).
+
+The clock can run in real time, at a multiple of real time or as fast as
+possible (see `SimulatedEngine.speed`).
+'''
+
+import logging
+log = logging.getLogger(__name__)
+log_ai = logging.getLogger(__name__ + '.ai')
+log_ao = logging.getLogger(__name__ + '.ao')
+
+import threading
+import time
+
+import numpy as np
+from atom.api import (Atom, Bool, Callable, Float, Int, List, Typed, Unicode,
+                      Value)
+from enaml.core.api import Declarative, d_
+
+from psi.util import SignalBuffer
+from ..calibration.util import dbi
+from ..engine import Engine
+from ..channel import (HardwareAIChannel, HardwareAOChannel,
+                       SoftwareDOChannel)
+
+
+################################################################################
+# Engine-specific channels
+################################################################################
+class SimulatedTimingMixin(Declarative):
+
+    #: Specifies the start trigger for the channel. If blank, sampling begins
+    #: when the engine is started. Otherwise, sampling begins with the first
+    #: sample of the analog output (i.e., the equivalent of setting the start
+    #: trigger to `ao/StartTrigger` for the NIDAQmx engine).
+    start_trigger = d_(Unicode()).tag(metadata=True)
+
+
+class SimulatedHardwareAOChannel(SimulatedTimingMixin, HardwareAOChannel):
+    pass
+
+
+class SimulatedHardwareAIChannel(SimulatedTimingMixin, HardwareAIChannel):
+
+    #: Name of the analog output channel that is looped back to this channel.
+    #: If blank, the channel only acquires noise.
+    loopback = d_(Unicode()).tag(metadata=True)
+
+    #: Linear gain applied to the looped-back signal.
+    loopback_gain = d_(Float(1)).tag(metadata=True)
+
+    #: Delay (in sec) between the analog output and the analog input (e.g., to
+    #: simulate acoustic delay).
+    latency = d_(Float(0)).tag(metadata=True)
+
+    #: RMS amplitude (in V) of the Gaussian noise added to the signal.
+    noise_level = d_(Float(0)).tag(metadata=True)
+
+
+class SimulatedSoftwareDOChannel(SoftwareDOChannel):
+    pass
+
+
+################################################################################
+# PSI utility
+################################################################################
+def get_channel_property(channels, property, allow_unique=False):
+    values = [getattr(c, property, '') for c in channels]
+    if allow_unique:
+        return values
+    elif len(set(values)) != 1:
+        m = 'SimulatedEngine does not support per-channel {} as specified: {}' \
+            .format(property, values)
+        raise ValueError(m)
+    else:
+        return values[0]
+
+
+class SimulatedTask(Atom):
+    '''
+    Tracks the state of a simulated hardware-timed task
+    '''
+    #: Names of the channels in the task
+    names = List()
+
+    #: Sampling rate of the task
+    fs = Float()
+
+    #: Number of samples to acquire or generate before the task is complete.
+    #: If 0, the task runs until the engine is stopped.
+    samples = Int()
+
+    #: Time (in sec, re. engine start) of the first sample in the task
+    start_time = Float()
+
+    #: Number of samples acquired or generated so far
+    samples_done = Int()
+
+    #: Number of samples between each callback
+    callback_samples = Int()
+
+    #: Engine-specific task configuration
+    config = Value()
+
+    def get_target_samples(self, t):
+        # Number of samples the sample clock has reached at time `t` (re.
+        # engine start).
+        target = max(0, int(round((t-self.start_time)*self.fs)))
+        if self.samples:
+            target = min(target, self.samples)
+        return target
+
+    def is_complete(self):
+        return self.samples > 0 and self.samples_done >= self.samples
+
+
+################################################################################
+# Engine
+################################################################################
+class SimulatedEngine(Engine):
+    '''
+    Simulated hardware interface
+
+    The semantics of `get_offset`, `get_space_available`, `update_hw_ao` and
+    `write_hw_ao` match the NIDAQmx engine. Analog output data is written to a
+    buffer of `hw_ao_buffer_size` seconds and data that has already been
+    generated by the sample clock cannot be overwritten. If the analog output
+    buffer runs out of data, the output is padded with zeros and the number of
+    missing samples is reported by `get_metrics`.
+    '''
+    engine_name = 'simulated'
+
+    #: Size of the analog output buffer (in seconds).
+    hw_ao_buffer_size = d_(Float(10)).tag(metadata=True)
+
+    #: Speed of the simulated sample clock relative to the wall clock. A value
+    #: of 1 runs in real time, a value of 10 runs ten times faster than real
+    #: time. If 0, the clock runs as fast as possible.
+    speed = d_(Float(1)).tag(metadata=True)
+
+    #: Delay (in sec) between the start of channels that do not have a start
+    #: trigger and the start of the analog output. This simulates the delay
+    #: introduced by starting tasks sequentially.
+    start_skew = d_(Float(0)).tag(metadata=True)
+
+    #: Seed for the noise generator. If None, the generator is seeded randomly.
+    seed = d_(Value())
+
+    ao_fs = Typed(float).tag(metadata=True)
+    ai_fs = Typed(float).tag(metadata=True)
+
+    # This defines the function for the clock that synchronizes the tasks.
+    sample_time = Callable()
+
+    _configured = Bool(False)
+    _tasks = Typed(dict)
+    _callbacks = Typed(dict)
+    _sw_do_state = Typed(dict)
+    _ao_buffer = Typed(SignalBuffer)
+    _ao_staging = Typed(np.ndarray)
+    _random = Typed(np.random.RandomState)
+    _thread = Typed(threading.Thread)
+    _stop_requested = Typed(threading.Event)
+    _metrics = Typed(dict)
+
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        self._tasks = {}
+        self._callbacks = {}
+        self._sw_do_state = {}
+        self._metrics = {}
+
+    def configure(self, active=True):
+        log.debug('Configuring {} engine'.format(self.name))
+        sw_do_channels = self.get_channels('digital', 'output', 'software',
+                                           active=active)
+        hw_ai_channels = self.get_channels('analog', 'input', 'hardware',
+                                           active=active)
+        hw_ao_channels = self.get_channels('analog', 'output', 'hardware',
+                                           active=active)
+
+        self._tasks = {}
+        self._random = np.random.RandomState(self.seed)
+
+        if sw_do_channels:
+            self._sw_do_state = {c.name: 0 for c in sw_do_channels}
+
+        # The analog output must be configured before the analog input so that
+        # we can resolve the loopback channels.
+        if hw_ao_channels:
+            self.configure_hw_ao(hw_ao_channels)
+
+        if hw_ai_channels:
+            self.configure_hw_ai(hw_ai_channels)
+
+        if hw_ao_channels:
+            self.sample_time = self.ao_sample_time
+        elif hw_ai_channels:
+            self.sample_time = self.ai_sample_time
+
+        super().configure()
+        self._configured = True
+        log.debug('Completed engine configuration')
+
+    def configure_hw_ao(self, channels):
+        fs = get_channel_property(channels, 'fs')
+        task = SimulatedTask(
+            names=get_channel_property(channels, 'name', True),
+            fs=fs,
+            samples=get_channel_property(channels, 'samples'),
+            start_time=self.start_skew,
+            callback_samples=round(fs*self.hw_ao_monitor_period),
+            config={'buffer_samples': round(fs*self.hw_ao_buffer_size)},
+        )
+        self._tasks['hw_ao'] = task
+        self.ao_fs = fs
+
+    def configure_hw_ai(self, channels):
+        fs = get_channel_property(channels, 'fs')
+        triggered = bool(get_channel_property(channels, 'start_trigger'))
+        start_time = self.start_skew if triggered else 0
+        ao_task = self._tasks.get('hw_ao', None)
+
+        # Offset (in samples) of the first analog input sample re. the first
+        # analog output sample.
+        if ao_task is not None:
+            start_offset = round((ao_task.start_time-start_time)*fs)
+        else:
+            start_offset = 0
+
+        loopback = []
+        for channel in channels:
+            source = getattr(channel, 'loopback', '')
+            if not source:
+                loopback.append(None)
+                continue
+            if ao_task is None or source not in ao_task.names:
+                m = 'Loopback channel {} for {} is not an active analog output'
+                raise ValueError(m.format(source, channel.name))
+            if ao_task.fs != fs:
+                m = 'Loopback from {} to {} requires the same sampling rate'
+                raise ValueError(m.format(source, channel.name))
+            delay = start_offset + round(getattr(channel, 'latency', 0)*fs)
+            loopback.append((ao_task.names.index(source), delay))
+
+        sf = dbi(np.array(get_channel_property(channels, 'gain', True)))
+        config = {
+            'loopback': loopback,
+            'loopback_gain': [getattr(c, 'loopback_gain', 1) for c in channels],
+            'noise_level': [getattr(c, 'noise_level', 0) for c in channels],
+            'sf': sf[..., np.newaxis],
+        }
+        task = SimulatedTask(
+            names=get_channel_property(channels, 'name', True),
+            fs=fs,
+            samples=get_channel_property(channels, 'samples'),
+            start_time=start_time,
+            callback_samples=round(fs*self.hw_ai_monitor_period),
+            config=config,
+        )
+        self._tasks['hw_ai'] = task
+        self.ai_fs = fs
+        self.ai_read_buffer = self.create_ai_read_buffer(len(task.names),
+                                                         task.callback_samples)
+
+    def _get_channel_slice(self, task_name, channel_names):
+        if channel_names is None:
+            return Ellipsis
+        else:
+            return self._tasks[task_name].names.index(channel_names)
+
+    def register_done_callback(self, callback):
+        self._callbacks.setdefault('done', []).append(callback)
+
+    def register_ao_callback(self, callback, channel_name=None):
+        s = self._get_channel_slice('hw_ao', channel_name)
+        self._callbacks.setdefault('ao', []).append((channel_name, s, callback))
+
+    def register_ai_callback(self, callback, channel_name=None, copy=False):
+        s = self._get_channel_slice('hw_ai', channel_name)
+        self._callbacks.setdefault('ai', []).append((channel_name, s, callback))
+        if copy:
+            self._callbacks.setdefault('ai_copy', set()).add(callback)
+
+    def register_et_callback(self, callback, channel_name=None):
+        pass
+
+    def unregister_done_callback(self, callback):
+        try:
+            self._callbacks['done'].remove(callback)
+        except (KeyError, ValueError):
+            log.warning('Callback no longer exists.')
+
+    def unregister_ao_callback(self, callback, channel_name):
+        try:
+            s = self._get_channel_slice('hw_ao', channel_name)
+            self._callbacks['ao'].remove((channel_name, s, callback))
+        except (KeyError, ValueError):
+            log.warning('Callback no longer exists.')
+
+    def unregister_ai_callback(self, callback, channel_name):
+        try:
+            s = self._get_channel_slice('hw_ai', channel_name)
+            self._callbacks['ai'].remove((channel_name, s, callback))
+            self._callbacks.get('ai_copy', set()).discard(callback)
+        except (KeyError, ValueError):
+            log.warning('Callback no longer exists.')
+
+    def unregister_et_callback(self, callback, channel_name):
+        pass
+
+    def write_sw_do(self, state):
+        for name, s in zip(self._sw_do_state, state):
+            self._sw_do_state[name] = int(s)
+
+    def set_sw_do(self, name, state):
+        self._sw_do_state[name] = int(state)
+
+    def fire_sw_do(self, name, duration=0.1):
+        self.set_sw_do(name, 1)
+        timer = threading.Timer(duration, lambda: self.set_sw_do(name, 0))
+        timer.start()
+
+    def _get_hw_ai_sf(self):
+        return self._tasks['hw_ai'].config['sf']
+
+    def _get_hw_ao_samples(self, offset, samples):
+        # The channels render directly into a staging buffer that is reused
+        # for each update. The returned array is only valid until the next
+        # call.
+        channels = self.get_channels('analog', 'output', 'hardware')
+        size = len(channels)*samples
+        if self._ao_staging is None or self._ao_staging.size < size:
+            self._ao_staging = np.empty(size, dtype=np.double)
+        data = self._ao_staging[:size].reshape((len(channels), samples))
+        for channel, ch_data in zip(channels, data):
+            channel.get_samples(offset, samples, out=ch_data)
+        return data
+
+    def get_offset(self, channel_name=None):
+        return self._ao_buffer.get_samples_ub()
+
+    def get_space_available(self, offset=None, channel_name=None):
+        task = self._tasks['hw_ao']
+        write_position = self.get_offset()
+        buffered = write_position - task.samples_done
+        available = task.config['buffer_samples'] - buffered
+        if offset is not None:
+            available -= offset - write_position
+        return available
+
+    def hw_ao_callback(self, samples):
+        # Get the next set of samples to upload to the buffer
+        with self.lock:
+            offset = self.get_offset()
+            available_samples = self.get_space_available(offset)
+            if available_samples < samples:
+                log_ao.debug('Not enough samples available for writing')
+            else:
+                data = self._get_hw_ao_samples(offset, samples)
+                self.write_hw_ao(data, offset, timeout=0)
+
+    def update_hw_ao(self, offset, channel_name=None,
+                     method='space_available'):
+        # Ignore the channel name because we need to update all channels
+        # simultaneously.
+        if method == 'space_available':
+            samples = self.get_space_available(offset)
+        elif method == 'write_position':
+            samples = self.get_offset()-offset
+        else:
+            raise ValueError('Unsupported update method')
+
+        if samples <= 0:
+            return
+        log_ao.debug('Updating hw ao at %d with %d samples', offset, samples)
+        data = self._get_hw_ao_samples(offset, samples)
+        self.write_hw_ao(data, offset=offset, timeout=0)
+
+    def update_hw_ao_multiple(self, offsets, channel_names, method):
+        offset = min(offsets)
+        self.update_hw_ao(offset, None, method)
+
+    def write_hw_ao(self, data, offset, timeout=1):
+        task = self._tasks['hw_ao']
+        write_position = self.get_offset()
+        samples = data.shape[-1]
+        if offset < task.samples_done:
+            m = 'Cannot write at {} since {} samples were already generated'
+            raise SystemError(m.format(offset, task.samples_done))
+        if offset > write_position:
+            m = 'Cannot write at {} since write position is {}'
+            raise SystemError(m.format(offset, write_position))
+        end = offset + samples
+        if (end - task.samples_done) > task.config['buffer_samples']:
+            raise SystemError('Insufficient space in output buffer')
+
+        # Data that has been written but not yet generated can be overwritten.
+        # Preserve any data past the end of the new segment.
+        tail = None
+        if end < write_position:
+            tail = self._ao_buffer.get_range_samples(end, write_position)
+            tail = tail.copy()
+        self._ao_buffer.invalidate_samples(offset)
+        self._ao_buffer.append_data(data)
+        if tail is not None:
+            self._ao_buffer.append_data(tail)
+
+    def get_ts(self):
+        with self.lock:
+            return self.sample_time()
+
+    def ai_sample_clock(self):
+        return self._tasks['hw_ai'].samples_done
+
+    def ai_sample_time(self):
+        return self.ai_sample_clock()/self.ai_fs
+
+    def ao_sample_clock(self):
+        try:
+            return self._tasks['hw_ao'].samples_done
+        except KeyError:
+            return 0
+
+    def ao_sample_time(self):
+        return self.ao_sample_clock()/self.ao_fs
+
+    def get_buffer_size(self, channel_name):
+        return self.hw_ao_buffer_size
+
+    def start(self):
+        if not self._configured:
+            log.debug('Tasks were not configured yet')
+            self.configure()
+
+        self._metrics = {
+            'ao_underflow_samples': 0,
+            'ai_callback_time': 0,
+            'ao_callback_time': 0,
+            'max_callback_time': 0,
+            'ticks': 0,
+        }
+
+        # The buffer also holds a short history of the generated samples so
+        # that the analog input can look back (e.g., to simulate latency).
+        if 'hw_ao' in self._tasks:
+            ao_task = self._tasks['hw_ao']
+            history = self._get_tick_period() * 2 + self.start_skew
+            for channel in self.get_channels('analog', 'input', 'hardware'):
+                history += getattr(channel, 'latency', 0)
+            size = self.hw_ao_buffer_size + history
+            self._ao_buffer = SignalBuffer(ao_task.fs, size, 0,
+                                           n_channels=len(ao_task.names))
+            samples = self.get_space_available()
+            self.hw_ao_callback(samples)
+
+        if self.ai_dispatcher is not None:
+            self.ai_dispatcher.start()
+
+        self._stop_requested = threading.Event()
+        self._thread = threading.Thread(target=self._run,
+                                        name='{}_clock'.format(self.name),
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self._configured:
+            return
+        log.debug('Stopping engine')
+        if self._stop_requested is not None:
+            self._stop_requested.set()
+        if self._thread is not None \
+                and self._thread is not threading.current_thread():
+            self._thread.join()
+        if self.ai_dispatcher is not None:
+            self.ai_dispatcher.stop()
+        self._callbacks = {}
+        self._configured = False
+
+    def join(self, timeout=None):
+        '''
+        Wait for the sample clock to stop
+
+        The clock stops once all tasks have acquired or generated the requested
+        number of samples or when the engine is stopped.
+
+        Returns
+        -------
+        done : bool
+            False if the timeout elapsed before the clock stopped.
+        '''
+        if self._thread is None:
+            return True
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def get_metrics(self):
+        '''
+        Return throughput metrics for the simulation
+
+        The real-time factor is the ratio of simulated time to wall time. A
+        value greater than 1 when running as fast as possible indicates that
+        the processing pipeline can keep up with real-time acquisition.
+        '''
+        metrics = self._metrics.copy()
+        wall_time = metrics.pop('wall_time', 0)
+        sim_time = metrics.pop('sim_time', 0)
+        metrics['wall_time'] = wall_time
+        metrics['simulated_time'] = sim_time
+        metrics['realtime_factor'] = sim_time/wall_time if wall_time else 0
+        for name, task in self._tasks.items():
+            metrics['{}_samples'.format(name)] = task.samples_done
+        if self.ai_dispatcher is not None:
+            metrics['ai_workers'] = self.ai_dispatcher.get_metrics()
+        if self.ai_read_buffer is not None:
+            metrics['ai_read_buffer'] = self.ai_read_buffer.get_stats()
+        return metrics
+
+    def _get_tick_period(self):
+        return min(self.hw_ai_monitor_period, self.hw_ao_monitor_period)
+
+    def _run(self):
+        period = self._get_tick_period()
+        wall_start = time.perf_counter()
+        tick = 0
+        while not self._stop_requested.is_set():
+            tick += 1
+            t = tick*period
+            if self.speed > 0:
+                delay = wall_start + t/self.speed - time.perf_counter()
+                if delay > 0 and self._stop_requested.wait(delay):
+                    break
+            try:
+                done = self._tick(t)
+            except Exception as e:
+                log.exception(e)
+                done = True
+            self._metrics['ticks'] = tick
+            self._metrics['sim_time'] = t
+            self._metrics['wall_time'] = time.perf_counter()-wall_start
+            if done:
+                break
+
+    def _tick(self, t):
+        # Advance the sample clock of each task to time `t` (re. engine start).
+        # Callbacks are invoked outside of the engine lock since they acquire
+        # it as needed.
+        with self.lock:
+            n_ao_callbacks = self._advance_hw_ao(t)
+            ai_data = self._advance_hw_ai(t)
+            tasks = self._tasks.values()
+            done = all(task.is_complete() for task in tasks)
+
+        if n_ao_callbacks:
+            callback_samples = self._tasks['hw_ao'].callback_samples
+            t0 = time.perf_counter()
+            for i in range(n_ao_callbacks):
+                self.hw_ao_callback(callback_samples)
+            self._update_callback_time('ao_callback_time', t0)
+
+        if ai_data is not None:
+            t0 = time.perf_counter()
+            self._hw_ai_callback(ai_data)
+            self._update_callback_time('ai_callback_time', t0)
+
+        if done:
+            log.debug('All tasks complete')
+            if self.ai_dispatcher is not None:
+                self.ai_dispatcher.join()
+            for cb in self._callbacks.get('done', []):
+                cb()
+        return done
+
+    def _update_callback_time(self, name, t0):
+        elapsed = time.perf_counter()-t0
+        self._metrics[name] += elapsed
+        if elapsed > self._metrics['max_callback_time']:
+            self._metrics['max_callback_time'] = elapsed
+
+    def _advance_hw_ao(self, t):
+        task = self._tasks.get('hw_ao', None)
+        if task is None:
+            return 0
+        target = task.get_target_samples(t)
+        if target <= task.samples_done:
+            return 0
+
+        # If the buffer runs out of data, pad with zeros so the write position
+        # stays in sync with the sample clock.
+        write_position = self.get_offset()
+        if target > write_position:
+            missing = target - write_position
+            log_ao.warning('Analog output buffer underflow (%d samples)',
+                           missing)
+            self._metrics['ao_underflow_samples'] += missing
+            padding = np.zeros((len(task.names), missing))
+            self._ao_buffer.append_data(padding)
+
+        n = task.callback_samples
+        n_callbacks = target//n - task.samples_done//n if n else 0
+        task.samples_done = target
+        return n_callbacks
+
+    def _get_ao_history(self, index, lb, ub):
+        # Return generated analog output samples in the range [lb, ub). Samples
+        # that were not generated (i.e., before the analog output started) are
+        # set to 0.
+        data = np.zeros(ub-lb)
+        slb = max(lb, self._ao_buffer.get_samples_lb())
+        sub = min(ub, self._tasks['hw_ao'].samples_done)
+        if sub > slb:
+            data[slb-lb:sub-lb] = \
+                self._ao_buffer.get_range_samples(slb, sub)[index]
+        return data
+
+    def _advance_hw_ai(self, t):
+        task = self._tasks.get('hw_ai', None)
+        if task is None:
+            return None
+        target = task.get_target_samples(t)
+        lb = task.samples_done
+        samples = target - lb
+        if samples <= 0:
+            return None
+
+        config = task.config
+        if self.ai_read_buffer is None:
+            data = np.zeros((len(task.names), samples), dtype=np.double)
+        else:
+            data = self.ai_read_buffer.get(samples)
+            data[:] = 0
+        iterable = zip(data, config['loopback'], config['loopback_gain'],
+                       config['noise_level'], config['sf'])
+        for ch_data, loopback, gain, noise_level, sf in iterable:
+            if loopback is not None:
+                index, delay = loopback
+                ch_data[:] = self._get_ao_history(index, lb-delay,
+                                                  target-delay)
+                ch_data *= gain
+            if noise_level:
+                ch_data += self._random.normal(scale=noise_level,
+                                               size=samples)
+            # Scale by the channel gain (e.g., due to a microphone preamp).
+            # This is removed by `_hw_ai_callback`.
+            ch_data *= sf
+        task.samples_done = target
+        log_ai.debug('Acquired %d samples', samples)
+        return data
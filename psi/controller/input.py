@@ -1,9 +1,11 @@
 import logging
 log = logging.getLogger(__name__)
 
+import bisect
 from collections import deque, namedtuple
 from copy import copy
-from functools import partial
+from fractions import Fraction
+from functools import lru_cache, partial
 from queue import Empty, Queue
 
 import numpy as np
@@ -72,6 +74,14 @@ class Input(PSIContribution):
 
     inputs = List()
 
+    #: If True, the input keeps a reference to the data it receives after
+    #: returning (e.g., to process several blocks together). When the engine
+    #: reuses the buffers it reads data into (see
+    #: `Engine.hw_ai_reuse_buffers`), the input then receives a copy of the
+    #: data rather than a view into a buffer that is overwritten by later
+    #: reads.
+    copy_data = d_(Bool(False))
+
     def _default_name(self):
         if self.source is not None:
             base_name = self.source.name
@@ -117,20 +127,43 @@ class Input(PSIContribution):
     def _get_engine(self):
         return self.channel.engine
 
+    def _get_profiler(self):
+        try:
+            return self.engine.input_profiler
+        except AttributeError:
+            return None
+
+    def requires_copy(self):
+        '''
+        True if this input or any active input that receives data from it
+        keeps a reference to the data (see `copy_data`)
+        '''
+        if self.copy_data:
+            return True
+        return any(i.requires_copy() for i in self.inputs if i.active)
+
     def configure(self):
         cb = self.configure_callback()
-        self.engine.register_ai_callback(cb, self.channel.name)
+        profiler = self._get_profiler()
+        if profiler is not None:
+            cb = profiler.wrap(self, cb)
+        self.engine.register_ai_callback(cb, self.channel.name,
+                                         copy=self.requires_copy())
 
     def configure_callback(self):
-        targets = [i.configure_callback() for i in self.inputs if i.active]
+        inputs = [i for i in self.inputs if i.active]
+        targets = [i.configure_callback() for i in inputs]
+        profiler = self._get_profiler()
+        if profiler is not None:
+            targets = [profiler.wrap(i, t) for i, t in zip(inputs, targets)]
         log.debug('Configured callback for %s with %d targets', self.name, len(targets))
         if len(targets) == 1:
             return targets[0]
         # If we have more than one target, need to add a broadcaster
         return broadcast(*targets).send
 
-    def add_callback(self, cb):
-        callback = Callback(function=cb)
+    def add_callback(self, cb, copy_data=True):
+        callback = Callback(function=cb, copy_data=copy_data)
         self.add_input(callback)
 
     def _get_active(self):
@@ -157,6 +190,11 @@ class Callback(Input):
 
     function = d_(Callable())
 
+    def _default_copy_data(self):
+        # The function may hold on to the data (e.g., to update a plot from
+        # the GUI thread).
+        return True
+
     def configure_callback(self):
         log.debug('Configuring callback for {}'.format(self.name))
         return self.function
@@ -204,16 +242,42 @@ class CalibratedInput(ContinuousInput):
 
 @coroutine
 def rms(n, target):
-    data = None
+    # Holds samples from the end of the last block that did not fill a
+    # complete window.
+    buffer = None
+    i = 0
     while True:
-        if data is None:
-            data = (yield)
-        else:
-            data = np.concatenate((data, (yield)), axis=-1)
-        while data.shape[-1] >= n:
-            result = np.mean(data[..., :n]**2, axis=0)**0.5
-            target(result[np.newaxis])
-            data = data[..., n:]
+        data = (yield)
+        if buffer is None:
+            buffer = np.empty(data.shape[:-1] + (n,), dtype=data.dtype)
+        metadata = getattr(data, 'metadata', None)
+
+        results = []
+        if i:
+            m = min(n-i, data.shape[-1])
+            buffer[..., i:i+m] = data[..., :m]
+            data = data[..., m:]
+            i += m
+            if i == n:
+                results.append(buffer[..., np.newaxis, :])
+                i = 0
+
+        # Compute RMS for all complete windows directly from the input.
+        k = data.shape[-1] // n
+        if k:
+            windows = data[..., :k*n].reshape(data.shape[:-1] + (k, n))
+            results.append(windows)
+            data = data[..., k*n:]
+
+        if results:
+            result = np.concatenate([np.mean(r**2, axis=-1)**0.5
+                                     for r in results], axis=-1)
+            target(InputData(result, metadata))
+
+        m = data.shape[-1]
+        if m:
+            buffer[..., :m] = data
+            i = m
 
 
 class RMS(ContinuousInput):
@@ -248,20 +312,87 @@ class SPL(ContinuousInput):
         return spl(cb, sens).send
 
 
-@coroutine
-def iirfilter(N, Wn, rp, rs, btype, ftype, target):
-    b, a = signal.iirfilter(N, Wn, rp, rs, btype, ftype=ftype)
-    if np.any(np.abs(np.roots(a)) > 1):
-        raise ValueError('Unstable filter coefficients')
+@lru_cache(maxsize=128)
+def _design_iirfilter(N, Wn, btype, ftype, fs, output):
+    coefs = signal.iirfilter(N, Wn, btype=btype, ftype=ftype, fs=fs,
+                             output=output)
+    return (coefs,) if output == 'sos' else coefs
+
+
+def design_iirfilter(N, Wn, btype, ftype, fs, output='sos'):
+    '''
+    Design IIR filter, reusing coefficients from prior designs if possible
+
+    Parameters
+    ----------
+    N : int
+        Filter order.
+    Wn : {float, tuple of float}
+        Critical frequency (or frequencies for bandpass and bandstop filters)
+        in Hz.
+    btype : {'bandpass', 'lowpass', 'highpass', 'bandstop'}
+        Filter type.
+    ftype : str
+        Filter design (see `scipy.signal.iirfilter`).
+    fs : float
+        Sampling rate of the signal.
+    output : {'sos', 'ba'}
+        Form of the filter coefficients.
+
+    Returns
+    -------
+    coefs : tuple of arrays
+        Either `(sos,)` or `(b, a)` depending on `output`. Arrays are shared
+        with other callers and must not be modified.
+    '''
+    if np.iterable(Wn):
+        Wn = tuple(float(w) for w in Wn)
+    else:
+        Wn = float(Wn)
+    return _design_iirfilter(N, Wn, btype, ftype, float(fs), output)
 
-    # Initialize the state of the filter and scale it by y[0] to avoid a
-    # transient.
+
+def _initial_state(zi, x0):
+    # Scale the steady-state response to a unit step by the first sample of
+    # each channel to avoid a transient at the start of filtering. zi is
+    # shaped for a single channel with the delay axis last (and, for SOS
+    # filters, the section axis first).
+    x0 = np.asarray(x0)
+    if zi.ndim == 2:
+        zi = zi.reshape((zi.shape[0],) + (1,) * x0.ndim + (zi.shape[1],))
+        return zi * x0[np.newaxis, ..., np.newaxis]
+    return zi * x0[..., np.newaxis]
+
+
+def _lfilter(b, a, target):
     zi = signal.lfilter_zi(b, a)
     y = (yield)
-    zo = zi*y[0]
+    zo = _initial_state(zi, y[..., 0])
+    while True:
+        y, zo = signal.lfilter(b, a, y, axis=-1, zi=zo)
+        target(y)
+        y = (yield)
+
+
+@coroutine
+def lfilter(b, a, target):
+    yield from _lfilter(b, a, target)
 
+
+@coroutine
+def sosfilter(sos, target):
+    '''
+    Filter data using cascaded second-order sections
+
+    Data may be a single channel or shaped (channels, samples). All channels
+    are filtered in a single call and the state of each section is carried
+    across blocks.
+    '''
+    zi = signal.sosfilt_zi(sos)
+    y = (yield)
+    zo = _initial_state(zi, y[..., 0])
     while True:
-        y, zo = signal.lfilter(b, a, y, zi=zo)
+        y, zo = signal.sosfilt(sos, y, axis=-1, zi=zo)
         target(y)
         y = (yield)
 
@@ -275,54 +406,75 @@ class IIRFilter(ContinuousInput):
     passthrough = d_(Bool(False)).tag(metadata=True)
 
     N = d_(Int(1)).tag(metadata=True)
+
+    #: Form of filter coefficients. Second-order sections ('sos') remain
+    #: stable for higher filter orders, unlike transfer function
+    #: coefficients ('ba').
+    backend = d_(Enum('sos', 'ba')).tag(metadata=True)
+
     btype = d_(Enum('bandpass', 'lowpass', 'highpass', 'bandstop')).tag(metadata=True)
     ftype = d_(Enum('butter', 'cheby1', 'cheby2', 'ellip', 'bessel')).tag(metadata=True)
     f_highpass = d_(Float()).tag(metadata=True)
     f_lowpass = d_(Float()).tag(metadata=True)
-    wn = Property()
-
-    def _get_wn(self):
-        if self.btype == 'lowpass':
-            log.debug('Lowpass at %r (fs=%r)', self.f_lowpass, self.fs)
-            return self.f_lowpass/(0.5*self.fs)
-        elif self.btype == 'highpass':
-            log.debug('Highpass at %r (fs=%r)', self.f_lowpass, self.fs)
-            return self.f_highpass/(0.5*self.fs)
-        else:
-            log.debug('Bandpass %r to %r (fs=%r)', self.f_highpass,
-                      self.f_lowpass, self.fs)
-            return (self.f_highpass/(0.5*self.fs),
-                    self.f_lowpass/(0.5*self.fs))
 
     def configure_callback(self):
         cb = super().configure_callback()
         if self.passthrough:
             return cb
-        return iirfilter(self.N, self.wn, None, None, self.btype, self.ftype,
-                         cb).send
+        if self.btype == 'lowpass':
+            Wn = self.f_lowpass
+        elif self.btype == 'highpass':
+            Wn = self.f_highpass
+        else:
+            Wn = self.f_highpass, self.f_lowpass
+        log.debug('%s filter at %r (fs=%r)', self.btype, Wn, self.fs)
+        coefs = design_iirfilter(self.N, Wn, self.btype, self.ftype, self.fs,
+                                 self.backend)
+        if self.backend == 'sos':
+            return sosfilter(*coefs, cb).send
+        b, a = coefs
+        if np.any(np.abs(np.roots(a)) > 1):
+            raise ValueError('Unstable filter coefficients')
+        return lfilter(b, a, cb).send
 
 
 @coroutine
 def blocked(block_size, target):
-    data = []
-    n = 0
+    # Block that is currently being filled and number of samples in it.
+    block = None
+    i = 0
 
     while True:
         d = (yield)
         if d is Ellipsis:
-            data = []
+            block = None
+            i = 0
             target(d)
             continue
 
-        n += d.shape[-1]
-        data.append(d)
-        if n >= block_size:
-            merged = concatenate(data, axis=-1)
-            while merged.shape[-1] >= block_size:
-                target(merged[..., :block_size])
-                merged = merged[..., block_size:]
-            data = [merged]
-            n = merged.shape[-1]
+        n = d.shape[-1]
+        o = 0
+        while o < n:
+            if i == 0 and (n-o) >= block_size:
+                # Pass complete blocks through without copying.
+                target(d[..., o:o+block_size])
+                o += block_size
+                continue
+            if block is None:
+                block = InputData(np.empty(d.shape[:-1] + (block_size,),
+                                           dtype=d.dtype),
+                                  getattr(d, 'metadata', None))
+            m = min(block_size-i, n-o)
+            block[..., i:i+m] = d[..., o:o+m]
+            i += m
+            o += m
+            if i == block_size:
+                # The block is handed off to the target (which may keep a
+                # reference to it), so a new one is allocated for the next
+                # block.
+                target(block)
+                block = None
+                i = 0
 
 
 class Blocked(ContinuousInput):
@@ -342,25 +494,55 @@ class Blocked(ContinuousInput):
 
 @coroutine
 def accumulate(n, axis, newaxis, status_cb, target):
-    data = []
+    # Data is written to an array that is preallocated assuming all n inputs
+    # are the same shape. If they are not, fall back to collecting the inputs
+    # in a list and concatenating them.
+    result = None
+    data = None
+    i = 0
     while True:
         d = (yield)
         if d is Ellipsis:
-            data = []
+            result = data = None
+            i = 0
             target(d)
             continue
 
         if newaxis:
-            data.append(d[np.newaxis])
+            d = d[np.newaxis]
+
+        if i == 0:
+            metadata = d.metadata
+            block_shape = d.shape
+            shape = list(d.shape)
+            shape[axis] *= n
+            result = InputData(np.empty(shape, dtype=d.dtype), metadata)
+        elif d.metadata != metadata:
+            log.debug('%r vs %r', d.metadata, metadata)
+            raise ValueError('Cannot combine InputData set')
+
+        s = [slice(None)] * d.ndim
+        if result is not None and d.shape == block_shape:
+            size = block_shape[axis]
+            s[axis] = slice(i*size, (i+1)*size)
+            result[tuple(s)] = d
         else:
-            data.append(d)
-        if len(data) == n:
-            data = concatenate(data, axis=axis)
-            target(data)
-            data = []
+            if result is not None:
+                s[axis] = slice(0, i*block_shape[axis])
+                data = [result[tuple(s)]]
+                result = None
+            # The list holds on to the inputs, which may be views into a
+            # buffer that the source reuses.
+            data.append(d.copy())
+        i += 1
+
+        if i == n:
+            target(result if data is None else concatenate(data, axis=axis))
+            result = data = None
+            i = 0
 
         if status_cb is not None:
-            status_cb(len(data))
+            status_cb(i)
 
 
 class Accumulate(ContinuousInput):
@@ -487,6 +669,121 @@ class Decimate(ContinuousInput):
         return decimate(self.q, cb).send
 
 
+@coroutine
+def resample(up, down, target, beta=5.0):
+    '''
+    Resample by a rational factor using a polyphase FIR filter
+
+    The anti-aliasing filter is designed the same way as in
+    `scipy.signal.resample_poly`. Unlike `resample_poly`, the filter state is
+    carried across blocks, so the output is identical no matter how the input
+    is split into blocks. The output is delayed by `half_len/up` input
+    samples, where `half_len` is half the length of the filter.
+
+    Data may be a single channel or shaped (channels, samples).
+    '''
+    max_rate = max(up, down)
+    half_len = 10 * max_rate
+    h = signal.firwin(2*half_len+1, 1/max_rate, window=('kaiser', beta))
+    h *= up
+
+    # Split the filter into one branch per phase of the upsampled signal,
+    # reversed so each branch can be applied to a window of input samples
+    # ending at the most recent sample.
+    n_taps = -(-len(h) // up)
+    h = np.pad(h, (0, n_taps*up-len(h)))
+    branches = h.reshape((n_taps, up)).T[:, ::-1]
+
+    # Zeros are prepended so that the output begins with the first sample.
+    buffer = None
+    buffer_start = -(n_taps-1)
+    n_received = 0
+    m = 0
+    while True:
+        data = (yield)
+
+        # Ellipsis indicates a discontinuity in the data. Start over.
+        if data is Ellipsis:
+            buffer = None
+            buffer_start = -(n_taps-1)
+            n_received = m = 0
+            target(data)
+            continue
+
+        if buffer is None:
+            padding = np.zeros(data.shape[:-1] + (n_taps-1,))
+            buffer = np.concatenate((padding, data), axis=-1)
+        else:
+            buffer = np.concatenate((buffer, data), axis=-1)
+        n_received += data.shape[-1]
+
+        # Output sample m requires input samples up to (m*down)//up.
+        m_end = -(-n_received*up // down)
+        i = np.arange(m, m_end) * down
+        if len(i):
+            start = i // up - (n_taps-1) - buffer_start
+            windows = np.lib.stride_tricks.sliding_window_view(buffer, n_taps,
+                                                               axis=-1)
+            result = np.einsum('...mj,mj->...m', windows[..., start, :],
+                               branches[i % up])
+            target(InputData(result, getattr(data, 'metadata', None)))
+
+        # Discard samples that are no longer needed.
+        discard = m_end * down // up - (n_taps-1) - buffer_start
+        buffer = buffer[..., discard:]
+        buffer_start += discard
+        m = m_end
+
+
+class Resample(ContinuousInput):
+    '''
+    Resample to an arbitrary sampling rate
+
+    The ratio between `target_fs` and the sampling rate of the source is
+    approximated by a fraction whose denominator does not exceed `max_down`.
+    The actual sampling rate is available via `fs`.
+    '''
+    #: Desired sampling rate.
+    target_fs = d_(Float()).tag(metadata=True)
+
+    #: Maximum downsampling factor. Larger values approximate `target_fs`
+    #: more closely at the cost of a longer filter.
+    max_down = d_(Int(1000)).tag(metadata=True)
+
+    #: Shape parameter of the Kaiser window used to design the filter.
+    beta = d_(Float(5.0)).tag(metadata=True)
+
+    up = Property().tag(metadata=True)
+    down = Property().tag(metadata=True)
+
+    #: Delay (in seconds) introduced by the anti-aliasing filter.
+    group_delay = Property().tag(metadata=True)
+
+    def _get_ratio(self):
+        return Fraction(self.target_fs/self.source.fs) \
+            .limit_denominator(self.max_down)
+
+    def _get_up(self):
+        return self._get_ratio().numerator
+
+    def _get_down(self):
+        return self._get_ratio().denominator
+
+    def _get_fs(self):
+        return self.source.fs*self.up/self.down
+
+    def _get_group_delay(self):
+        half_len = 10*max(self.up, self.down)
+        return half_len/self.up/self.source.fs
+
+    def configure_callback(self):
+        if self.target_fs <= 0:
+            m = 'Target sampling rate for {} must be > 0'.format(self.name)
+            raise ValueError(m)
+        cb = super().configure_callback()
+        return resample(self.up, self.down, cb, self.beta).send
+
+
 @coroutine
 def discard(discard_samples, cb):
     discarded = discard_samples
@@ -557,6 +854,154 @@ class Average(ContinuousInput):
         return average(self.n, cb).send
 
 
+@coroutine
+def spectral_average(n, step, window, detrend, average, n_average, mode,
+                     n_update, target):
+    '''
+    Compute running average of spectrum from overlapping segments
+
+    Parameters
+    ----------
+    n : int
+        Number of samples in each segment.
+    step : int
+        Number of samples between the start of consecutive segments.
+    window : array
+        Window applied to each segment. Any normalization (e.g., by the number
+        of samples) should be applied to the window.
+    detrend : {None, 'constant', 'linear'}
+        Detrending applied to each segment before the window.
+    average : {'linear', 'exponential'}
+        If linear, all segments are weighted equally. If exponential, each
+        segment is given a weight of `1/n_average`.
+    n_average : int
+        Number of segments for the time constant of the exponential average.
+    mode : {'psd', 'csd'}
+        If psd, magnitude squared of the spectrum is averaged and the square
+        root is returned. If csd, the complex spectrum is averaged.
+    n_update : int
+        Number of segments between calls to target.
+    target : callable
+        Receives the averaged spectrum.
+    '''
+    buffer = None
+    acc = None
+    n_segments = 0
+    n_pending = 0
+    while True:
+        data = (yield)
+
+        # Ellipsis indicates a discontinuity in the data. Start over.
+        if data is Ellipsis:
+            buffer = acc = None
+            n_segments = n_pending = 0
+            target(data)
+            continue
+
+        if buffer is None:
+            buffer = data
+        else:
+            buffer = np.concatenate((buffer, data), axis=-1)
+        if buffer.shape[-1] < n:
+            if buffer is data:
+                # The source may reuse its buffer once we return.
+                buffer = data.copy()
+            continue
+
+        # Transform all complete segments in the buffer in one call.
+        segments = np.lib.stride_tricks.sliding_window_view(buffer, n, axis=-1)
+        segments = segments[..., ::step, :]
+        buffer = buffer[..., segments.shape[-2]*step:].copy()
+        if detrend is not None:
+            segments = signal.detrend(segments, type=detrend, axis=-1)
+        x = np.fft.rfft(segments*window, axis=-1)
+        if mode == 'psd':
+            x = x.real**2 + x.imag**2
+
+        if average == 'linear':
+            x = x.sum(axis=-2)
+            acc = x if acc is None else acc + x
+        else:
+            for i in range(x.shape[-2]):
+                if acc is None:
+                    acc = x[..., i, :].copy()
+                else:
+                    acc += (x[..., i, :] - acc) / n_average
+        n_segments += segments.shape[-2]
+        n_pending += segments.shape[-2]
+
+        if n_pending >= n_update:
+            result = acc / n_segments if average == 'linear' else acc.copy()
+            if mode == 'psd':
+                # Convert to RMS amplitude to match `calibration.util.psd`.
+                result = np.sqrt(2 * result)
+            metadata = dict(getattr(data, 'metadata', None) or {})
+            metadata['n_segments'] = n_segments
+            target(InputData(result, metadata))
+            n_pending = 0
+
+
+class SpectralAverage(ContinuousInput):
+    '''
+    Streaming average of the spectrum using overlapping windowed segments
+
+    Emits the averaged spectrum (the last axis is frequency, see `frequency`)
+    every `update_interval`. The scaling matches `calibration.util.psd` and
+    `calibration.util.csd`, so the spectrum can be passed directly to
+    `Calibration.get_spl`. Multiple consumers (e.g., plots and online
+    analysis) can share the same node to avoid repeating the FFT.
+    '''
+    #: Duration of each segment in seconds. This sets the frequency
+    #: resolution.
+    segment_duration = d_(Float(0.1)).tag(metadata=True)
+
+    #: Fraction of each segment that overlaps with the next one.
+    overlap = d_(Float(0.5)).tag(metadata=True)
+
+    #: Window applied to each segment (see `scipy.signal.get_window`).
+    window = d_(Unicode('hann')).tag(metadata=True)
+
+    detrend = d_(Enum('linear', 'constant', None)).tag(metadata=True)
+
+    #: Linear averages weight all segments acquired since the last reset
+    #: equally. Exponential averages weight recent segments more heavily
+    #: using a time constant of `n_average` segments.
+    average = d_(Enum('linear', 'exponential')).tag(metadata=True)
+    n_average = d_(Int(8)).tag(metadata=True)
+
+    #: Average the power ('psd', returned as RMS amplitude) or the complex
+    #: spectrum ('csd', which attenuates components that are not
+    #: phase-locked to the acquisition).
+    mode = d_(Enum('psd', 'csd')).tag(metadata=True)
+
+    #: How often the averaged spectrum is emitted, in seconds. If 0, the
+    #: spectrum is emitted each time new segments are available.
+    update_interval = d_(Float(0)).tag(metadata=True)
+
+    n = Property().tag(metadata=True)
+    step = Property().tag(metadata=True)
+    frequency = Property()
+
+    def _get_n(self):
+        return int(round(self.segment_duration*self.source.fs))
+
+    def _get_step(self):
+        return max(1, int(round(self.n*(1-self.overlap))))
+
+    def _get_frequency(self):
+        return np.fft.rfftfreq(self.n, 1/self.source.fs)
+
+    def configure_callback(self):
+        cb = super().configure_callback()
+        n = self.n
+        window = signal.get_window(self.window, n)
+        window /= window.mean()*n
+        n_update = max(1, int(round(self.update_interval*self.fs/self.step)))
+        return spectral_average(n, self.step, window, self.detrend,
+                                self.average, self.n_average, self.mode,
+                                n_update, cb).send
+
+
 @coroutine
 def delay(n, target):
     data = np.full(n, np.nan)
@@ -640,88 +1085,103 @@ class Edges(EventInput):
 ################################################################################
 # Epoch input types
 ################################################################################
-@coroutine
-def capture_epoch(epoch_t0, epoch_samples, info, callback):
-    '''
-    Coroutine to facilitate epoch acquisition
+def _gather_epochs(buffer, starts, samples):
     '''
-    # This coroutine will continue until it acquires all the samples it needs.
-    # It then provides the samples to the callback function and exits the while
-    # loop.
-    accumulated_data = []
+    Extract a set of equal-length epochs from a ring buffer in a single call
 
-    while True:
-        tlb, data = (yield)
-        samples = data.shape[-1]
-
-        if epoch_t0 < tlb:
-            # We have missed the start of the epoch. Notify the callback of this
-            m = 'Missed samples for epoch of %d samples starting at %d'
-            log.warn(m, epoch_samples, epoch_t0)
-            callback({'signal': None, 'info': info})
-            break
-
-        elif epoch_t0 <= (tlb + samples):
-            # The start of the epoch is somewhere inside `data`. Find the start
-            # `i` and determine how many samples `d` to extract from `data`.
-            # It's possible that data does not contain the entire epoch. In
-            # that case, we just pull out what we can and save it in
-            # `accumulated_data`. We then update start to point to the last
-            # acquired sample `i+d` and update duration to be the number of
-            # samples we still need to capture.
-            i = int(epoch_t0-tlb)
-            d = int(min(epoch_samples, samples-i))
-            accumulated_data.append(data[..., i:i+d])
-            epoch_t0 += d
-            epoch_samples -= d
-
-            # Check to see if we've finished acquiring the entire epoch. If so,
-            # send it to the callback.
-            if epoch_samples == 0:
-                accumulated_data = np.concatenate(accumulated_data, axis=-1)
-                callback({'signal': accumulated_data, 'info': info})
-                break
+    Parameters
+    ----------
+    buffer : array
+        Ring buffer (..., capacity) where the last axis is time.
+    starts : array of int
+        Index in the ring buffer of the first sample of each epoch.
+    samples : int
+        Number of samples in each epoch.
+
+    Returns
+    -------
+    epochs : array
+        Array of shape (n_epochs, ..., samples). Each epoch is a view into
+        this array.
+    '''
+    capacity = buffer.shape[-1]
+    i = (starts[:, np.newaxis] + np.arange(samples)) % capacity
+    epochs = np.take(buffer, i, axis=-1)
+    return np.moveaxis(epochs, -2, 0)
 
 
 @coroutine
 def extract_epochs(fs, queue, epoch_size, poststim_time, buffer_size, target,
                    empty_queue_cb=None):
 
-    # The variable `tlb` tracks the number of samples that have been acquired
-    # and reflects the lower bound of `data`. For example, if we have acquired
-    # 300,000 samples, then the next chunk of data received from (yield) will
-    # start at sample 300,000 (remember that Python is zero-based indexing, so
-    # the first sample has an index of 0).
-    tlb = 0
-    epoch_coroutines = []
-    prior_samples = []
+    # The variable `tub` tracks the number of samples that have been acquired
+    # and reflects the upper bound of the data received so far. For example,
+    # if we have acquired 300,000 samples, then the next chunk of data received
+    # from (yield) will start at sample 300,000 (remember that Python is
+    # zero-based indexing, so the first sample has an index of 0).
+    tub = 0
+
+    # Bounds (start, end) of each block of data we are keeping to facilitate
+    # historical acquisition of data. Epochs that begin before the first block
+    # are considered missed.
+    blocks = deque()
 
     # How much historical data to keep (for retroactively capturing epochs)
     buffer_samples = int(buffer_size*fs)
 
-    # Since we may capture very short, rapidly occuring epochs (at, say, 80 per
-    # second), I find it best to accumulate as many epochs as possible before
-    # calling the next target. This list will maintain the accumulated set.
-    epochs = []
+    # Acquired samples are written into a preallocated ring buffer. Sample `s`
+    # (re. acquisition start) lives at index `s % capacity`. The buffer is
+    # allocated on the first block (once we know the number of channels and
+    # dtype) and only grows if a pending epoch needs more history than the
+    # buffer can hold.
+    ring = None
+
+    # Epochs that have been requested but not yet fully acquired. This is kept
+    # sorted by the sample at which the epoch ends so that all epochs completed
+    # by a block of data form a prefix of the list. Each entry is a tuple of
+    # (end sample, request order, start sample, samples, info).
+    pending = []
+    n_requested = 0
 
     while True:
         # Wait for new data to become available
         data = (yield)
-        prior_samples.append((tlb, data))
-
-        # Send the data to each coroutine. If a StopIteration occurs, this means
-        # that the epoch has successfully been acquired and has been sent to the
-        # callback and we can remove it. Need to operate on a copy of list since
-        # it's bad form to modify a list in-place.
-        for epoch_coroutine in epoch_coroutines[:]:
-            try:
-                epoch_coroutine.send((tlb, data))
-            except StopIteration:
-                epoch_coroutines.remove(epoch_coroutine)
+        samples = data.shape[-1]
+        blocks.append((tub, tub+samples))
+
+        # Oldest sample that must remain in the ring buffer. Pending epochs
+        # may be longer than the historical buffer, so we need to keep
+        # whichever is older.
+        keep_lb = blocks[0][0]
+        if pending:
+            keep_lb = min(keep_lb, min(p[2] for p in pending))
+
+        required = tub + samples - keep_lb
+        if ring is None or required > ring.shape[-1]:
+            capacity = max(buffer_samples, samples, 1)
+            if ring is not None:
+                capacity = max(capacity, ring.shape[-1]*2)
+            while capacity < required:
+                capacity *= 2
+            new_ring = np.empty(data.shape[:-1] + (capacity,),
+                                dtype=data.dtype)
+            if ring is not None:
+                i = np.arange(keep_lb, tub)
+                new_ring[..., i % capacity] = ring[..., i % ring.shape[-1]]
+            ring = new_ring
+
+        # Copy the new block into the ring buffer, wrapping as needed.
+        capacity = ring.shape[-1]
+        i = tub % capacity
+        n = min(samples, capacity-i)
+        ring[..., i:i+n] = data[..., :n]
+        ring[..., :samples-n] = data[..., n:]
+        tub += samples
 
         # Check to see if more epochs have been requested. Information will be
         # provided in seconds, but we need to convert this to number of
         # samples.
+        epochs = []
         while queue:
             info = queue.popleft()
 
@@ -736,40 +1196,45 @@ def extract_epochs(fs, queue, epoch_size, poststim_time, buffer_size, target,
                 total_epoch_size = info['duration'] + poststim_time
 
             epoch_samples = round(total_epoch_size * fs)
-            epoch_coroutine = capture_epoch(t0, epoch_samples, info,
-                                            epochs.append)
-
-            try:
-                # Go through the data we've been caching to facilitate
-                # historical acquisition of data. If this completes without a
-                # StopIteration, then we have not finished capturing the full
-                # epoch.
-                for prior_sample in prior_samples:
-                    epoch_coroutine.send(prior_sample)
-                epoch_coroutines.append(epoch_coroutine)
-            except StopIteration:
-                pass
-
-        tlb = tlb + data.shape[-1]
+            if t0 < blocks[0][0]:
+                # We have missed the start of the epoch. Notify the callback
+                # of this.
+                m = 'Missed samples for epoch of %d samples starting at %d'
+                log.warn(m, epoch_samples, t0)
+                epochs.append({'signal': None, 'info': info})
+            else:
+                entry = (t0+epoch_samples, n_requested, t0, epoch_samples,
+                         info)
+                bisect.insort(pending, entry)
+                n_requested += 1
+
+        # Pull out all epochs that are complete. Epochs of the same length are
+        # gathered from the ring buffer in a single vectorized operation.
+        n_complete = bisect.bisect_right(pending, (tub, np.inf))
+        if n_complete:
+            complete = pending[:n_complete]
+            del pending[:n_complete]
+            by_size = {}
+            for entry in complete:
+                by_size.setdefault(entry[3], []).append(entry)
+            for epoch_samples, entries in by_size.items():
+                starts = np.array([e[2] for e in entries])
+                signals = _gather_epochs(ring, starts, epoch_samples)
+                for s, e in zip(signals, entries):
+                    epochs.append({'signal': s, 'info': e[4]})
 
         # Once the new segment of data has been processed, pass all complete
         # epochs along to the next target.
-        if len(epochs) != 0:
-            target(epochs[:])
-            epochs[:] = []
+        if epochs:
+            target(epochs)
 
-        # Check to see if any of the cached samples are older than the specified
+        # Check to see if any of the cached blocks are older than the specified
         # `buffer_samples` and discard them.
-        while True:
-            oldest_samples = prior_samples[0]
-            tub = oldest_samples[0] + oldest_samples[1].shape[-1]
-            if tub < (tlb-buffer_samples):
-                prior_samples.pop(0)
-            else:
-                break
+        while blocks[0][1] < (tub-buffer_samples):
+            blocks.popleft()
 
-        if not (queue or epoch_coroutines) and empty_queue_cb:
-            # If queue and epoch coroutines are complete, call queue callback.
+        if not (queue or pending) and empty_queue_cb:
+            # If queue and pending epochs are complete, call queue callback.
             empty_queue_cb()
             empty_queue_cb = None
 
@@ -814,17 +1279,66 @@ class ExtractEpochs(EpochInput):
         self.notify('duration', self.duration)
 
 
+def stack_epochs(epochs):
+    '''
+    Stack signals from list of epochs into a single array
+
+    Returns None if the epochs cannot be stacked (e.g., the epochs differ in
+    length or the signal is missing for an epoch).
+    '''
+    try:
+        signals = [e['signal'] for e in epochs]
+        shapes = set(s.shape for s in signals)
+    except AttributeError:
+        return None
+    if len(shapes) != 1:
+        return None
+
+    # Epochs extracted by `_gather_epochs` (or detrended as a stack) are
+    # views into a single array. If so, return a view of that array rather
+    # than copying the signals.
+    base = signals[0].base
+    if base is not None and base.ndim >= 2 and \
+            all(s.base is base for s in signals):
+        for stacked in (base, np.moveaxis(base, -2, 0)):
+            if _is_stack_of(stacked, signals):
+                return stacked
+    return np.stack(signals)
+
+
+def _is_stack_of(stacked, signals):
+    if stacked.shape != (len(signals),) + signals[0].shape:
+        return False
+    for s, t in zip(signals, stacked):
+        if s.strides != t.strides or \
+                s.__array_interface__['data'] != t.__array_interface__['data']:
+            return False
+    return True
+
+
 @coroutine
 def reject_epochs(reject_threshold, mode, status, valid_target):
     if mode == 'absolute value':
         accept = lambda s: np.max(np.abs(s)) < reject_threshold
+        reduce = lambda s, axis: np.max(np.abs(s), axis=axis)
     elif mode == 'amplitude':
         accept = lambda s: np.ptp(s) < reject_threshold
+        reduce = lambda s, axis: np.ptp(s, axis=axis)
 
     while True:
         epochs = (yield)
+
+        # Check all epochs in a single pass if they are the same length.
+        # Otherwise, check each one individually.
+        signals = stack_epochs(epochs)
+        if signals is None:
+            mask = [accept(e['signal']) for e in epochs]
+        else:
+            axis = tuple(range(1, signals.ndim))
+            mask = reduce(signals, axis) < reject_threshold
+
         # Check for valid epochs and send them if there are any
-        valid = [e for e in epochs if accept(e['signal'])]
+        valid = [e for e, m in zip(epochs, mask) if m]
         if len(valid):
             valid_target(valid)
 
@@ -868,15 +1382,20 @@ def detrend(mode, target):
     if mode is None:
         do_detrend = lambda x: x
     else:
-        do_detrend = partial(signal.detrend, type=mode)
+        do_detrend = partial(signal.detrend, type=mode, axis=-1)
     while True:
-        epochs = []
-        for epoch in (yield):
-            epoch = {
-                'signal': do_detrend(epoch['signal']),
-                'info': epoch['info']
-            }
-            epochs.append(epoch)
+        epochs = (yield)
+
+        # If all epochs are the same length, detrend them in a single pass.
+        # The resulting signals are views into the detrended array.
+        signals = stack_epochs(epochs) if mode is not None else None
+        if signals is None:
+            signals = [do_detrend(e['signal']) for e in epochs]
+        else:
+            signals = do_detrend(signals)
+
+        epochs = [{'signal': s, 'info': e['info']}
+                  for s, e in zip(signals, epochs)]
         target(epochs)
 
 
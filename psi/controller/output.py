@@ -14,7 +14,7 @@ from enaml.application import deferred_call
 from enaml.core.api import Declarative, d_
 from enaml.workbench.api import Extension
 
-from ..util import coroutine, SignalBuffer
+from ..util import coroutine, SignalBuffer, WaveformCache
 from .queue import AbstractSignalQueue
 
 from psi.core.enaml.api import PSIContribution
@@ -148,24 +148,30 @@ class BufferedOutput(Output):
         # Don't generate new samples if occuring before activation.
         if (samples > 0) and (offset < self._offset):
             s = min(self._offset-offset, samples)
-            data = np.zeros(s)
-            self._buffer.append_data(data)
-            if (samples == s):
-                out[-samples:] = data
-            else:
-                out[-samples:-samples+s] = data
+            i = out.shape[-1] - samples
+            out[i:i+s] = 0
+            self._buffer.append_data(out[i:i+s])
             samples -= s
             offset += s
 
-        # Generate new samples
+        # Generate new samples directly into the output array
         if samples > 0:
-            data = self.get_next_samples(samples)
+            data = out[-samples:]
+            self.get_next_samples_into(data)
             self._buffer.append_data(data)
-            out[-samples:] = data
 
     def get_next_samples(self, samples):
         raise NotImplementedError
 
+    def get_next_samples_into(self, out):
+        '''
+        Write the next set of samples into the provided array
+
+        Subclasses that can generate samples in place should override this to
+        avoid allocating an intermediate array.
+        '''
+        out[:] = self.get_next_samples(out.shape[-1])
+
     def activate(self, offset):
         log.debug('Activating %s at %d', self.name, offset)
         self.active = True
@@ -188,6 +194,12 @@ class BufferedOutput(Output):
 class EpochOutput(BufferedOutput):
 
     def get_next_samples(self, samples):
+        waveform = np.empty(samples, dtype=self.dtype)
+        self.get_next_samples_into(waveform)
+        return waveform
+
+    def get_next_samples_into(self, out):
+        samples = out.shape[-1]
         log.trace('Getting %d samples for %s', samples, self.name)
         if self.active:
             buffered_ub = self._buffer.get_samples_ub()
@@ -197,19 +209,19 @@ class EpochOutput(BufferedOutput):
             zero_padding = min(zero_padding, samples)
             waveform_samples = samples - zero_padding
 
-            waveforms = []
-            if zero_padding:
-                w = np.zeros(zero_padding, dtype=self.dtype)
-                waveforms.append(w)
+            out[:zero_padding] = 0
             if waveform_samples:
-                w = self.source.next(waveform_samples)
-                waveforms.append(w)
+                out[zero_padding:] = self.source.next(waveform_samples)
             if self.source.is_complete():
                 self.deactivate(self._buffer.get_samples_ub())
-            waveform = np.concatenate(waveforms, axis=-1)
         else:
-            waveform = np.zeros(samples, dtype=self.dtype)
-        return waveform
+            out[:] = 0
+
+
+def render_factory(factory):
+    factory.reset()
+    samples = int(factory.get_remaining_samples())
+    return factory.next(samples)
 
 
 class QueuedEpochOutput(BufferedOutput):
@@ -219,6 +231,15 @@ class QueuedEpochOutput(BufferedOutput):
     complete_cb = Typed(object)
     complete = d_(Event(), writable=False)
 
+    #: Maximum size (in bytes) of the cache of rendered waveforms. Settings
+    #: that generate the same waveform are rendered once and then served from
+    #: the cache. Set to 0 to disable the cache.
+    waveform_cache_size = d_(Int(128*1024**2))
+    waveform_cache = Typed(WaveformCache)
+
+    def _default_waveform_cache(self):
+        return WaveformCache(self.waveform_cache_size)
+
     def _observe_queue(self, event):
         self.source = self.queue
         self._update_queue()
@@ -232,20 +253,24 @@ class QueuedEpochOutput(BufferedOutput):
             self.queue.connect(self.notify)
 
     def get_next_samples(self, samples):
+        waveform = np.empty(samples, dtype=np.double)
+        self.get_next_samples_into(waveform)
+        return waveform
+
+    def get_next_samples_into(self, out):
         if self.active:
-            waveform, empty = self.queue.pop_buffer(samples, self.auto_decrement)
+            empty = self.queue.pop_buffer_into(out, self.auto_decrement)
             if empty and self.complete_cb is not None:
                 self.complete = True
                 log.debug('Queue empty. Calling complete callback.')
                 deferred_call(self.complete_cb)
                 self.active = False
         else:
-            waveform = np.zeros(samples, dtype=np.double)
-        return waveform
+            out[:] = 0
 
     def add_setting(self, setting, averages=None, iti_duration=None):
         with enaml.imports():
-            from .output_manifest import initialize_factory
+            from .output_manifest import initialize_factory, get_factory_key
 
         # Make a copy to ensure that we don't accidentally modify in-place
         context = setting.copy()
@@ -265,7 +290,19 @@ class QueuedEpochOutput(BufferedOutput):
         # manifest system.
         factory = initialize_factory(self, self.token, context)
         duration = factory.get_duration()
-        self.queue.append(factory, averages, iti_duration, duration, setting)
+
+        # Finite waveforms are rendered once and the queue then plays out a
+        # read-only view of the cached waveform on each trial. Waveforms that
+        # bypass the cache (e.g., noise with a changing seed) are generated by
+        # the factory on each trial.
+        source = None
+        if self.waveform_cache_size and np.isfinite(duration):
+            key, random_key = get_factory_key(self, self.token, context)
+            render = partial(render_factory, factory)
+            source = self.waveform_cache.get(key, render, random_key)
+        if source is None:
+            source = factory
+        self.queue.append(source, averages, iti_duration, duration, setting)
 
     def activate(self, offset):
         log.debug('Activating output at %d', offset)
@@ -290,6 +327,12 @@ class ContinuousOutput(BufferedOutput):
         else:
             return np.zeros(samples, dtype=np.double)
 
+    def get_next_samples_into(self, out):
+        if self.active:
+            out[:] = self.source.next(out.shape[-1])
+        else:
+            out[:] = 0
+
 
 class DigitalOutput(Output):
     pass
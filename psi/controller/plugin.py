@@ -19,6 +19,7 @@ from .engine import Engine
 from .output import Output, Synchronized
 from .input import Input
 from .device import Device
+from .profiler import InputProfiler
 
 from .experiment_action import (ExperimentAction, ExperimentActionBase,
                                 ExperimentCallback, ExperimentEvent,
@@ -173,6 +174,11 @@ class ControllerPlugin(Plugin):
     # This determines which engine is responsible for the clock
     _master_engine = Typed(Engine)
 
+    # Collects timing statistics for the inputs. Profiling is enabled by
+    # `enable_input_profiling` and takes effect when the engines are
+    # configured.
+    input_profiler = Typed(InputProfiler)
+
     # List of events and actions that can be associated with the event
     _events = Typed(dict, {})
     _states = Typed(dict, {})
@@ -359,6 +365,7 @@ class ControllerPlugin(Plugin):
         for engine in self._engines.values():
             # Check to see if engine is being used
             if engine.get_channels():
+                engine.input_profiler = self.input_profiler
                 engine.configure()
                 cb = partial(self.invoke_actions, '{}_end'.format(engine.name))
                 engine.register_done_callback(cb)
@@ -381,6 +388,24 @@ class ControllerPlugin(Plugin):
         for engine in self._engines.values():
             engine.reset()
 
+    def enable_input_profiling(self, max_trace_events=100000):
+        if self.input_profiler is not None:
+            return
+        if self.experiment_state not in ('initialized', 'stopped'):
+            log.warning('Input profiling will take effect the next time the '
+                        'engines are configured')
+        self.input_profiler = InputProfiler(max_trace_events=max_trace_events)
+
+    def get_input_profile(self):
+        if self.input_profiler is None:
+            raise ValueError('Input profiling is not enabled')
+        return self.input_profiler.get_stats()
+
+    def export_input_trace(self, filename):
+        if self.input_profiler is None:
+            raise ValueError('Input profiling is not enabled')
+        self.input_profiler.export_trace(filename)
+
     def get_output(self, output_name):
         return self._outputs[output_name]
 
@@ -0,0 +1,224 @@
+'''
+Instrumentation for the input processing graph
+
+Each node in the graph (i.e., an `Input`) is represented by the callable
+returned by `Input.configure_callback`. When profiling is enabled, these
+callables are wrapped so that every call is timed. Since nodes call their
+targets synchronously, the time spent in a node includes the time spent in all
+downstream nodes. The profiler tracks this so it can report the time spent in
+the node itself (i.e., self time) as well as the inclusive time.
+'''
+import logging
+log = logging.getLogger(__name__)
+
+from collections import deque
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+
+def get_samples(data):
+    '''
+    Return number of samples (or epochs, if a list of epochs) in data
+    '''
+    try:
+        return data.shape[-1]
+    except (AttributeError, IndexError):
+        pass
+    try:
+        return len(data)
+    except TypeError:
+        return 0
+
+
+class NodeStats:
+
+    def __init__(self, channel_name, input_name, input_class, history):
+        self.channel_name = channel_name
+        self.input_name = input_name
+        self.input_class = input_class
+        self.history = history
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.samples = 0
+        self.total_time = 0
+        self.self_time = 0
+        self.total_latency = 0
+        self.max_latency = 0
+        self.self_times = deque(maxlen=self.history)
+
+    def update(self, elapsed, self_time, samples, latency):
+        self.calls += 1
+        self.samples += samples
+        self.total_time += elapsed
+        self.self_time += self_time
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        self.self_times.append(self_time)
+
+    def get_summary(self):
+        if self.self_times:
+            p50, p99 = np.percentile(self.self_times, [50, 99])
+        else:
+            p50 = p99 = 0
+        calls = max(self.calls, 1)
+        return {
+            'channel': self.channel_name,
+            'input': self.input_name,
+            'class': self.input_class,
+            'calls': self.calls,
+            'samples': self.samples,
+            'total_time': self.total_time,
+            'self_time': self.self_time,
+            'p50_time': float(p50),
+            'p99_time': float(p99),
+            'mean_latency': self.total_latency/calls,
+            'max_latency': self.max_latency,
+            'throughput': self.samples/self.self_time if self.self_time else 0,
+        }
+
+
+class InputProfiler:
+    '''
+    Collects per-node timing statistics for the input processing graph
+
+    Parameters
+    ----------
+    history : int
+        Number of calls to retain for each node when computing percentiles.
+    max_trace_events : int
+        Maximum number of calls to retain for export as a Chrome trace. If 0,
+        trace events are not recorded.
+
+    Notes
+    -----
+    Latency is measured relative to when the engine first passed the data
+    read from the hardware to the input graph. If the engine passes a block of
+    data (containing several channels) to multiple inputs, the latency of
+    each input is measured relative to the first input that received the
+    block.
+    '''
+
+    def __init__(self, history=10000, max_trace_events=100000):
+        self.history = history
+        self._stats = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._trace = deque(maxlen=max_trace_events) \
+            if max_trace_events else None
+        self._t0 = time.perf_counter()
+
+    def wrap(self, input, callback):
+        '''
+        Return callback wrapped so that each call is timed
+
+        Parameters
+        ----------
+        input : Input
+            Node in the input graph the callback belongs to.
+        callback : callable
+            Callback returned by `Input.configure_callback`.
+        '''
+        try:
+            channel_name = input.channel.name
+        except AttributeError:
+            channel_name = ''
+        key = channel_name, input.name
+        with self._lock:
+            if key not in self._stats:
+                self._stats[key] = NodeStats(channel_name, input.name,
+                                             input.__class__.__name__,
+                                             self.history)
+            stats = self._stats[key]
+
+        local = self._local
+        trace = self._trace
+        pid = os.getpid()
+
+        def profiled(data):
+            start = time.perf_counter()
+            try:
+                stack = local.stack
+            except AttributeError:
+                stack = local.stack = []
+
+            # If this is the outermost node, check to see if this is a new
+            # block of data from the engine. Data passed to each channel is
+            # typically a view of the same block read from the hardware.
+            if not stack:
+                base = getattr(data, 'base', None)
+                if base is None or base is not getattr(local, 'base', None):
+                    local.read_time = start
+                local.base = base
+
+            # Accumulates time spent in downstream nodes
+            stack.append(0)
+            try:
+                callback(data)
+            finally:
+                end = time.perf_counter()
+                elapsed = end - start
+                self_time = elapsed - stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+                samples = get_samples(data)
+                stats.update(elapsed, self_time, samples,
+                             start - local.read_time)
+                if trace is not None:
+                    trace.append({
+                        'name': input.name,
+                        'cat': channel_name,
+                        'ph': 'X',
+                        'ts': (start - self._t0) * 1e6,
+                        'dur': elapsed * 1e6,
+                        'pid': pid,
+                        'tid': threading.get_ident(),
+                        'args': {'samples': int(samples)},
+                    })
+
+        return profiled
+
+    def get_stats(self):
+        '''
+        Return summary of timing statistics for each node
+
+        Returns
+        -------
+        stats : list of dict
+            One entry per node. Times are in seconds.
+        '''
+        with self._lock:
+            stats = list(self._stats.values())
+        return [s.get_summary() for s in stats]
+
+    def get_trace(self):
+        '''
+        Return recorded calls in the Chrome trace event format
+        '''
+        if self._trace is None:
+            raise ValueError('Trace events are not being recorded')
+        return {'traceEvents': list(self._trace), 'displayTimeUnit': 'ms'}
+
+    def export_trace(self, filename):
+        '''
+        Save recorded calls as a JSON file
+
+        The file can be loaded in the Chrome tracing tool (chrome://tracing) or
+        Perfetto (https://ui.perfetto.dev).
+        '''
+        with open(filename, 'w') as fh:
+            json.dump(self.get_trace(), fh)
+
+    def reset(self):
+        # The wrapped callbacks hold a reference to the stats for their node,
+        # so reset these in place.
+        with self._lock:
+            for stats in self._stats.values():
+                stats.reset()
+        if self._trace is not None:
+            self._trace.clear()
@@ -138,21 +138,25 @@ class AbstractSignalQueue:
         if self._data[key]['trials'] <= 0:
             self.remove_key(key)
 
-    def _get_samples_waveform(self, samples):
+    def _fill_samples_waveform(self, out):
+        samples = out.shape[-1]
         if samples > len(self._source):
-            waveform = self._source
+            n = len(self._source)
+            out[:n] = self._source
             complete = True
         else:
-            waveform = self._source[:samples]
+            n = samples
+            out[:] = self._source[:samples]
             self._source = self._source[samples:]
             complete = False
-        return waveform, complete
+        return n, complete
 
-    def _get_samples_generator(self, samples):
-        samples = min(self._source.get_remaining_samples(), samples)
-        waveform = self._source.next(samples)
+    def _fill_samples_generator(self, out):
+        samples = min(self._source.get_remaining_samples(), out.shape[-1])
+        n = int(samples)
+        out[:n] = self._source.next(n)
         complete = self._source.is_complete()
-        return waveform, complete
+        return n, complete
 
     def next_trial(self, decrement=True):
         '''
@@ -166,10 +170,10 @@ class AbstractSignalQueue:
         self._source = data['source']
         try:
             self._source.reset()
-            self._get_samples = self._get_samples_generator
+            self._fill_samples = self._fill_samples_generator
         except AttributeError:
             self._source = data['source']
-            self._get_samples = self._get_samples_waveform
+            self._fill_samples = self._fill_samples_waveform
 
         delay = next(data['delays'])
         self._delay_samples = int(delay*self._fs)
@@ -196,49 +200,52 @@ class AbstractSignalQueue:
         returned, the remaining part will be returned on subsequent calls to
         this function.
         '''
-        # TODO: This is a bit complicated and I'm not happy with the structure.
-        # It should be simplified quite a bit.  Cleanup?
-        waveforms = []
-        queue_empty = False
-
-        # Load samples from current source
-        if samples > 0 and self._source is not None:
-            # That this is a dynamic function that is set when the next
-            # source is loaded (see below in this method).
-            waveform, complete = self._get_samples(samples)
-            samples -= len(waveform)
-            self._samples += len(waveform)
-            waveforms.append(waveform)
-            if complete:
-                self._source = None
-
-        # Insert intertrial interval delay
-        if samples > 0 and self._delay_samples > 0:
-            n_padding = min(self._delay_samples, samples)
-            waveform = np.zeros(n_padding)
-            samples -= n_padding
-            self._samples += len(waveform)
-            self._delay_samples -= n_padding
-            waveforms.append(waveform)
-
-        # Get next source
-        if (self._source is None) and (self._delay_samples == 0):
-            try:
-                self.next_trial(decrement)
-            except QueueEmptyError:
-                queue_empty = True
-                waveform = np.zeros(samples)
-                waveforms.append(waveform)
-                log.info('Queue is now empty')
+        waveform = np.empty(int(samples), dtype=np.double)
+        queue_empty = self.pop_buffer_into(waveform, decrement)
+        return waveform, queue_empty
 
-        if (samples > 0) and not queue_empty:
-            waveform, queue_empty = self.pop_buffer(samples, decrement)
-            waveforms.append(waveform)
-            samples -= len(waveform)
+    def pop_buffer_into(self, out, decrement=True):
+        '''
+        Fill the provided array with the next set of samples
 
-        waveform = np.concatenate(waveforms, axis=-1)
+        Identical to `pop_buffer`, but writes the samples into a preallocated
+        array. Returns True if the queue is empty (any remaining samples in the
+        array are set to 0).
+        '''
+        samples = out.shape[-1]
+        i = 0
+        queue_empty = False
 
-        return waveform, queue_empty
+        while True:
+            # Load samples from current source. Note that this is a dynamic
+            # function that is set when the next source is loaded (see
+            # `next_trial`).
+            if i < samples and self._source is not None:
+                n, complete = self._fill_samples(out[i:])
+                i += n
+                self._samples += n
+                if complete:
+                    self._source = None
+
+            # Insert intertrial interval delay
+            if i < samples and self._delay_samples > 0:
+                n = min(self._delay_samples, samples-i)
+                out[i:i+n] = 0
+                i += n
+                self._samples += n
+                self._delay_samples -= n
+
+            # Get next source
+            if (self._source is None) and (self._delay_samples == 0):
+                try:
+                    self.next_trial(decrement)
+                except QueueEmptyError:
+                    queue_empty = True
+                    out[i:] = 0
+                    log.info('Queue is now empty')
+
+            if i >= samples or queue_empty:
+                return queue_empty
 
 
 class FIFOSignalQueue(AbstractSignalQueue):
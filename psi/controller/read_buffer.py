@@ -0,0 +1,102 @@
+'''
+Reusable buffers for data read from hardware-timed analog inputs
+
+By default, engines allocate a new array for each block of data read from the
+hardware. When `Engine.hw_ai_reuse_buffers` is set, the engine instead reads
+into one of a small number of preallocated buffers that are used in rotation
+and scales the data in place. Callbacks receive views into the buffer, so a
+steady-state acquisition does not allocate any memory for the data.
+
+Since the buffers are reused, a view is only valid until the buffer is used for
+a subsequent read (with the default of two buffers, the data from the previous
+read remains valid while the current read is processed). Callbacks that keep a
+reference to the data after returning must request a copy when registering
+with the engine (e.g., `engine.register_ai_callback(cb, name, copy=True)`).
+Inputs request a copy if any input in the graph sets `Input.copy_data` (the
+default for callbacks added with `add_callback`).
+'''
+import numpy as np
+
+
+class AIReadBuffer:
+    '''
+    Rotating set of preallocated buffers for multichannel data
+
+    Parameters
+    ----------
+    n_channels : int
+        Number of channels read at a time.
+    samples : int
+        Initial capacity (in samples per channel) of each buffer. The buffers
+        grow if a read requires more samples (see `get_stats`).
+    n_buffers : int
+        Number of buffers to rotate through.
+    dtype : dtype
+        Data type of buffers.
+    '''
+
+    def __init__(self, n_channels, samples, n_buffers=2, dtype=np.double):
+        self.n_channels = n_channels
+        self.n_buffers = n_buffers
+        self.dtype = np.dtype(dtype)
+        self.samples = 0
+        self._buffers = []
+        self._i = 0
+        self.reset_stats()
+        self._allocate(samples)
+
+    def reset_stats(self):
+        self.allocations = 0
+        self.allocated_bytes = 0
+        self.reads = 0
+        self.copies = 0
+        self.copied_bytes = 0
+
+    def _allocate(self, samples):
+        # Buffers are stored flat so that a block of any size can be returned
+        # as a C-contiguous array (as required by hardware drivers that write
+        # channels sequentially).
+        size = self.n_channels * samples
+        self._buffers = [np.empty(size, dtype=self.dtype)
+                         for i in range(self.n_buffers)]
+        self.samples = samples
+        self.allocations += self.n_buffers
+        self.allocated_bytes += self.n_buffers * size * self.dtype.itemsize
+
+    def get(self, samples):
+        '''
+        Return next buffer as a contiguous array of shape (channels, samples)
+
+        The contents of the array are undefined.
+        '''
+        if samples > self.samples:
+            self._allocate(max(samples, self.samples * 2))
+        buffer = self._buffers[self._i]
+        self._i = (self._i + 1) % self.n_buffers
+        self.reads += 1
+        return buffer[:self.n_channels*samples] \
+            .reshape((self.n_channels, samples))
+
+    def copy(self, data):
+        '''
+        Return copy of data (e.g., for callbacks that hold on to the data)
+        '''
+        self.copies += 1
+        self.copied_bytes += data.nbytes
+        return data.copy()
+
+    def get_stats(self):
+        '''
+        Return allocation counters
+
+        In a steady-state acquisition, `allocations` should not increase after
+        the first few reads. The number of copies reflects the number of
+        callbacks registered with `copy=True`.
+        '''
+        return {
+            'allocations': self.allocations,
+            'allocated_bytes': self.allocated_bytes,
+            'reads': self.reads,
+            'copies': self.copies,
+            'copied_bytes': self.copied_bytes,
+        }
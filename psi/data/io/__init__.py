@@ -29,6 +29,10 @@ class Recording:
     ----------
     base_path : :obj:`str` or :obj:`pathlib.Path`
         Folder containing recordings
+    catalog : :obj:`psi.data.io.catalog.RecordingCatalog`
+        If provided and the recording has been indexed by the catalog, the
+        names of the arrays and tables are loaded from the catalog rather than
+        by listing the contents of the folder.
 
     Attributes
     ----------
@@ -60,10 +64,20 @@ class Recording:
     #: loading tables into DataFrames.
     _ttable_indices = {}
 
-    def __init__(self, base_path):
+    #: Format used to archive ctables the first time they are loaded (see
+    #: `psi.data.io.table_format`). If None, use the default format.
+    table_format = None
+
+    def __init__(self, base_path, catalog=None):
         bp = Path(base_path)
         self.base_path = bp
-        self._refresh_names()
+        names = None if catalog is None else catalog.get_names(bp)
+        if names is None:
+            self._refresh_names()
+        else:
+            self.carray_names = names['carray_names']
+            self.ctable_names = names['ctable_names']
+            self.ttable_names = names['ttable_names']
 
     def _refresh_names(self):
         '''
@@ -104,7 +118,8 @@ class Recording:
     @functools.lru_cache()
     def _load_bcolz_table(self, name):
         from .bcolz_tools import load_ctable_as_df
-        return load_ctable_as_df(self.base_path / name)
+        return load_ctable_as_df(self.base_path / name,
+                                 archive_format=self.table_format)
 
     @functools.lru_cache()
     def _load_text_table(self, name):
@@ -127,11 +142,12 @@ class Signal:
 
     def get_epochs_filtered(self, md, offset, duration, filter_lb, filter_ub,
                             filter_order=1, detrend='constant',
-                            pad_duration=10e-3, columns='auto'):
+                            pad_duration=10e-3, columns='auto',
+                            filter_method='epoch'):
         fn = self.get_segments_filtered
         return self._get_epochs(fn, md, offset, duration, filter_lb, filter_ub,
                                 filter_order, detrend, pad_duration,
-                                columns=columns)
+                                filter_method, columns=columns)
 
     def _get_epochs(self, fn, md, *args, columns='auto', **kwargs):
         if columns == 'auto':
@@ -148,13 +164,12 @@ class Signal:
         indices = np.round((times + offset) * self.fs).astype('i')
         samples = round(duration * self.fs)
 
-        m = (indices >= 0) & ((indices + samples) < self.shape[-1])
+        m = (indices >= 0) & ((indices + samples) <= self.shape[-1])
         if not m.all():
             i = np.flatnonzero(~m)
-            log.warn('Missing epochs %d', i)
+            log.warning('Missing epochs %r', i)
 
-        values = np.concatenate([self[i:i+samples][np.newaxis] \
-                                 for i in indices[m]])
+        values = self.read_segments(indices[m], samples)
         if detrend is not None:
             values = signal.detrend(values, axis=-1, type=detrend)
 
@@ -164,25 +179,106 @@ class Signal:
         df = pd.DataFrame(values, index=index, columns=columns)
         return df.reindex(times)
 
-    def _get_segments_filtered(self, fn, offset, duration, filter_lb, filter_ub,
-                               filter_order=1, detrend='constant',
-                               pad_duration=10e-3):
+    def read_segments(self, indices, samples, out=None):
+        '''
+        Read a set of equal-length segments into a single array
+
+        Parameters
+        ----------
+        indices : array of int
+            Index of the first sample of each segment. All segments must fall
+            within the bounds of the signal.
+        samples : int
+            Number of samples in each segment.
+        out : {None, array}
+            Array of shape (n_segments, samples) to write the segments into.
+            If None, a new array is allocated.
+
+        Returns
+        -------
+        segments : array
+            Array of shape (n_segments, samples).
+
+        Subclasses that store data in compressed chunks should override this
+        to ensure each chunk is only read once.
+        '''
+        out = self._allocate_segments(indices, samples, out)
+        for i, lb in enumerate(indices):
+            out[i] = self[lb:lb+samples]
+        return out
+
+    def _allocate_segments(self, indices, samples, out):
+        shape = (len(indices), samples)
+        if out is not None:
+            if out.shape != shape:
+                raise ValueError(f'Output array must have shape {shape}')
+            return out
+        return np.empty(shape, dtype=getattr(self, 'dtype', np.double))
+
+    def get_filtered(self, filter_lb, filter_ub, filter_order=1):
+        '''
+        Return zero-phase bandpass filtered copy of the continuous signal
+
+        Subclasses that can store the filtered signal should override this to
+        support `filter_method='continuous'` in `get_segments_filtered`.
+        '''
+        raise NotImplementedError
+
+    def get_filter_sos(self, filter_lb, filter_ub, filter_order=1):
+        '''
+        Return second-order sections of Butterworth bandpass filter
+        '''
         Wn = (filter_lb/(0.5*self.fs), filter_ub/(0.5*self.fs))
-        b, a = signal.iirfilter(filter_order, Wn, btype='band', ftype='butter')
-        df = fn(offset-pad_duration, duration+pad_duration, detrend)
-        df[:] = signal.filtfilt(b, a, df.values, axis=-1)
-        return df.loc[:, offset:offset+duration]
+        return signal.iirfilter(filter_order, Wn, btype='band', ftype='butter',
+                                output='sos')
 
-    def get_random_segments(self, n, offset, duration, detrend):
+    def _get_random_times(self, n, offset, duration):
         t_min = -offset
         t_max = self.duration-duration-offset
-        times = np.random.uniform(t_min, t_max, size=n)
+        return np.random.uniform(t_min, t_max, size=n)
+
+    def get_random_segments(self, n, offset, duration, detrend):
+        times = self._get_random_times(n, offset, duration)
         return self.get_segments(times, offset, duration, detrend)
 
-    def get_segments_filtered(self, times, *args, **kwargs):
-        fn = functools.partial(self.get_segments, times)
-        return self._get_segments_filtered(fn, *args, **kwargs)
+    def get_segments_filtered(self, times, offset, duration, filter_lb,
+                              filter_ub, filter_order=1, detrend='constant',
+                              pad_duration=10e-3, filter_method='epoch'):
+        '''
+        Extract segments from bandpass filtered signal
+
+        Parameters
+        ----------
+        filter_method : {'epoch', 'continuous'}
+            If 'epoch', each segment is read with `pad_duration` of padding
+            before the segment, detrended and then filtered. If 'continuous',
+            the entire signal is filtered once (see `get_filtered`) and the
+            segments are read from the filtered signal and then detrended.
+            `pad_duration` is ignored.
+        '''
+        if filter_method == 'continuous':
+            filtered = self.get_filtered(filter_lb, filter_ub, filter_order)
+            return filtered.get_segments(times, offset, duration, detrend)
+        elif filter_method != 'epoch':
+            raise ValueError(f'Unsupported filter method {filter_method}')
+
+        Wn = (filter_lb/(0.5*self.fs), filter_ub/(0.5*self.fs))
+        b, a = signal.iirfilter(filter_order, Wn, btype='band', ftype='butter')
+        df = self.get_segments(times, offset-pad_duration,
+                               duration+pad_duration, detrend)
+        df[:] = signal.filtfilt(b, a, df.values, axis=-1)
+        return df.loc[:, offset:offset+duration]
 
-    def get_random_segments_filtered(self, n, *args, **kwargs):
-        fn = functools.partial(self.get_random_segments, n)
-        return self._get_segments_filtered(fn, *args, **kwargs)
+    def get_random_segments_filtered(self, n, offset, duration, filter_lb,
+                                     filter_ub, filter_order=1,
+                                     detrend='constant', pad_duration=10e-3,
+                                     filter_method='epoch'):
+        if filter_method == 'epoch':
+            # Ensure the padding falls within the bounds of the signal.
+            times = self._get_random_times(n, offset-pad_duration,
+                                           duration+pad_duration)
+        else:
+            times = self._get_random_times(n, offset, duration)
+        return self.get_segments_filtered(times, offset, duration, filter_lb,
+                                          filter_ub, filter_order, detrend,
+                                          pad_duration, filter_method)
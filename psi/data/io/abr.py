@@ -4,13 +4,11 @@ Interface for reading tone-evoked ABR data generated by psiexperiment
 import logging
 log = logging.getLogger(__name__)
 
-from functools import lru_cache, partialmethod, wraps
-import json
+from functools import lru_cache, partial, partialmethod, wraps
 import os.path
 import shutil
 import re
 from glob import glob
-import pickle
 
 import bcolz
 import numpy as np
@@ -19,12 +17,20 @@ from scipy import signal
 
 from . import Recording
 from .bcolz_tools import repair_carray_size
+from .result_cache import MAX_SIZE, ResultCache
 
 
 # Max size of LRU cache
 MAXSIZE = 1024
 
 
+#: Name of folders created by the ABR launcher (e.g., "20200101-120000 bburan
+#: B1 left  abr_io").
+FILE_RE = re.compile(r'(?P<date>\d{8})-\d{6} (?P<experimenter>\S+) '
+                     r'(?P<animal>\S+) (?P<ear>\S+) (?P<note>.*) '
+                     r'(?P<experiment>\S+)$')
+
+
 MERGE_PATTERN = \
     r'\g<date>-* ' \
     r'\g<experimenter> ' \
@@ -35,6 +41,13 @@ MERGE_PATTERN = \
 
 
 def cache(f, name=None):
+    '''
+    Cache result of method in the `cache` folder of the recording
+
+    The decorated method accepts an additional keyword argument,
+    `refresh_cache`. If True, the result is recomputed even if cached. See
+    `psi.data.io.result_cache` for details on how results are cached.
+    '''
     import inspect
     s = inspect.signature(f)
     if name is None:
@@ -46,38 +59,13 @@ def cache(f, name=None):
         bound_args.apply_defaults()
         cache_kwargs = dict(bound_args.arguments)
         cache_kwargs.pop('self')
-        string = json.dumps(cache_kwargs, sort_keys=True, allow_nan=True)
-        uuid = hash(string)
-
-        cache_path = self.base_path / 'cache'
-        cache_path.mkdir(parents=True, exist_ok=True)
-        cache_file = cache_path / f'{name}-{uuid}-result.pkl'
-        kwargs_cache_file = cache_path / f'{name}-{uuid}-kwargs.pkl'
-
-        result = None
-        try:
-            if not refresh_cache and cache_file.exists():
-                result = pd.read_pickle(cache_file)
-                with open(kwargs_cache_file, 'wb') as fh:
-                    cache_kwargs = pickle.load(fh)
-                    if cache_kwargs != kwargs:
-                        raise ValueError('Cache is corrupted')
-        except:
-            # Cache is corrupted. Delete it.
-            cache_file.unlink()
-
-        if result is None:
-            result = f(self, *args, **kwargs)
-            result.to_pickle(cache_file)
-            with open(kwargs_cache_file, 'wb') as fh:
-                pickle.dump(kwargs, fh)
-
-        return result
+        compute = partial(f, self, *args, **kwargs)
+        return self.result_cache.get(name, cache_kwargs, compute,
+                                     refresh=refresh_cache)
 
     return wrapper
 
 
-
 class ABRFile(Recording):
     '''
     Wrapper around an ABR file with methods for loading and querying data
@@ -88,6 +76,9 @@ class ABRFile(Recording):
         Path to folder containing ABR data
     '''
 
+    #: Maximum size (in bytes) of the cache of analysis results.
+    cache_max_size = MAX_SIZE
+
     def __init__(self, *args, **kw):
         super().__init__(*args, **kw)
         if 'eeg' not in self.carray_names:
@@ -95,6 +86,19 @@ class ABRFile(Recording):
         if 'erp_metadata' not in self.ctable_names:
             raise ValueError('Missing erp metadata')
 
+    @property
+    @lru_cache(maxsize=MAXSIZE)
+    def result_cache(self):
+        '''
+        Cache of analysis results (e.g., `get_epochs`)
+
+        Cached results are invalidated if the `eeg` or `erp_metadata` data
+        changes. Use `result_cache.get_stats()` for hit/miss statistics.
+        '''
+        sources = [self.base_path / 'eeg', self.base_path / 'erp_metadata']
+        return ResultCache(self.base_path / 'cache', sources,
+                           self.cache_max_size)
+
     def get_setting(self, setting_name):
         '''
         Return value for setting
@@ -161,7 +165,7 @@ class ABRFile(Recording):
             log.debug('EEG for %s is corrupt. Repairing.', self.base_path)
             repair_carray_size(rootdir)
         from .bcolz_tools import BcolzSignal
-        return BcolzSignal(rootdir)
+        return BcolzSignal(rootdir, self.result_cache)
 
     @property
     @lru_cache(maxsize=MAXSIZE)
@@ -217,7 +221,8 @@ class ABRFile(Recording):
                             filter_order=1, offset=-1e-3, duration=10e-3,
                             detrend='constant', pad_duration=10e-3,
                             reject_threshold=None, reject_mode='absolute',
-                            columns='auto', averages=None):
+                            columns='auto', averages=None,
+                            filter_method='epoch'):
         '''
         Extract event-related epochs from filtered EEG
 
@@ -229,7 +234,8 @@ class ABRFile(Recording):
         '''
         fn = self.eeg.get_epochs_filtered
         result = fn(self.erp_metadata, offset, duration, filter_lb, filter_ub,
-                    filter_order, detrend, pad_duration, columns)
+                    filter_order, detrend, pad_duration, columns,
+                    filter_method)
         result = self._apply_reject(result, reject_threshold, reject_mode)
         result = self._apply_n(result, averages)
         return result
@@ -240,7 +246,8 @@ class ABRFile(Recording):
                                      duration=10e-3, detrend='constant',
                                      pad_duration=10e-3,
                                      reject_threshold=None,
-                                     reject_mode='absolute'):
+                                     reject_mode='absolute',
+                                     filter_method='epoch'):
         '''
         Extract random segments from EEG
 
@@ -254,7 +261,7 @@ class ABRFile(Recording):
 
         fn = self.eeg.get_random_segments_filtered
         result = fn(n, offset, duration, filter_lb, filter_ub, filter_order,
-                    detrend, pad_duration)
+                    detrend, pad_duration, filter_method)
         return self._apply_reject(result, reject_threshold, reject_mode)
 
     def _apply_reject(self, result, reject_threshold, reject_mode):
@@ -302,8 +309,9 @@ class ABRFile(Recording):
 
 class ABRSupersetFile:
 
-    def __init__(self, *base_paths):
-        self._fh = [ABRFile(base_path) for base_path in base_paths]
+    def __init__(self, *base_paths, catalog=None):
+        self._fh = [ABRFile(base_path, catalog=catalog)
+                    for base_path in base_paths]
 
     def _merge_results(self, fn_name, *args, merge_on_file=False, **kwargs):
         result_set = [getattr(fh, fn_name)(*args, **kwargs) for fh in self._fh]
@@ -324,20 +332,40 @@ class ABRSupersetFile:
         partialmethod(_merge_results, 'get_random_segments_filtered')
 
     @classmethod
-    def from_pattern(cls, base_path):
+    def from_pattern(cls, base_path, catalog=None):
+        '''
+        Load all ABR experiments matching the experiment in base_path
+
+        If a `RecordingCatalog` is provided, the matching folders are looked
+        up in the catalog rather than on disk.
+        '''
         head, tail = os.path.split(base_path)
         glob_tail = FILE_RE.sub(MERGE_PATTERN, tail)
         glob_pattern = os.path.join(head, glob_tail)
-        folders = glob(glob_pattern)
-        inst = cls(*folders)
+        if catalog is None:
+            folders = glob(glob_pattern)
+        else:
+            folders = catalog.query(pattern=glob_pattern).index.tolist()
+        inst = cls(*folders, catalog=catalog)
         inst._base_path = base_path
         return inst
 
     @classmethod
-    def from_folder(cls, base_path):
-        folders = [os.path.join(base_path, f) \
-                   for f in os.listdir(base_path)]
-        inst = cls(*[f for f in folders if os.path.isdir(f)])
+    def from_folder(cls, base_path, catalog=None):
+        '''
+        Load all ABR experiments in base_path
+
+        If a `RecordingCatalog` is provided, the experiments are looked up in
+        the catalog (which must have been refreshed for base_path) rather than
+        on disk.
+        '''
+        if catalog is None:
+            folders = [os.path.join(base_path, f) \
+                       for f in os.listdir(base_path)]
+            folders = [f for f in folders if os.path.isdir(f)]
+        else:
+            folders = catalog.query(root=base_path).index.tolist()
+        inst = cls(*folders, catalog=catalog)
         inst._base_path = base_path
         return inst
 
@@ -369,7 +397,7 @@ def load(base_path):
         return ABRSupersetFile.from_folder(base_path)
 
 
-def is_abr_experiment(base_path):
+def is_abr_experiment(base_path, catalog=None):
     '''
     Checks if path contains valid ABR data
 
@@ -377,17 +405,25 @@ def is_abr_experiment(base_path):
     ----------
     base_path : string
         Path to folder
+    catalog : {None, RecordingCatalog}
+        If provided and the folder has been indexed, the check is done using
+        the catalog rather than by loading the data.
 
     Returns
     -------
     bool
-        True if path contains valid ABR data, False otherwise. If path doesn't
-        exist, False is returned.
+        True if path contains valid ABR data (i.e., can be loaded as an
+        `ABRFile`), False otherwise. If path doesn't exist, False is returned.
     '''
+    if catalog is not None:
+        names = catalog.get_names(base_path)
+        if names is not None:
+            return 'eeg' in names['carray_names'] \
+                and 'erp_metadata' in names['ctable_names']
     try:
-        load(path)
+        ABRFile(base_path)
         return True
-    except Exception:
+    except ValueError:
         return False
 
 
@@ -399,6 +435,11 @@ filter_docstring = '''
         filter_order : int
             Filter order. Note that the effective order will be double this
             since we use zero-phase filtering.
+        filter_method : {'epoch', 'continuous'}
+            If 'epoch', each epoch is filtered separately. If 'continuous',
+            the entire EEG is filtered once and saved in the `cache` folder so
+            that subsequent calls with the same filter settings only need to
+            read the epochs (see `BcolzSignal.get_filtered`).
 '''.strip()
 
 
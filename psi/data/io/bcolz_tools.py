@@ -10,10 +10,11 @@ import os.path
 
 import bcolz
 import numpy as np
-import pandas as pd
 from scipy import signal
 
 from . import Signal
+from .result_cache import ResultCache
+from .table_format import find_table, get_format
 
 
 # Max size of LRU cache
@@ -44,10 +45,36 @@ def repair_carray_size(path):
         json.dump(sizes, fh)
 
 
-def load_ctable_as_df(path, decode=True, archive=True):
-    csv_path = f'{path}.csv'
-    if os.path.exists(csv_path):
-        return pd.io.parsers.read_csv(csv_path)
+def load_ctable_as_df(path, decode=True, archive=True, archive_format=None):
+    '''
+    Load ctable as a DataFrame
+
+    Decoding a ctable is slow, so a copy of the table is archived next to the
+    ctable the first time it is loaded. Subsequent loads read the archive.
+
+    Parameters
+    ----------
+    path : {str, Path}
+        Path to ctable.
+    decode : bool
+        If True, decode byte strings to unicode.
+    archive : bool
+        If True, save a copy of the table in `archive_format`.
+    archive_format : {None, str}
+        Format to archive table in (see `psi.data.io.table_format`). If None,
+        use the default format (Parquet if pyarrow is installed, CSV
+        otherwise).
+    '''
+    fmt = get_format(archive_format)
+    archive_path = f'{path}{fmt.suffix}'
+    if os.path.exists(archive_path):
+        return fmt.read(archive_path)
+    if not os.path.exists(path):
+        # Only an archive in another format is available.
+        found = find_table(path)
+        if found is not None:
+            return found[1].read(found[0])
+
     table = bcolz.ctable(rootdir=path)
     df = table.todataframe()
     if decode:
@@ -56,14 +83,139 @@ def load_ctable_as_df(path, decode=True, archive=True):
                 df[c] = df[c].str.decode('utf8')
 
     if archive:
-        df.to_csv(csv_path, index=False)
+        fmt.write(df, archive_path, index=False)
     return df
 
 
+def read_chunked_segments(array, indices, samples, chunklen, out):
+    '''
+    Read segments from a chunked array, reading each chunk at most once
+
+    Parameters
+    ----------
+    array : array-like
+        Array supporting slicing along the first axis (e.g., a bcolz carray).
+        Slicing a range that is aligned to a chunk should only require reading
+        that chunk.
+    indices : array of int
+        Index of the first sample of each segment.
+    samples : int
+        Number of samples in each segment.
+    chunklen : int
+        Number of samples in each chunk.
+    out : array
+        Array of shape (len(indices), samples) the segments are written to.
+    '''
+    indices = np.asarray(indices)
+    if len(indices) == 0 or samples == 0:
+        return out
+
+    # Sort the segments by starting sample so that we can find the segments
+    # overlapping each chunk using a binary search.
+    order = np.argsort(indices, kind='stable')
+    starts = indices[order]
+    ends = starts + samples
+    offsets = np.arange(samples)
+
+    # Identify the chunks that need to be read.
+    chunk_lb = starts // chunklen
+    chunk_ub = (ends - 1) // chunklen
+    needed = np.zeros(chunk_ub.max() + 2, dtype='i')
+    np.add.at(needed, chunk_lb, 1)
+    np.add.at(needed, chunk_ub + 1, -1)
+    chunks = np.flatnonzero(np.cumsum(needed) > 0)
+
+    for chunk in chunks:
+        c_lb = chunk * chunklen
+        c_ub = c_lb + chunklen
+        data = array[c_lb:c_ub]
+
+        # Segments that overlap this chunk
+        s_lb = np.searchsorted(starts, c_lb - samples, side='right')
+        s_ub = np.searchsorted(starts, c_ub, side='left')
+        if s_lb == s_ub:
+            continue
+
+        s = np.arange(s_lb, s_ub)
+        inside = (starts[s] >= c_lb) & (ends[s] <= c_lb + len(data))
+
+        # Segments that lie entirely within the chunk can be copied in a
+        # single vectorized gather.
+        i = s[inside]
+        if len(i):
+            out[order[i]] = data[(starts[i] - c_lb)[:, np.newaxis] + offsets]
+
+        # Segments that straddle a chunk boundary get the part that overlaps
+        # this chunk.
+        for i in s[~inside]:
+            lb = max(starts[i], c_lb)
+            ub = min(ends[i], c_lb + len(data))
+            if ub > lb:
+                out[order[i], lb-starts[i]:ub-starts[i]] = \
+                    data[lb-c_lb:ub-c_lb]
+
+    return out
+
+
+def sosfiltfilt_chunked(sos, source, out, chunksize=2**20):
+    '''
+    Zero-phase filter a long 1D signal in chunks
+
+    Equivalent to `scipy.signal.sosfiltfilt(sos, source)` (including the odd
+    extension at either end of the signal), but only `chunksize` samples of
+    the input are in memory at a time. The filter state is carried over from
+    one chunk to the next, so there are no transients at the chunk boundaries.
+    The forward pass is written to `out` and the backward pass then reads
+    `out` in reverse, overwriting it in place.
+
+    Parameters
+    ----------
+    sos : array
+        Second-order sections of filter.
+    source : array-like
+        Signal supporting slicing (e.g., a bcolz carray).
+    out : array
+        Array (e.g., a memory-mapped file) of the same length as `source` that
+        the filtered signal is written to.
+    chunksize : int
+        Number of samples to filter at a time.
+    '''
+    n = len(source)
+    # Same padding as `scipy.signal.sosfiltfilt`.
+    ntaps = 2 * len(sos) + 1
+    ntaps -= min((sos[:, 2] == 0).sum(), (sos[:, 5] == 0).sum())
+    padlen = 3 * ntaps
+    if n <= padlen:
+        raise ValueError(f'Signal must be longer than {padlen} samples')
+    zi = signal.sosfilt_zi(sos)
+
+    head = source[:padlen+1]
+    tail = source[n-padlen-1:]
+    head = 2 * head[0] - head[padlen:0:-1]
+    tail = 2 * tail[-1] - tail[-2::-1]
+
+    # Forward pass.
+    _, state = signal.sosfilt(sos, head, zi=zi * head[0])
+    for lb in range(0, n, chunksize):
+        ub = min(lb + chunksize, n)
+        out[lb:ub], state = signal.sosfilt(sos, source[lb:ub], zi=state)
+    tail, _ = signal.sosfilt(sos, tail, zi=state)
+
+    # Backward pass.
+    tail = tail[::-1]
+    _, state = signal.sosfilt(sos, tail, zi=zi * tail[0])
+    for ub in range(n, 0, -chunksize):
+        lb = max(ub - chunksize, 0)
+        y, state = signal.sosfilt(sos, out[lb:ub][::-1], zi=state)
+        out[lb:ub] = y[::-1]
+    return out
+
+
 class BcolzSignal(Signal):
 
-    def __init__(self, base_path):
+    def __init__(self, base_path, result_cache=None):
         self.base_path = base_path
+        self.result_cache = result_cache
 
     @property
     @functools.lru_cache()
@@ -78,9 +230,69 @@ class BcolzSignal(Signal):
     def duration(self):
         return self.array.shape[-1]/self.fs
 
+    @property
+    def dtype(self):
+        return self.array.dtype
+
     def __getitem__(self, slice):
         return self.array[slice]
 
+    def read_segments(self, indices, samples, out=None):
+        out = self._allocate_segments(indices, samples, out)
+        return read_chunked_segments(self.array, indices, samples,
+                                     self.array.chunklen, out)
+
     @property
     def shape(self):
         return self.array.shape
+
+    def get_filtered(self, filter_lb, filter_ub, filter_order=1):
+        '''
+        Return zero-phase bandpass filtered signal as a `BcolzSignal`
+
+        The filtered signal is computed once and saved as a carray in the
+        result cache (by default, the `cache` folder next to the signal).
+        Subsequent calls with the same filter settings load the saved carray.
+        The saved carray counts toward the size of the cache, so it is
+        removed with the other least recently used results once the cache is
+        full. It is regenerated if the signal has changed since it was
+        filtered.
+        '''
+        base_path = Path(self.base_path)
+        settings = {
+            'filter_lb': filter_lb,
+            'filter_ub': filter_ub,
+            'filter_order': filter_order,
+        }
+        result_cache = self.result_cache
+        if result_cache is None:
+            result_cache = ResultCache(base_path.parent / 'cache', [base_path])
+        arguments = dict(settings, signal=base_path.name)
+        create = functools.partial(self._save_filtered, settings)
+        rootdir = result_cache.get_folder('filtered', arguments, create)
+        return BcolzSignal(rootdir)
+
+    def _save_filtered(self, settings, rootdir):
+        log.debug('Filtering %s with %r', self.base_path, settings)
+        sos = self.get_filter_sos(**settings)
+        tmp_file = rootdir.with_name(rootdir.name + '.npy')
+        n = len(self.array)
+        # Read and write in multiples of the chunk length of the signal so
+        # each compressed chunk is only decompressed once per pass.
+        chunksize = self.array.chunklen * max(1, 2**20 // self.array.chunklen)
+        try:
+            out = np.lib.format.open_memmap(tmp_file, mode='w+',
+                                            dtype=np.double, shape=(n,))
+            sosfiltfilt_chunked(sos, self.array, out, chunksize)
+            filtered = bcolz.carray([], rootdir=str(rootdir), mode='w',
+                                    dtype=np.double, expectedlen=n)
+            for lb in range(0, n, chunksize):
+                filtered.append(out[lb:lb+chunksize])
+            filtered.attrs['fs'] = self.fs
+            for k, v in settings.items():
+                filtered.attrs[k] = v
+            filtered.flush()
+            del out, filtered
+        finally:
+            if tmp_file.exists():
+                tmp_file.unlink()
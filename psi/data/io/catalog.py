@@ -0,0 +1,356 @@
+'''
+Persistent catalog of recordings for fast discovery on slow (e.g., network)
+storage
+
+Opening a `Recording` lists the contents of the folder to discover the signals
+and tables it contains. Finding recordings (e.g., all ABR experiments for an
+animal) requires doing this for every folder in the data archive. The catalog
+stores this information in a SQLite database so that recordings can be found
+(and opened) without touching each folder.
+
+The catalog is refreshed incrementally. Only folders whose modification time
+has changed since they were last indexed are scanned. Note that the
+modification time of a folder only changes when entries are added to or
+removed from the folder (not when data is appended to an existing signal).
+Recordings indexed while still being acquired should therefore be refreshed
+with `force=True`.
+
+Example
+-------
+>>> catalog = RecordingCatalog('catalog.db')
+>>> catalog.refresh('/data/abr')
+>>> sessions = catalog.query(experiment='abr_io', has=['eeg'])
+>>> fh = catalog.open(sessions.index[0], ABRFile)
+'''
+import logging
+log = logging.getLogger(__name__)
+
+import json
+import os
+from pathlib import Path
+import re
+import sqlite3
+import time
+
+import pandas as pd
+
+
+#: Increment when the schema changes. Catalogs created with a different version
+#: are rebuilt.
+SCHEMA_VERSION = 1
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS recording (
+    path TEXT PRIMARY KEY,
+    root TEXT NOT NULL,
+    name TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    indexed REAL NOT NULL,
+    date_time TEXT,
+    experimenter TEXT,
+    experiment TEXT
+);
+CREATE INDEX IF NOT EXISTS recording_root ON recording (root);
+CREATE INDEX IF NOT EXISTS recording_experiment ON recording (experiment);
+CREATE TABLE IF NOT EXISTS item (
+    path TEXT NOT NULL REFERENCES recording (path) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    shape TEXT,
+    dtype TEXT,
+    fs REAL,
+    columns TEXT,
+    PRIMARY KEY (path, name)
+);
+CREATE INDEX IF NOT EXISTS item_name ON item (name);
+'''
+
+
+#: Name of folders created by psiexperiment (e.g., "20200101-120000 bburan
+#: B1 left  abr_io"). The middle fields depend on the launcher.
+FOLDER_RE = re.compile(r'^(?P<date_time>\d{8}-\d{6}) (?P<experimenter>\S+) '
+                       r'(?:.* )?(?P<experiment>\S+)$')
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r') as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def _is_bcolz(path):
+    return os.path.isdir(os.path.join(path, 'meta'))
+
+
+def scan_carray(path):
+    '''
+    Return shape, dtype and sampling rate of carray without opening it
+
+    Values are read from the bcolz metadata files and are None if they cannot
+    be determined.
+    '''
+    sizes = _read_json(os.path.join(path, 'meta', 'sizes'))
+    storage = _read_json(os.path.join(path, 'meta', 'storage'))
+    attrs = _read_json(os.path.join(path, '__attrs__'))
+    return {
+        'shape': sizes.get('shape'),
+        'dtype': storage.get('dtype'),
+        'fs': attrs.get('fs'),
+    }
+
+
+def scan_recording(path):
+    '''
+    Return list of signals and tables in the recording
+
+    Equivalent to the discovery done by `Recording._refresh_names`, but also
+    reads the shape, dtype and sampling rate of each item (from the bcolz
+    metadata files, which is much faster than opening the arrays).
+
+    Returns
+    -------
+    items : list of dict
+        One entry per carray, ctable or CSV table found in the folder.
+    '''
+    items = []
+    with os.scandir(path) as it:
+        entries = sorted(it, key=lambda e: e.name)
+    for entry in entries:
+        if entry.is_dir():
+            if _is_bcolz(entry.path):
+                item = scan_carray(entry.path)
+                item.update({'name': entry.name, 'kind': 'carray'})
+                items.append(item)
+                continue
+            with os.scandir(entry.path) as it:
+                columns = sorted(e.name for e in it
+                                 if e.is_dir() and _is_bcolz(e.path))
+            if columns:
+                column = scan_carray(os.path.join(entry.path, columns[0]))
+                items.append({
+                    'name': entry.name,
+                    'kind': 'ctable',
+                    'shape': column['shape'],
+                    'columns': columns,
+                })
+        elif entry.name.endswith('.csv'):
+            items.append({'name': entry.name[:-4], 'kind': 'csv'})
+    return items
+
+
+class RecordingCatalog:
+    '''
+    SQLite-backed index of the recordings in one or more data folders
+
+    Parameters
+    ----------
+    path : {str, Path}
+        Path to the SQLite database. Created if it does not exist.
+    '''
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._conn = sqlite3.connect(str(self.path))
+        self._conn.execute('PRAGMA foreign_keys = ON')
+        version = self._conn.execute('PRAGMA user_version').fetchone()[0]
+        if version not in (0, SCHEMA_VERSION):
+            log.info('Rebuilding catalog %s (schema changed)', self.path)
+            with self._conn:
+                self._conn.execute('DROP TABLE IF EXISTS item')
+                self._conn.execute('DROP TABLE IF EXISTS recording')
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+            self._conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    def close(self):
+        self._conn.close()
+
+    def refresh(self, root, force=False):
+        '''
+        Index all recordings in the folder
+
+        Parameters
+        ----------
+        root : {str, Path}
+            Folder containing recordings (one subfolder per recording).
+        force : bool
+            If True, rescan all recordings even if their modification time
+            has not changed.
+
+        Returns
+        -------
+        stats : dict
+            Number of recordings added, updated, removed and unchanged.
+        '''
+        root = os.path.abspath(root)
+        indexed = dict(self._conn.execute(
+            'SELECT path, mtime_ns FROM recording WHERE root = ?', (root,)))
+        stats = {'added': 0, 'updated': 0, 'removed': 0, 'unchanged': 0}
+        with self._conn:
+            with os.scandir(root) as it:
+                for entry in it:
+                    if not entry.is_dir():
+                        continue
+                    mtime_ns = entry.stat().st_mtime_ns
+                    last_mtime_ns = indexed.pop(entry.path, None)
+                    if not force and last_mtime_ns == mtime_ns:
+                        stats['unchanged'] += 1
+                        continue
+                    try:
+                        self._index(root, entry.path, entry.name, mtime_ns)
+                    except OSError as e:
+                        log.warning('Unable to index %s: %s', entry.path, e)
+                        continue
+                    key = 'added' if last_mtime_ns is None else 'updated'
+                    stats[key] += 1
+
+            # Anything left over was deleted (or moved).
+            for path in indexed:
+                self._conn.execute('DELETE FROM recording WHERE path = ?',
+                                   (path,))
+                stats['removed'] += 1
+        log.info('Refreshed catalog for %s: %r', root, stats)
+        return stats
+
+    def _index(self, root, path, name, mtime_ns):
+        items = scan_recording(path)
+        m = FOLDER_RE.match(name)
+        info = m.groupdict() if m else {}
+        self._conn.execute('DELETE FROM recording WHERE path = ?', (path,))
+        self._conn.execute(
+            'INSERT INTO recording VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (path, root, name, mtime_ns, time.time(), info.get('date_time'),
+             info.get('experimenter'), info.get('experiment')))
+        for item in items:
+            shape = item.get('shape')
+            columns = item.get('columns')
+            self._conn.execute(
+                'INSERT INTO item VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (path, item['name'], item['kind'],
+                 None if shape is None else json.dumps(shape),
+                 item.get('dtype'), item.get('fs'),
+                 None if columns is None else json.dumps(columns)))
+
+    def query(self, experiment=None, experimenter=None, root=None,
+              pattern=None, has=None, after=None, before=None):
+        '''
+        Find recordings in the catalog
+
+        All criteria are optional and combined with AND.
+
+        Parameters
+        ----------
+        experiment : {None, str}
+            Name of experiment (e.g., 'abr_io').
+        experimenter : {None, str}
+            Name of experimenter.
+        root : {None, str, Path}
+            Folder the recordings are in.
+        pattern : {None, str}
+            Unix-style wildcard the full path of the recording must match.
+        has : {None, list of str}
+            Names of signals or tables the recording must contain.
+        after, before : {None, str}
+            Limit to recordings started in this range, formatted as in the
+            folder name (e.g., '20200101-000000').
+
+        Returns
+        -------
+        recordings : DataFrame
+            Recordings indexed by path.
+        '''
+        where = []
+        params = []
+        if experiment is not None:
+            where.append('experiment = ?')
+            params.append(experiment)
+        if experimenter is not None:
+            where.append('experimenter = ?')
+            params.append(experimenter)
+        if root is not None:
+            where.append('root = ?')
+            params.append(os.path.abspath(root))
+        if pattern is not None:
+            where.append('path GLOB ?')
+            params.append(os.path.abspath(pattern))
+        if after is not None:
+            where.append('date_time >= ?')
+            params.append(after)
+        if before is not None:
+            where.append('date_time < ?')
+            params.append(before)
+        for name in (has or []):
+            where.append('EXISTS (SELECT 1 FROM item WHERE '
+                         'item.path = recording.path AND item.name = ?)')
+            params.append(name)
+
+        sql = 'SELECT * FROM recording'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY path'
+        return pd.read_sql_query(sql, self._conn, params=params,
+                                 index_col='path')
+
+    def get_items(self, path):
+        '''
+        Return signals and tables in the recording
+
+        Returns
+        -------
+        items : DataFrame
+            Kind, shape, dtype, sampling rate and columns (for tables) indexed
+            by name. Empty if the recording is not in the catalog.
+        '''
+        items = pd.read_sql_query(
+            'SELECT name, kind, shape, dtype, fs, columns FROM item '
+            'WHERE path = ? ORDER BY name', self._conn,
+            params=(os.path.abspath(path),), index_col='name')
+        for c in ('shape', 'columns'):
+            items[c] = items[c].map(lambda x: json.loads(x)
+                                    if isinstance(x, str) else None)
+        return items
+
+    def get_names(self, path):
+        '''
+        Return names of carrays, ctables and CSV tables in the recording
+
+        Returns
+        -------
+        names : {None, dict}
+            Sets of names keyed by `carray_names`, `ctable_names` and
+            `ttable_names` (see `Recording`). None if the recording is not in
+            the catalog.
+        '''
+        path = os.path.abspath(path)
+        row = self._conn.execute('SELECT 1 FROM recording WHERE path = ?',
+                                 (path,)).fetchone()
+        if row is None:
+            return None
+        names = {'carray': set(), 'ctable': set(), 'csv': set()}
+        for name, kind in self._conn.execute(
+                'SELECT name, kind FROM item WHERE path = ?', (path,)):
+            names[kind].add(name)
+        return {
+            'carray_names': names['carray'],
+            'ctable_names': names['ctable'],
+            'ttable_names': names['csv'],
+        }
+
+    def open(self, path, cls=None, **kwargs):
+        '''
+        Open recording without listing the contents of the folder
+
+        Parameters
+        ----------
+        path : {str, Path}
+            Path to recording.
+        cls : {None, class}
+            Subclass of `Recording` to use (e.g., `ABRFile`). Defaults to
+            `Recording`.
+        '''
+        if cls is None:
+            from . import Recording as cls
+        return cls(path, catalog=self, **kwargs)
@@ -0,0 +1,364 @@
+'''
+Persistent on-disk cache for the results of analysis methods
+
+Results are keyed by a BLAKE2 hash of the method name and the canonical
+(JSON-encoded, sorted) arguments, so the same call maps to the same cache entry
+across sessions. Each entry also stores a fingerprint (size and modification
+time of the files) of the data it was computed from. If the source data
+changes, the entry is discarded and the result recomputed.
+
+DataFrame results with numeric values are stored as a raw NumPy array (`.npy`)
+that loads without parsing, alongside a small pickle containing the index,
+columns and arguments. Other results are stored in the pickle. Results that
+are too large to load into memory (e.g., a filtered copy of a signal) can be
+stored in a folder instead (see `ResultCache.get_folder`).
+
+The cache is bounded in size. When a new entry pushes the total size over the
+limit, the least recently used entries (based on file modification time, which
+is updated on each hit) are removed.
+'''
+import logging
+log = logging.getLogger(__name__)
+
+import hashlib
+import json
+import os
+from pathlib import Path
+import pickle
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+
+#: Default maximum size (in bytes) of the cache
+MAX_SIZE = 2 * 1024**3
+
+
+def _json_default(obj):
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, Path):
+        return str(obj)
+    raise TypeError(f'Cannot generate cache key for {obj!r}')
+
+
+def canonical_arguments(name, arguments):
+    '''
+    Return canonical string representation of method name and arguments
+    '''
+    return json.dumps([name, arguments], sort_keys=True, allow_nan=True,
+                      default=_json_default)
+
+
+def make_key(string):
+    '''
+    Return stable hash of string (e.g., from `canonical_arguments`)
+    '''
+    return hashlib.blake2b(string.encode('utf8'), digest_size=16).hexdigest()
+
+
+def _get_fingerprint_files(path):
+    '''
+    Return files and folders whose size and modification time identify the
+    contents of path
+    '''
+    if not path.is_dir():
+        return [path]
+    if (path / 'meta').is_dir():
+        # A bcolz carray. The sizes are rewritten whenever data is appended
+        # and the modification time of the data folder changes whenever a
+        # chunk is added or removed, so the (possibly thousands of) chunk
+        # files do not need to be checked.
+        return [path / 'meta' / 'sizes', path / 'data', path / '__attrs__']
+    files = []
+    for child in sorted(path.iterdir()):
+        if child.is_dir():
+            files.extend(_get_fingerprint_files(child))
+        else:
+            files.append(child)
+    return files
+
+
+def fingerprint(paths):
+    '''
+    Return hash of the size and modification time of the files in paths
+
+    For bcolz carrays, only the metadata and the data folder are checked
+    rather than every chunk.
+    '''
+    h = hashlib.blake2b(digest_size=16)
+    for path in paths:
+        for file in _get_fingerprint_files(Path(path)):
+            try:
+                stat = file.stat()
+            except FileNotFoundError:
+                continue
+            h.update(f'{file}|{stat.st_size}|{stat.st_mtime_ns}\n'.encode())
+    return h.hexdigest()
+
+
+class ResultCache:
+    '''
+    Size-bounded LRU cache of results stored in a folder
+
+    Parameters
+    ----------
+    path : {str, Path}
+        Folder to store cache entries in.
+    sources : list of {str, Path}
+        Files or folders containing the data the results are computed from.
+        Entries are invalidated if any of these change.
+    max_size : int
+        Maximum size (in bytes) of the cache.
+    '''
+
+    def __init__(self, path, sources=None, max_size=MAX_SIZE):
+        self.path = Path(path)
+        self.sources = [Path(s) for s in (sources or [])]
+        self.max_size = max_size
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+        self.evicted = 0
+
+    def get_stats(self):
+        '''
+        Return hit/miss statistics and the current size of the cache
+        '''
+        entries = self._get_entries()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidated': self.invalidated,
+            'evicted': self.evicted,
+            'entries': len(entries),
+            'size': sum(e[2] for e in entries),
+        }
+
+    def _get_files(self, name, key):
+        base = self.path / f'{name}-{key}'
+        return base.with_suffix('.pkl'), base.with_suffix('.npy')
+
+    def _get_folder(self, name, key):
+        # Nested two levels down so that `Recording` does not mistake the
+        # cache for a ctable if the folder contains a carray.
+        return self.path / name / key
+
+    def get(self, name, arguments, compute, refresh=False):
+        '''
+        Return cached result, calling `compute` and caching result if needed
+
+        Parameters
+        ----------
+        name : str
+            Name of method.
+        arguments : dict
+            Arguments the result depends on. Must be JSON-serializable.
+        compute : callable
+            Called with no arguments to compute the result on a cache miss.
+        refresh : bool
+            If True, recompute the result even if it is in the cache.
+        '''
+        arguments = canonical_arguments(name, arguments)
+        key = make_key(arguments)
+        source_fingerprint = fingerprint(self.sources)
+        if not refresh:
+            try:
+                result = self._load(name, key, arguments, source_fingerprint)
+                if result is not None:
+                    self.hits += 1
+                    return result
+            except Exception as e:
+                log.warning('Removing corrupt cache entry %s-%s: %s', name,
+                            key, e)
+                self._remove(name, key)
+
+        self.misses += 1
+        result = compute()
+        try:
+            self._save(name, key, arguments, source_fingerprint, result)
+            self._evict()
+        except OSError as e:
+            log.warning('Unable to cache result of %s: %s', name, e)
+        return result
+
+    def get_folder(self, name, arguments, create, refresh=False):
+        '''
+        Return folder containing cached result, calling `create` if needed
+
+        Like `get`, but for results that are saved to a folder rather than
+        loaded into memory. The size of the folder counts toward the size of
+        the cache and the folder is removed when the entry is evicted or
+        invalidated.
+
+        Parameters
+        ----------
+        name : str
+            Name of method.
+        arguments : dict
+            Arguments the result depends on. Must be JSON-serializable.
+        create : callable
+            Called on a cache miss with the path of a folder (which does not
+            exist yet) to save the result to.
+        refresh : bool
+            If True, recreate the result even if it is in the cache.
+        '''
+        arguments = canonical_arguments(name, arguments)
+        key = make_key(arguments)
+        source_fingerprint = fingerprint(self.sources)
+        folder = self._get_folder(name, key)
+        if not refresh:
+            try:
+                md = self._load_metadata(name, key, arguments,
+                                         source_fingerprint)
+                if md is not None and folder.exists():
+                    self.hits += 1
+                    return folder
+            except Exception as e:
+                log.warning('Removing corrupt cache entry %s-%s: %s', name,
+                            key, e)
+
+        self.misses += 1
+        self._remove(name, key)
+        tmp = folder.with_name(folder.name + '.tmp')
+        if tmp.exists():
+            shutil.rmtree(tmp)
+        folder.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            create(tmp)
+            os.replace(tmp, folder)
+        finally:
+            if tmp.exists():
+                shutil.rmtree(tmp)
+
+        size = sum(f.stat().st_size for f in folder.rglob('*') if f.is_file())
+        md = {'arguments': arguments, 'fingerprint': source_fingerprint,
+              'folder_size': size}
+        self._save_metadata(name, key, md)
+        self._evict()
+        return folder
+
+    def _load_metadata(self, name, key, arguments, source_fingerprint):
+        '''
+        Return metadata of entry or None if the entry is missing or invalid
+
+        Marks the entry as recently used.
+        '''
+        md_file, data_file = self._get_files(name, key)
+        if not md_file.exists():
+            return None
+        with md_file.open('rb') as fh:
+            md = pickle.load(fh)
+        if md['arguments'] != arguments:
+            raise ValueError('Arguments do not match')
+        if md['fingerprint'] != source_fingerprint:
+            log.debug('Source data changed. Invalidating %s-%s.', name, key)
+            self.invalidated += 1
+            self._remove(name, key)
+            return None
+
+        # Mark as recently used.
+        now = time.time()
+        for file in (md_file, data_file):
+            if file.exists():
+                os.utime(file, (now, now))
+        return md
+
+    def _load(self, name, key, arguments, source_fingerprint):
+        md = self._load_metadata(name, key, arguments, source_fingerprint)
+        if md is None:
+            return None
+        if 'result' in md:
+            result = md['result']
+        else:
+            data_file = self._get_files(name, key)[1]
+            values = np.load(data_file, allow_pickle=False)
+            result = pd.DataFrame(values, index=md['index'],
+                                  columns=md['columns'])
+        return result
+
+    def _save(self, name, key, arguments, source_fingerprint, result):
+        self.path.mkdir(parents=True, exist_ok=True)
+        md_file, data_file = self._get_files(name, key)
+        md = {'arguments': arguments, 'fingerprint': source_fingerprint}
+        if isinstance(result, pd.DataFrame) \
+                and all(np.issubdtype(d, np.number) for d in result.dtypes):
+            # The data file is written first since the metadata file marks the
+            # entry as complete.
+            tmp = data_file.with_suffix('.npy.tmp')
+            with tmp.open('wb') as fh:
+                np.save(fh, result.values, allow_pickle=False)
+            os.replace(tmp, data_file)
+            md['index'] = result.index
+            md['columns'] = result.columns
+        else:
+            md['result'] = result
+        self._save_metadata(name, key, md)
+
+    def _save_metadata(self, name, key, md):
+        md_file = self._get_files(name, key)[0]
+        tmp = md_file.with_suffix('.pkl.tmp')
+        with tmp.open('wb') as fh:
+            pickle.dump(md, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, md_file)
+
+    def _remove(self, name, key):
+        for file in self._get_files(name, key):
+            try:
+                file.unlink()
+            except FileNotFoundError:
+                pass
+        folder = self._get_folder(name, key)
+        if folder.exists():
+            shutil.rmtree(folder)
+
+    def _get_entries(self):
+        '''
+        Return list of (last used, stem, size) for each entry
+        '''
+        entries = []
+        if not self.path.exists():
+            return entries
+        for md_file in self.path.glob('*.pkl'):
+            data_file = md_file.with_suffix('.npy')
+            try:
+                stat = md_file.stat()
+                size = stat.st_size
+                if data_file.exists():
+                    size += data_file.stat().st_size
+                if self._get_folder(*md_file.stem.rsplit('-', 1)).exists():
+                    # Saved when the folder was created so that the folder
+                    # does not need to be scanned.
+                    with md_file.open('rb') as fh:
+                        size += pickle.load(fh).get('folder_size', 0)
+            except (FileNotFoundError, pickle.UnpicklingError, EOFError):
+                continue
+            entries.append((stat.st_mtime, md_file.stem, size))
+        return entries
+
+    def _evict(self):
+        entries = sorted(self._get_entries())
+        size = sum(e[2] for e in entries)
+        # Always keep the most recent entry, even if it exceeds the limit.
+        for mtime, stem, entry_size in entries[:-1]:
+            if size <= self.max_size:
+                break
+            name, key = stem.rsplit('-', 1)
+            log.debug('Evicting %s from cache', stem)
+            self._remove(name, key)
+            self.evicted += 1
+            size -= entry_size
+
+    def clear(self):
+        '''
+        Remove all entries from the cache
+        '''
+        for _, stem, _ in self._get_entries():
+            self._remove(*stem.rsplit('-', 1))
@@ -0,0 +1,359 @@
+'''
+Multichannel ring buffers in shared memory
+
+The `SharedMemoryStream` sink uses `SharedMemoryRingBuffer` to publish
+continuous inputs while an experiment is running. Other processes on the same
+computer (e.g., online spike sorting or a second monitoring program) can read
+the data using `SharedMemoryStreamReader`. This module only depends on numpy
+and the standard library.
+
+The layout of the shared memory block is:
+
+    * Magic string identifying the block (8 bytes).
+    * Length of the JSON-encoded header (uint64).
+    * JSON-encoded header containing fs, dtype, channel names, capacity (in
+      samples) of the ring buffer and any additional metadata.
+    * Write index of each channel (uint64). This is the total number of samples
+      written to the channel since the buffer was created.
+    * State of the stream (uint64, see `STATE_RUNNING` and `STATE_FINISHED`).
+    * Data (channel x capacity). Sample `i` of a channel is stored at
+      `i % capacity`.
+
+Each channel has a single writer. Data is written before the write index is
+updated, so a reader never sees samples that have not been written yet.
+However, a slow reader can have samples overwritten while reading them.
+`SharedMemoryStreamReader.read` checks for this after copying the data.
+
+Example
+-------
+>>> reader = SharedMemoryStreamReader('psi_eeg')
+>>> while not reader.finished:
+...     data = reader.read_new()
+...     process(data)
+'''
+import json
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+MAGIC = b'PSISHM01'
+HEADER_SIZE = 4096
+ALIGN = 64
+
+STATE_RUNNING = 1
+STATE_FINISHED = 2
+
+# Names of the shared memory blocks created by this process.
+_created = set()
+
+
+class DataOverwrittenError(Exception):
+    '''
+    Requested samples have already been overwritten by the writer
+    '''
+
+
+def _aligned(n):
+    return -(-n // ALIGN) * ALIGN
+
+
+def _get_layout(header):
+    n_channels = len(header['channel_names'])
+    dtype = np.dtype(header['dtype'])
+    index_offset = HEADER_SIZE
+    state_offset = index_offset + 8 * n_channels
+    data_offset = _aligned(state_offset + 8)
+    data_size = n_channels * header['capacity'] * dtype.itemsize
+    return index_offset, state_offset, data_offset, data_offset + data_size
+
+
+class _SharedMemoryBuffer:
+
+    def _map(self, header):
+        n_channels = len(header['channel_names'])
+        index_offset, state_offset, data_offset, _ = _get_layout(header)
+        self.header = header
+        self.fs = header['fs']
+        self.dtype = np.dtype(header['dtype'])
+        self.channel_names = list(header['channel_names'])
+        self.capacity = header['capacity']
+        self.metadata = header.get('metadata', {})
+        buf = self._shm.buf
+        self._write_index = np.ndarray((n_channels,), dtype=np.uint64,
+                                       buffer=buf, offset=index_offset)
+        self._state = np.ndarray((1,), dtype=np.uint64, buffer=buf,
+                                 offset=state_offset)
+        self._data = np.ndarray((n_channels, self.capacity), dtype=self.dtype,
+                                buffer=buf, offset=data_offset)
+
+    def get_channel_index(self, channel):
+        if isinstance(channel, str):
+            return self.channel_names.index(channel)
+        return channel
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def write_index(self):
+        '''
+        Number of samples written to each channel
+        '''
+        return self._write_index.astype(np.int64)
+
+    @property
+    def finished(self):
+        return int(self._state[0]) == STATE_FINISHED
+
+    def close(self):
+        # The numpy arrays must be released before the shared memory can be
+        # closed.
+        self._write_index = self._state = self._data = None
+        self._shm.close()
+
+
+class SharedMemoryRingBuffer(_SharedMemoryBuffer):
+    '''
+    Creates and writes to a multichannel ring buffer in shared memory
+
+    Parameters
+    ----------
+    name : str
+        Name of the shared memory block. Readers use this name to connect.
+    fs : float
+        Sampling rate of the data.
+    channel_names : list of str
+        Name of each channel.
+    capacity : int
+        Number of samples per channel held by the buffer.
+    dtype : dtype
+        Data type of samples.
+    metadata : dict
+        Additional information to store in the header. Must be JSON
+        serializable.
+    '''
+
+    def __init__(self, name, fs, channel_names, capacity, dtype='float64',
+                 metadata=None):
+        header = {
+            'fs': float(fs),
+            'dtype': np.dtype(dtype).str,
+            'channel_names': list(channel_names),
+            'capacity': int(capacity),
+            'metadata': metadata or {},
+        }
+        encoded = json.dumps(header).encode('utf8')
+        if len(encoded) > (HEADER_SIZE - 16):
+            raise ValueError('Header for shared memory stream is too large')
+
+        size = _get_layout(header)[-1]
+        self._shm = shared_memory.SharedMemory(name=name, create=True,
+                                               size=size)
+        _created.add(self._shm.name)
+        buf = self._shm.buf
+        buf[8:16] = np.uint64(len(encoded)).tobytes()
+        buf[16:16+len(encoded)] = encoded
+        self._map(header)
+        self._write_index[:] = 0
+        self._state[0] = STATE_RUNNING
+
+        # Written last so that readers do not attach to a partially
+        # initialized block.
+        buf[:8] = MAGIC
+
+    def write(self, channel, data):
+        '''
+        Append data to channel
+
+        Parameters
+        ----------
+        channel : {int, str}
+            Index or name of channel.
+        data : 1D array
+            Samples to append.
+        '''
+        i = self.get_channel_index(channel)
+        data = np.asarray(data)
+        if data.ndim != 1:
+            raise ValueError('Data must be one-dimensional')
+        n = len(data)
+        if n > self.capacity:
+            # Only the most recent samples will fit.
+            self._write(i, self._write_index[i] + n - self.capacity,
+                        data[-self.capacity:])
+        else:
+            self._write(i, self._write_index[i], data)
+        self._write_index[i] += np.uint64(n)
+
+    def _write(self, i, start, data):
+        lb = int(start) % self.capacity
+        n = min(len(data), self.capacity-lb)
+        self._data[i, lb:lb+n] = data[:n]
+        self._data[i, :len(data)-n] = data[n:]
+
+    def set_finished(self):
+        '''
+        Indicate to readers that no more data will be written
+        '''
+        self._state[0] = STATE_FINISHED
+
+    def unlink(self):
+        _created.discard(self._shm.name)
+        self._shm.unlink()
+
+
+class SharedMemoryStreamReader(_SharedMemoryBuffer):
+    '''
+    Reads data published by `SharedMemoryRingBuffer` from another process
+
+    Parameters
+    ----------
+    name : str
+        Name of the shared memory block.
+    '''
+
+    def __init__(self, name):
+        self._shm = _attach(name)
+        buf = self._shm.buf
+        if bytes(buf[:8]) != MAGIC:
+            self._shm.close()
+            raise IOError('{} is not a psiexperiment stream'.format(name))
+        n = int(np.frombuffer(buf[8:16], dtype=np.uint64)[0])
+        header = json.loads(bytes(buf[16:16+n]).decode('utf8'))
+        self._map(header)
+
+        #: Index of the next sample returned by `read_new`.
+        self.cursor = 0
+
+        #: Number of samples skipped by `read_new` because they were
+        #: overwritten before they could be read.
+        self.samples_lost = 0
+
+    def get_available(self):
+        '''
+        Return range of samples (start, end) available for all channels
+        '''
+        write_index = self.write_index
+        lb = max(0, int(write_index.max())-self.capacity)
+        return lb, int(write_index.min())
+
+    def get_views(self, channel, start, end):
+        '''
+        Return views (without copying) of samples in the buffer
+
+        Since the data is a ring buffer, the range may be split in two.
+        Samples may be overwritten by the writer while in use. Check
+        `is_valid(start)` when done with the views to ensure the data was not
+        overwritten.
+
+        Returns
+        -------
+        views : list of arrays
+            One or two views that, concatenated, contain the samples.
+        '''
+        i = self.get_channel_index(channel)
+        self._check_range(start, end)
+        lb = start % self.capacity
+        n = end - start
+        if lb + n <= self.capacity:
+            return [self._data[i, lb:lb+n]]
+        return [self._data[i, lb:], self._data[i, :lb+n-self.capacity]]
+
+    def is_valid(self, start):
+        '''
+        True if the sample `start` has not been overwritten
+        '''
+        return start >= (int(self.write_index.max()) - self.capacity)
+
+    def read(self, start, end, out=None):
+        '''
+        Copy samples from all channels
+
+        Parameters
+        ----------
+        start : int
+            First sample to read.
+        end : int
+            Sample after the last sample to read.
+        out : {None, array}
+            Array (channel x samples) to copy the data to.
+
+        Returns
+        -------
+        data : array
+            Data (channel x samples).
+
+        Raises
+        ------
+        DataOverwrittenError
+            If the requested data was overwritten before it was read.
+        '''
+        self._check_range(start, end)
+        if out is None:
+            out = np.empty((len(self.channel_names), end-start),
+                           dtype=self.dtype)
+        for i in range(len(self.channel_names)):
+            o = 0
+            for view in self.get_views(i, start, end):
+                out[i, o:o+len(view)] = view
+                o += len(view)
+        if not self.is_valid(start):
+            raise DataOverwrittenError('Data was overwritten while reading')
+        return out
+
+    def read_latest(self, n):
+        '''
+        Copy the most recent n samples from all channels
+        '''
+        _, end = self.get_available()
+        return self.read(max(0, end-n), end)
+
+    def read_new(self):
+        '''
+        Copy samples acquired since the last call
+
+        If samples were overwritten before they could be read, they are
+        skipped and counted in `samples_lost`.
+        '''
+        while True:
+            lb, end = self.get_available()
+            if self.cursor < lb:
+                self.samples_lost += lb - self.cursor
+                self.cursor = lb
+            if self.cursor >= end:
+                return np.empty((len(self.channel_names), 0), dtype=self.dtype)
+            try:
+                data = self.read(self.cursor, end)
+                self.cursor = end
+                return data
+            except DataOverwrittenError:
+                continue
+
+    def _check_range(self, start, end):
+        if start > end:
+            raise ValueError('Start must be less than end')
+        if end > int(self.write_index.min()):
+            raise ValueError('Data has not been acquired yet')
+        if not self.is_valid(start):
+            raise DataOverwrittenError('Data has already been overwritten')
+
+
+def _attach(name):
+    try:
+        # Python 3.13 and newer. Prevents the resource tracker of this process
+        # from removing the shared memory when the reader exits.
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    shm = shared_memory.SharedMemory(name=name)
+    if shm.name in _created:
+        # The block is owned (and registered) by a writer in this process.
+        return shm
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    except Exception:
+        pass
+    return shm
@@ -1,38 +1,200 @@
 import argparse
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import partial
 from glob import glob
 import os.path
+import time
+import traceback
 
 import numpy as np
 import pandas as pd
 
 from psi.data.io import abr
+from psi.data.io.catalog import scan_carray
+from psi.data.io.table_format import get_format
 
 
 columns = ['frequency', 'level', 'polarity']
 
 
-def process_folder(folder, filter_settings=None):
+def process_folder(folder, filter_settings=None, jobs=1, memory_budget=None,
+                   file_format='csv'):
     glob_pattern = os.path.join(folder, '*abr*')
     filenames = glob(glob_pattern)
-    process_files(filenames, filter_settings=filter_settings)
+    return process_files(filenames, filter_settings=filter_settings,
+                         jobs=jobs, memory_budget=memory_budget,
+                         file_format=file_format)
 
 
 def process_files(filenames, offset=-0.001, duration=0.01,
-                  filter_settings=None, reprocess=False):
+                  filter_settings=None, reprocess=False, jobs=1,
+                  memory_budget=None, file_format='csv'):
+    '''
+    Process multiple ABR files
+
+    Errors are isolated to the file that raised them. The remaining files are
+    still processed and the errors are included in the summary.
+
+    Parameters
+    ----------
+    filenames : list of str
+        Files to process.
+    offset, duration, filter_settings, reprocess, file_format
+        See `process_file`.
+    jobs : int
+        Number of files to process in parallel (each in a separate process).
+    memory_budget : {None, float}
+        Maximum memory (in bytes) to use for files being processed in
+        parallel. The memory required by each file is estimated using the
+        uncompressed size of the EEG data. A file is only started if it fits
+        in the remaining budget (at least one file is always processed, even
+        if it exceeds the budget). If None, there is no limit.
+
+    Returns
+    -------
+    summary : DataFrame
+        Status ('processed', 'skipped' or 'error'), error message and
+        processing time for each file.
+    '''
+    # Files that are already processed are skipped up front if this can be
+    # determined without opening them. Otherwise, `process_file` skips them.
+    results = []
+    pending = []
     for filename in filenames:
-        try:
-            processed = process_file(filename, offset, duration,
-                                     filter_settings, reprocess)
-            if processed:
-                print(f'\nProcessed {filename}\n')
-            else:
-                print('*', end='', flush=True)
-        except Exception as e:
-            raise
-            print(f'\nError processing {filename}\n{e}\n')
-
-
-def _get_file_template(fh, offset, duration, filter_settings, suffix=None):
+        if not reprocess and _is_processed(filename, offset, duration,
+                                           filter_settings, file_format):
+            results.append(_get_result(filename, 'skipped'))
+        else:
+            pending.append(filename)
+
+    task = partial(_process_file_task, offset=offset, duration=duration,
+                   filter_settings=filter_settings, reprocess=reprocess,
+                   file_format=file_format)
+    for result in map_files(task, pending, jobs, memory_budget):
+        if result['status'] == 'processed':
+            print(f'\nProcessed {result["filename"]}\n')
+        elif result['status'] == 'skipped':
+            print('*', end='', flush=True)
+        else:
+            print(f'\nError processing {result["filename"]}\n'
+                  f'{result["error"]}\n')
+        results.append(result)
+
+    summary = pd.DataFrame(results, columns=['filename', 'status', 'error',
+                                             'elapsed'])
+    print_summary(summary)
+    return summary
+
+
+def print_summary(summary):
+    counts = summary['status'].value_counts()
+    print(f'\n{len(summary)} files: '
+          f'{counts.get("processed", 0)} processed, '
+          f'{counts.get("skipped", 0)} skipped, '
+          f'{counts.get("error", 0)} errors '
+          f'({summary["elapsed"].sum():.1f} sec processing time)')
+    for row in summary.query('status == "error"').itertuples():
+        print(f'\tError processing {row.filename}')
+
+
+def _is_processed(filename, offset, duration, filter_settings, file_format):
+    # This is only a quick check of the files that exist. The filenames for
+    # the saved filter settings depend on the settings, which requires loading
+    # the file. In that case, `process_file` checks in the worker process.
+    if filter_settings == 'saved':
+        return False
+    t = _get_file_template(filename, offset, duration, filter_settings,
+                           file_format=file_format, verbose=False)
+    file_template = os.path.join(filename, t)
+    names = ['individual waveforms', 'average waveforms', 'number of epochs',
+             'reject ratio']
+    return all(os.path.exists(file_template.format(n)) for n in names)
+
+
+def _get_result(filename, status, error=None, elapsed=0):
+    return {'filename': filename, 'status': status, 'error': error,
+            'elapsed': elapsed}
+
+
+def _process_file_task(filename, **kwargs):
+    start = time.perf_counter()
+    try:
+        processed = process_file(filename, **kwargs)
+        status, error = ('processed' if processed else 'skipped'), None
+    except Exception:
+        status, error = 'error', traceback.format_exc()
+    return _get_result(filename, status, error, time.perf_counter()-start)
+
+
+def estimate_memory(filename):
+    '''
+    Estimate memory (in bytes) required to process ABR file
+
+    Based on the uncompressed size of the EEG data, which is read from the
+    bcolz metadata (without opening the file). Returns 0 if the size cannot
+    be determined.
+    '''
+    info = scan_carray(os.path.join(filename, 'eeg'))
+    if info['shape'] is None or info['dtype'] is None:
+        return 0
+    try:
+        itemsize = np.dtype(info['dtype']).itemsize
+    except TypeError:
+        return 0
+    return int(np.prod(info['shape'])) * itemsize
+
+
+def map_files(fn, filenames, jobs=1, memory_budget=None,
+              estimate=estimate_memory):
+    '''
+    Call `fn` for each file, yielding the results as they are available
+
+    If `jobs` is greater than 1, files are processed in parallel using a
+    process pool and results are yielded in order of completion. `fn` must be
+    picklable and should handle its own errors.
+
+    Files are started in order. If `memory_budget` is provided, a file is not
+    started until the estimated memory of the files currently being processed
+    plus that of the file fits within the budget. The memory required by each
+    file is estimated (using `estimate`) when it is next in line to start.
+    '''
+    if jobs <= 1:
+        for filename in filenames:
+            yield fn(filename)
+        return
+
+    pending = deque(filenames)
+    sizes = {}
+    running = {}
+    in_use = 0
+    with ProcessPoolExecutor(jobs) as executor:
+        while pending or running:
+            while pending and len(running) < jobs:
+                if pending[0] not in sizes:
+                    sizes[pending[0]] = 0 if memory_budget is None \
+                        else estimate(pending[0])
+                size = sizes[pending[0]]
+                if running and memory_budget is not None \
+                        and (in_use + size) > memory_budget:
+                    break
+                filename = pending.popleft()
+                running[executor.submit(fn, filename)] = filename
+                in_use += size
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                filename = running.pop(future)
+                in_use -= sizes[filename]
+                try:
+                    yield future.result()
+                except Exception:
+                    # The worker process died (e.g., out of memory).
+                    error = traceback.format_exc()
+                    yield _get_result(filename, 'error', error)
+
+
+def _get_file_template(fh, offset, duration, filter_settings, suffix=None,
+                       file_format='csv', verbose=True):
     base_string = f'ABR {offset*1e3:.1f}ms to {(offset+duration)*1e3:.1f}ms'
     if filter_settings == 'saved':
         settings = _get_filter(fh)
@@ -60,8 +222,9 @@ def _get_file_template(fh, offset, duration, filter_settings, suffix=None):
     if suffix is not None:
         file_string = f'{file_string} {suffix}'
 
-    print(file_string)
-    return f'{file_string} {{}}.csv'
+    if verbose:
+        print(file_string)
+    return f'{file_string} {{}}{get_format(file_format).suffix}'
 
 
 def _get_filter(fh):
@@ -117,8 +280,10 @@ def _match_epochs(*epochs):
               matched.groupby('dataset', group_keys=False)]
 
 
-def is_processed(filename, offset, duration, filter_settings, suffix=None):
-    t = _get_file_template(filename, offset, duration, filter_settings, suffix)
+def is_processed(filename, offset, duration, filter_settings, suffix=None,
+                 file_format='csv'):
+    t = _get_file_template(filename, offset, duration, filter_settings, suffix,
+                           file_format)
     file_template = os.path.join(filename, t)
     raw_epoch_file = file_template.format('individual waveforms')
     mean_epoch_file = file_template.format('average waveforms')
@@ -129,7 +294,8 @@ def is_processed(filename, offset, duration, filter_settings, suffix=None):
 
 
 def process_files_matched(filenames, offset, duration, filter_settings,
-                          reprocess=True, suffix=None):
+                          reprocess=True, suffix=None, file_format='csv'):
+    fmt = get_format(file_format)
     epochs = []
     for filename in filenames:
         fh = abr.load(filename)
@@ -141,7 +307,8 @@ def process_files_matched(filenames, offset, duration, filter_settings,
     epochs = _match_epochs(*epochs)
     for filename, e in zip(filenames, epochs):
         # Generate the filenames
-        t = _get_file_template(fh, offset, duration, filter_settings, suffix)
+        t = _get_file_template(fh, offset, duration, filter_settings, suffix,
+                               file_format)
         file_template = os.path.join(filename, t)
         raw_epoch_file = file_template.format('individual waveforms')
         mean_epoch_file = file_template.format('average waveforms')
@@ -157,18 +324,18 @@ def process_files_matched(filenames, offset, duration, filter_settings,
         epoch_n = e.groupby(columns[:-1]).size()
         epoch_mean = e.groupby(columns).mean().groupby(columns[:-1]).mean()
 
-        # Write the data to CSV files
-        epoch_n.to_csv(n_epoch_file, header=True)
+        # Write the data to files
+        fmt.write(epoch_n.to_frame(), n_epoch_file)
         epoch_mean.columns.name = 'time'
-        epoch_mean.T.to_csv(mean_epoch_file)
+        fmt.write_epochs(epoch_mean, mean_epoch_file)
         e.columns.name = 'time'
-        e.T.to_csv(raw_epoch_file)
+        fmt.write_epochs(e, raw_epoch_file)
 
 
 def process_file(filename, offset, duration, filter_settings, reprocess=False,
-                 n_epochs='auto', suffix=None):
+                 n_epochs='auto', suffix=None, file_format='csv'):
     '''
-    Extract ABR epochs, filter and save result to CSV files
+    Extract ABR epochs, filter and save result to CSV (or Parquet) files
 
     Parameters
     ----------
@@ -199,13 +366,19 @@ def process_file(filename, offset, duration, filter_settings, reprocess=False,
         use.
     suffix : {None, str}
         Suffix to use when creating save filenames.
+    file_format : {'csv', 'parquet'}
+        Format to save results in (see `psi.data.io.table_format`). In CSV
+        files, the waveforms are transposed (one column per epoch) whereas in
+        Parquet files there is one row per epoch.
     '''
+    fmt = get_format(file_format)
     fh = abr.load(filename)
     if len(fh.erp_metadata) == 0:
         raise IOError('No data in file')
 
     # Generate the filenames
-    t = _get_file_template(fh, offset, duration, filter_settings, suffix)
+    t = _get_file_template(fh, offset, duration, filter_settings, suffix,
+                           file_format)
     file_template = os.path.join(filename, t)
     raw_epoch_file = file_template.format('individual waveforms')
     mean_epoch_file = file_template.format('average waveforms')
@@ -240,24 +413,48 @@ def process_file(filename, offset, duration, filter_settings, reprocess=False,
     epoch_mean = epochs.groupby(columns).mean() \
         .groupby(columns[:-1]).mean()
 
-    # Write the data to CSV files
+    # Write the data to files
     epoch_reject_ratio.name = 'epoch_reject_ratio'
-    epoch_reject_ratio.to_csv(reject_ratio_file, header=True)
+    fmt.write(epoch_reject_ratio.to_frame(), reject_ratio_file)
     epoch_reject_ratio.name = 'epoch_n'
     epoch_n = epochs.groupby(columns[:-1]).size()
-    epoch_n.to_csv(n_epoch_file, header=True)
+    fmt.write(epoch_n.to_frame(), n_epoch_file)
     epoch_mean.columns.name = 'time'
-    epoch_mean.T.to_csv(mean_epoch_file)
+    fmt.write_epochs(epoch_mean, mean_epoch_file)
     epochs.columns.name = 'time'
-    epochs.T.to_csv(raw_epoch_file)
+    fmt.write_epochs(epochs, raw_epoch_file)
     return True
 
 
+def add_jobs_arguments(parser):
+    parser.add_argument('--jobs', type=int,
+                        help='Number of files to process in parallel',
+                        default=1)
+    parser.add_argument('--memory-budget', type=float,
+                        help='Memory (in GB) available to parallel jobs',
+                        default=None)
+
+
+def add_format_argument(parser):
+    parser.add_argument('--format', type=str, choices=['csv', 'parquet'],
+                        help='Format of output files', default='csv')
+
+
+def get_memory_budget(args):
+    if args.memory_budget is None:
+        return None
+    return args.memory_budget * 1024**3
+
+
 def main_auto():
     parser = argparse.ArgumentParser('Filter and summarize ABR files in folder')
     parser.add_argument('folder', type=str, help='Folder containing ABR data')
+    add_jobs_arguments(parser)
+    add_format_argument(parser)
     args = parser.parse_args()
-    process_folder(args.folder, filter_settings='saved')
+    process_folder(args.folder, filter_settings='saved', jobs=args.jobs,
+                   memory_budget=get_memory_budget(args),
+                   file_format=args.format)
 
 
 def main():
@@ -283,6 +480,8 @@ def main():
     parser.add_argument('--reprocess',
                         help='Redo existing results',
                         action='store_true')
+    add_jobs_arguments(parser)
+    add_format_argument(parser)
     args = parser.parse_args()
 
     if args.filter_lb is not None or args.filter_ub is not None:
@@ -294,7 +493,8 @@ def main():
     else:
         filter_settings = None
     process_files(args.filenames, args.offset, args.duration, filter_settings,
-                  args.reprocess)
+                  args.reprocess, args.jobs, get_memory_budget(args),
+                  args.format)
 
 
 def main_gui():
@@ -0,0 +1,302 @@
+'''
+Formats for saving tables (e.g., ctable metadata) and epochs to disk
+
+Two formats are provided:
+
+* CSV, which is readable by any program but slow to parse. Epochs are saved
+  transposed (one column per epoch) for compatibility with existing analysis
+  programs.
+* Parquet (requires `pyarrow`), a compressed columnar format that loads
+  without parsing text. The index (including a MultiIndex) and non-string
+  column labels (e.g., the time of each sample in an epoch) are restored when
+  reading, and a subset of the columns can be loaded without reading the
+  entire file.
+
+Additional formats can be added using `register_format`.
+
+Example
+-------
+>>> fmt = get_format('parquet')
+>>> fmt.write_epochs(epochs, 'epochs.parquet')
+>>> epochs = fmt.read_epochs('epochs.parquet', columns=slice(0, 5e-3))
+'''
+import logging
+log = logging.getLogger(__name__)
+
+import importlib.util
+import json
+from pathlib import Path
+
+import pandas as pd
+
+
+class TableFormat:
+    '''
+    Base class for table formats
+
+    Subclasses must implement `write` and `read`. The default implementation
+    of `write_epochs` and `read_epochs` saves epochs as a regular table.
+    '''
+
+    #: Name used to look up format (see `get_format`).
+    name = None
+
+    #: File extension (including leading period).
+    suffix = None
+
+    def is_available(self):
+        '''
+        Return True if the libraries required by the format are installed
+        '''
+        return True
+
+    def write(self, df, path, index=True, dictionary_columns=None):
+        '''
+        Save DataFrame to path
+
+        Parameters
+        ----------
+        df : DataFrame
+            Data to save.
+        path : {str, Path}
+            Filename.
+        index : bool
+            If True, save the index.
+        dictionary_columns : {None, list of str}
+            Columns containing a small number of unique values (e.g.,
+            experiment settings) to dictionary-encode. These are loaded as
+            categorical columns. Ignored by formats that do not support
+            encoding.
+        '''
+        raise NotImplementedError
+
+    def read(self, path, columns=None, index_col=None):
+        '''
+        Load DataFrame from path
+
+        Parameters
+        ----------
+        path : {str, Path}
+            Filename.
+        columns : {None, list}
+            Columns to load. If None, load all columns.
+        index_col : {None, str, list of str}
+            Columns to use as the index. Only needed for formats that do not
+            store the index.
+        '''
+        raise NotImplementedError
+
+    def write_epochs(self, epochs, path):
+        '''
+        Save epochs (one row per epoch, one column per sample) to path
+        '''
+        self.write(epochs, path)
+
+    def read_epochs(self, path, columns=None):
+        '''
+        Load epochs saved by `write_epochs`
+
+        Parameters
+        ----------
+        columns : {None, list, slice}
+            Times to load. Can be a list of times or a slice (e.g.,
+            `slice(0, 5e-3)` to load samples from 0 to 5 msec, inclusive).
+        '''
+        epochs = self.read(path)
+        if columns is not None:
+            epochs = epochs.loc[:, columns]
+        return epochs
+
+
+class CSVFormat(TableFormat):
+
+    name = 'csv'
+    suffix = '.csv'
+
+    def write(self, df, path, index=True, dictionary_columns=None):
+        df.to_csv(path, index=index)
+
+    def read(self, path, columns=None, index_col=None):
+        if columns is not None and index_col is not None:
+            index_col = [index_col] if isinstance(index_col, str) \
+                else list(index_col)
+            columns = index_col + list(columns)
+        return pd.read_csv(path, usecols=columns, index_col=index_col)
+
+    def write_epochs(self, epochs, path):
+        epochs.T.to_csv(path)
+
+    def read_epochs(self, path, columns=None):
+        # The epochs are transposed, so there is one header row for each level
+        # of the epoch index. These are followed by a row containing only the
+        # name of the sample index ('time').
+        with open(path) as fh:
+            for n_header, line in enumerate(fh):
+                cells = line.rstrip('\r\n').split(',')
+                if cells[0] and not any(cells[1:]):
+                    break
+            else:
+                n_header = 1
+        header = list(range(n_header))
+        epochs = pd.read_csv(path, header=header, index_col=0).T
+
+        # Header values are read as strings. Convert the numeric ones back.
+        if isinstance(epochs.index, pd.MultiIndex):
+            levels = [_to_numeric(level) for level in epochs.index.levels]
+            epochs.index = epochs.index.set_levels(levels)
+        else:
+            epochs.index = _to_numeric(epochs.index)
+        if columns is not None:
+            epochs = epochs.loc[:, columns]
+        return epochs
+
+
+def _to_numeric(index):
+    try:
+        return pd.to_numeric(index)
+    except (TypeError, ValueError):
+        return index
+
+
+class ParquetFormat(TableFormat):
+
+    name = 'parquet'
+    suffix = '.parquet'
+
+    #: Key in the Parquet schema metadata used to store non-string column
+    #: labels.
+    metadata_key = b'psi'
+
+    def is_available(self):
+        return importlib.util.find_spec('pyarrow') is not None
+
+    def write(self, df, path, index=True, dictionary_columns=None):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # Parquet requires string column names. Save the original labels so
+        # they can be restored.
+        metadata = None
+        if not all(isinstance(c, str) for c in df.columns):
+            metadata = {
+                'columns': df.columns.tolist(),
+                'columns_name': df.columns.name,
+            }
+            df = df.set_axis([str(c) for c in df.columns], axis=1)
+
+        use_dictionary = True
+        if dictionary_columns is not None:
+            df = df.astype({c: 'category' for c in dictionary_columns})
+            use_dictionary = list(dictionary_columns)
+
+        table = pa.Table.from_pandas(df, preserve_index=index)
+        if metadata is not None:
+            schema_metadata = dict(table.schema.metadata or {})
+            schema_metadata[self.metadata_key] = \
+                json.dumps(metadata).encode('utf8')
+            table = table.replace_schema_metadata(schema_metadata)
+        pq.write_table(table, str(path), use_dictionary=use_dictionary)
+
+    def _get_labels(self, schema):
+        metadata = (schema.metadata or {}).get(self.metadata_key)
+        if metadata is None:
+            return None
+        return json.loads(metadata.decode('utf8'))
+
+    def read(self, path, columns=None, index_col=None):
+        import pyarrow.parquet as pq
+        labels = self._get_labels(pq.read_schema(str(path)))
+        if columns is not None and labels is not None:
+            columns = [str(c) for c in columns]
+        table = pq.read_table(str(path), columns=columns,
+                              use_pandas_metadata=True)
+        df = table.to_pandas()
+        if labels is not None:
+            mapping = {str(c): c for c in labels['columns']}
+            df.columns = pd.Index([mapping[c] for c in df.columns],
+                                  name=labels['columns_name'])
+        if index_col is not None:
+            df = df.set_index(index_col)
+        return df
+
+    def read_epochs(self, path, columns=None):
+        import pyarrow.parquet as pq
+        if isinstance(columns, slice):
+            # Select the columns to load from the saved labels so that only
+            # the requested samples are read from disk.
+            labels = self._get_labels(pq.read_schema(str(path)))
+            if labels is not None:
+                times = pd.Index(labels['columns'])
+                lb, ub = times.slice_locs(columns.start, columns.stop)
+                columns = times[lb:ub].tolist()
+        return self.read(path, columns=columns)
+
+
+FORMATS = {}
+
+
+def register_format(fmt):
+    '''
+    Make format available to `get_format`
+    '''
+    FORMATS[fmt.name] = fmt
+
+
+register_format(CSVFormat())
+register_format(ParquetFormat())
+
+
+def get_default_format():
+    '''
+    Return name of default format (Parquet if pyarrow is installed)
+    '''
+    if FORMATS['parquet'].is_available():
+        return 'parquet'
+    return 'csv'
+
+
+def get_format(name=None):
+    '''
+    Return format by name
+
+    Parameters
+    ----------
+    name : {None, str}
+        Name of format. If None, use the default format (see
+        `get_default_format`).
+    '''
+    if name is None:
+        name = get_default_format()
+    try:
+        return FORMATS[name]
+    except KeyError:
+        raise ValueError(f'Unsupported table format {name}')
+
+
+def find_table(path):
+    '''
+    Find table saved in any of the registered formats
+
+    Parameters
+    ----------
+    path : {str, Path}
+        Filename without extension.
+
+    Returns
+    -------
+    result : {None, tuple of (Path, TableFormat)}
+        Filename and format of the table (if found). If the table has been
+        saved in more than one format, the default format is preferred.
+        Formats that cannot be loaded (e.g., Parquet if pyarrow is not
+        installed) are ignored.
+    '''
+    path = Path(path)
+    preferred = get_format()
+    formats = [preferred] + [f for f in FORMATS.values() if f is not preferred]
+    for fmt in formats:
+        if not fmt.is_available():
+            continue
+        filename = path.with_name(path.name + fmt.suffix)
+        if filename.exists():
+            return filename, fmt
+    return None
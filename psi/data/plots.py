@@ -19,9 +19,10 @@ from enaml.colors import parse_color
 from enaml.core.api import Looper, Declarative, d_, d_func
 from enaml.qt.QtGui import QColor
 
-from psi.util import SignalBuffer, ConfigurationException
+from psi.util import EpochAccumulator, SignalBuffer, ConfigurationException
 from psi.core.enaml.api import load_manifests, PSIContribution
 from psi.controller.calibration import util
+from psi.controller.input import SpectralAverage
 from psi.context.context_item import ContextMeta
 
 
@@ -582,12 +583,26 @@ class FFTChannelPlot(ChannelPlot):
         return self.source_name + '_fft_plot'
 
     def _observe_source(self, event):
-        if self.source is not None:
+        if self.source is None:
+            return
+        if isinstance(self.source, SpectralAverage):
+            # Spectrum has already been computed by the source.
+            self.source.add_callback(self._append_spectrum)
+        else:
             self.source.add_callback(self._append_data)
             self.source.observe('fs', self._cache_x)
             self._update_buffer()
             self._cache_x()
 
+    def _append_spectrum(self, data):
+        if data is Ellipsis:
+            return
+        if self.source.mode == 'csd':
+            data = util.csd_to_psd(data)
+        frequency = self.source.frequency
+        spl = self.source.calibration.get_spl(frequency, data)
+        deferred_call(self.plot.setData, np.log10(frequency), spl)
+
     def _update_buffer(self, event=None):
         self._buffer = SignalBuffer(self.source.fs, self.time_span)
 
@@ -799,8 +814,28 @@ class EpochGroupMixin(GroupMixin):
 
     duration = Float()
 
+    #: How epochs are accumulated for each group. If 'sum', a running sum is
+    #: kept. If 'welford', a running mean and variance is kept. If 'list', all
+    #: epochs are kept in memory and the mean is computed on each update.
+    accumulator = d_(Enum('sum', 'welford', 'list'))
+
+    #: If greater than 0, only the most recent `n_history` epochs for each
+    #: group are averaged.
+    n_history = d_(Int(0))
+
+    def reset_plots(self):
+        super().reset_plots()
+        factory = partial(EpochAccumulator, self.accumulator, self.n_history)
+        self._data_cache = defaultdict(factory)
+
+    def _transform(self, signal):
+        '''
+        Transform the epoch before it is accumulated
+        '''
+        return signal
+
     def _y(self, epoch):
-        return np.mean(epoch, axis=0) if len(epoch) \
+        return epoch.get_mean() if len(epoch) \
             else np.full_like(self._x, np.nan)
 
     def _update_duration(self, event=None):
@@ -812,7 +847,7 @@ class EpochGroupMixin(GroupMixin):
             if self.group_filter(md):
                 signal = d['signal']
                 key = tuple(md[n] for n in self.group_names)
-                self._data_cache[key].append(signal)
+                self._data_cache[key].append(self._transform(signal))
                 self._data_count[key] += 1
 
                 # Track number of samples
@@ -845,7 +880,7 @@ class EpochGroupMixin(GroupMixin):
                 plot = self.get_plot(key)
                 y = self._y(data)
                 todo.append((plot.setData, self._x, y))
-                self._data_updated[key] = len(data)
+                self._data_updated[key] = count
 
         def update():
             for setter, x, y in todo:
@@ -881,9 +916,16 @@ class GroupedEpochFFTPlot(EpochGroupMixin, BasePlot):
         if self.source.fs and self.duration:
             self._x = get_x_fft(self.source.fs, self.duration)
 
+    def _transform(self, signal):
+        # The spectrum is linear in the signal, so the average spectrum can be
+        # accumulated directly rather than the average waveform.
+        return util.csd(signal, self.source.fs)
+
     def _y(self, epoch):
-        y = np.mean(epoch, axis=0) if epoch else np.full_like(self._x, np.nan)
-        return self.source.calibration.get_spl(self._x, util.psd(y, self.source.fs))
+        if not len(epoch):
+            return np.full_like(self._x, np.nan)
+        psd = util.csd_to_psd(epoch.get_mean())
+        return self.source.calibration.get_spl(self._x, psd)
 
 
 class GroupedEpochPhasePlot(EpochGroupMixin, BasePlot):
@@ -899,9 +941,13 @@ class GroupedEpochPhasePlot(EpochGroupMixin, BasePlot):
         if self.source.fs and self.duration:
             self._x = get_x_fft(self.source.fs, self.duration)
 
+    def _transform(self, signal):
+        return util.csd(signal, self.source.fs)
+
     def _y(self, epoch):
-        y = np.mean(epoch, axis=0) if epoch else np.full_like(self._x, np.nan)
-        return util.phase(y, self.source.fs, unwrap=self.unwrap)
+        if not len(epoch):
+            return np.full_like(self._x, np.nan)
+        return util.csd_to_phase(epoch.get_mean(), unwrap=self.unwrap)
 
 
 class StackedEpochAveragePlot(EpochGroupMixin, BasePlot):
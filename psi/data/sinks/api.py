@@ -6,6 +6,7 @@ with enaml.imports():
     from .event_log import EventLog
     from .epoch_counter import EpochCounter, GroupedEpochCounter
     from .preferences_store import PreferencesStore
+    from .shared_memory_stream import SharedMemoryStream
     from .table_store import TableStore
     from .text_store import TextStore
     from .trial_log import TrialLog
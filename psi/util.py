@@ -2,6 +2,7 @@ import logging
 log = logging.getLogger(__name__)
 
 import ast
+from collections import deque, OrderedDict
 import inspect
 import threading
 
@@ -107,16 +108,28 @@ def get_dependencies(expression):
 
 
 class SignalBuffer:
+    '''
+    Circular buffer holding the most recent samples of a continuous signal
+
+    Sample `i` (re. acquisition start) is stored at index `i % size` of the
+    backing array, so appending data only copies the new samples rather than
+    shifting the entire buffer. Data may be 1D (samples) or 2D (channels x
+    samples) if `n_channels` is provided.
+    '''
 
-    def __init__(self, fs, size, fill_value=np.nan, dtype=np.double):
+    def __init__(self, fs, size, fill_value=np.nan, dtype=np.double,
+                 n_channels=None):
         self._lock = threading.RLock()
         self._buffer_fs = fs
         self._buffer_size = size
         self._buffer_samples = round(fs*size)
-        self._buffer = np.full(self._buffer_samples, fill_value, dtype=dtype)
+        shape = (self._buffer_samples,)
+        if n_channels is not None:
+            shape = (n_channels,) + shape
+        self._buffer = np.full(shape, fill_value, dtype=dtype)
         self._fill_value = fill_value
         self._samples = 0
-        self._ilb = self._buffer_samples
+        self._n_valid = 0
 
     def time_to_samples(self, t):
         '''
@@ -126,16 +139,17 @@ class SignalBuffer:
 
     def time_to_index(self, t):
         '''
-        Convert time to index in buffer. Note that the index may fall out of
-        the buffered range.
+        Convert time to index in buffer. Note that the index may point to a
+        sample that is no longer (or not yet) buffered.
         '''
         i = self.time_to_samples(t)
         return self.samples_to_index(i)
 
     def samples_to_index(self, i):
-        # Convert index to the index in the buffer. Note that the index can
-        # fall outside the buffered range.
-        return i - self._samples + self._buffer_samples
+        # Convert sample number to the index in the circular buffer. Note that
+        # the index may point to a sample that is no longer (or not yet)
+        # buffered.
+        return i % self._buffer_samples
 
     def get_range_filled(self, lb, ub, fill_value):
         # Index of requested range
@@ -145,13 +159,13 @@ class SignalBuffer:
             # Index of buffered range
             slb = self.get_samples_lb()
             sub = self.get_samples_ub()
-            lpadding = max(slb-ilb, 0)
+            shape = self._buffer.shape[:-1] + (max(iub-ilb, 0),)
+            data = np.full(shape, fill_value, dtype=self._buffer.dtype)
             elb = max(slb, ilb)
-            rpadding = max(iub-sub, 0)
             eub = min(sub, iub)
-            data = self.get_range_samples(elb, eub)
-            return np.pad(data, (lpadding, rpadding), 'constant',
-                        constant_values=fill_value)
+            if eub > elb:
+                data[..., elb-ilb:eub-ilb] = self.get_range_samples(elb, eub)
+            return data
 
     def get_range(self, lb=None, ub=None, fill_value=None):
         with self._lock:
@@ -164,41 +178,42 @@ class SignalBuffer:
             return self.get_range_samples(ilb, iub)
 
     def get_range_samples(self, lb=None, ub=None):
+        '''
+        Return samples in the range [lb, ub)
+
+        If the range is contiguous in the circular buffer a view is returned.
+        Otherwise, the two segments are copied into a new array.
+        '''
         with self._lock:
             if lb is None:
                 lb = self.get_samples_lb()
             if ub is None:
                 ub = self.get_samples_ub()
-            ilb = self.samples_to_index(lb)
-            iub = self.samples_to_index(ub)
-            if ilb < self._ilb:
+            if lb < self.get_samples_lb():
                 raise IndexError
-            elif iub > self._buffer_samples:
+            elif ub > self.get_samples_ub():
                 raise IndexError
-            return self._buffer[ilb:iub]
+            n = max(ub-lb, 0)
+            ilb = self.samples_to_index(lb)
+            if (ilb + n) <= self._buffer_samples:
+                return self._buffer[..., ilb:ilb+n]
+            n_wrap = ilb + n - self._buffer_samples
+            return np.concatenate((self._buffer[..., ilb:],
+                                   self._buffer[..., :n_wrap]), axis=-1)
 
     def append_data(self, data):
         with self._lock:
             samples = data.shape[-1]
             if samples > self._buffer_samples:
-                self._buffer[:] = data[-self._buffer_samples:]
-                self._ilb = 0
-            else:
-                self._buffer[:-samples] = self._buffer[samples:]
-                self._buffer[-samples:] = data
-                self._ilb = max(0, self._ilb - samples)
+                data = data[..., -self._buffer_samples:]
+            s = self._samples + samples - data.shape[-1]
+            n = data.shape[-1]
+            i = self.samples_to_index(s)
+            n_head = min(n, self._buffer_samples-i)
+            self._buffer[..., i:i+n_head] = data[..., :n_head]
+            self._buffer[..., :n-n_head] = data[..., n_head:]
             self._samples += samples
-
-    def _invalidate(self, i):
-        # This is only called by invalidate or invalidate_samples, which are
-        # already wrapped inside a lock block.
-        if i <= 0:
-            self._buffer[:] = self._fill_value
-            self._ilb = self._buffer_samples
-        else:
-            self._buffer[-i:] = self._buffer[:i]
-            self._buffer[:-i] = np.nan
-            self._ilb = self._ilb + self._buffer_samples - i
+            self._n_valid = min(self._n_valid + samples, self._buffer_samples)
 
     def invalidate(self, t):
         with self._lock:
@@ -208,10 +223,9 @@ class SignalBuffer:
         with self._lock:
             if i >= self._samples:
                 return
-            bi = self.samples_to_index(i)
-            self._invalidate(bi)
-            di = self.get_samples_ub() - i
-            self._samples -= di
+            di = self._samples - i
+            self._samples = i
+            self._n_valid = max(self._n_valid - di, 0)
 
     def get_latest(self, lb, ub=0):
         with self._lock:
@@ -228,13 +242,224 @@ class SignalBuffer:
 
     def get_samples_lb(self):
         with self._lock:
-            return self._samples - self._buffer_samples + self._ilb
+            return self._samples - self._n_valid
 
     def get_samples_ub(self):
         with self._lock:
             return self._samples
 
 
+class EpochAccumulator:
+    '''
+    Incrementally tracks the average of a set of equal-length epochs
+
+    Parameters
+    ----------
+    mode : {'sum', 'welford', 'list'}
+        If 'sum', a running sum is maintained. If 'welford', the running mean
+        and variance are maintained using Welford's algorithm. If 'list', all
+        epochs are kept and the mean is computed on request.
+    history : int
+        If greater than 0, only the most recent `history` epochs contribute to
+        the average. The older epochs are removed from the running sum (or
+        mean) as new ones arrive. This requires keeping the most recent
+        `history` epochs in memory.
+
+    Epochs may be real or complex (e.g., for averaging in the spectral
+    domain).
+    '''
+
+    def __init__(self, mode='sum', history=0):
+        if mode not in ('sum', 'welford', 'list'):
+            raise ValueError(f'Unsupported accumulator mode {mode}')
+        self._mode = mode
+        self._history = deque(maxlen=history if history > 0 else None)
+        self._keep_history = (mode == 'list') or (history > 0)
+        self._n = 0
+        self._total = 0
+        self._sum = None
+        self._mean = None
+        self._m2 = None
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def total(self):
+        '''
+        Total number of epochs appended (including those no longer part of
+        the average).
+        '''
+        return self._total
+
+    def append(self, epoch):
+        epoch = np.asarray(epoch)
+        if self._keep_history:
+            if len(self._history) == self._history.maxlen:
+                self._remove(self._history[0])
+            self._history.append(epoch)
+        self._add(epoch)
+        self._total += 1
+
+    def _add(self, epoch):
+        self._n += 1
+        if self._mode == 'sum':
+            if self._sum is None:
+                dtype = np.result_type(epoch, np.double)
+                self._sum = np.zeros(epoch.shape, dtype=dtype)
+            self._sum += epoch
+        elif self._mode == 'welford':
+            if self._mean is None:
+                dtype = np.result_type(epoch, np.double)
+                self._mean = np.zeros(epoch.shape, dtype=dtype)
+                self._m2 = np.zeros(epoch.shape, dtype=np.double)
+            delta = epoch - self._mean
+            self._mean += delta / self._n
+            self._m2 += np.real(delta * np.conj(epoch - self._mean))
+
+    def _remove(self, epoch):
+        self._n -= 1
+        if self._mode == 'sum':
+            self._sum -= epoch
+        elif self._mode == 'welford':
+            if self._n == 0:
+                self._mean[:] = 0
+                self._m2[:] = 0
+                return
+            delta = epoch - self._mean
+            self._mean -= delta / self._n
+            self._m2 -= np.real(delta * np.conj(epoch - self._mean))
+
+    def get_mean(self):
+        if self._n == 0:
+            return None
+        if self._mode == 'sum':
+            return self._sum / self._n
+        elif self._mode == 'welford':
+            return self._mean.copy()
+        return np.mean(self._history, axis=0)
+
+    def get_var(self):
+        '''
+        Return the (population) variance. Not supported for mode 'sum'.
+        '''
+        if self._n == 0:
+            return None
+        if self._mode == 'welford':
+            return self._m2 / self._n
+        elif self._mode == 'list':
+            return np.var(self._history, axis=0)
+        raise ValueError('Variance not available when mode is sum')
+
+
+class WaveformCache:
+    '''
+    Memory-bounded least-recently-used cache of rendered waveforms
+
+    Cached waveforms are marked read-only since the same array is returned on
+    every hit. Keys are typically built by the caller from the factory class
+    and the resolved parameters used to generate the waveform (see
+    `psi.controller.output_manifest.get_factory_key`).
+
+    Parameters
+    ----------
+    max_bytes : int
+        Maximum total size (in bytes) of cached waveforms. The least recently
+        used waveforms are evicted once this is exceeded.
+    '''
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bypassed = 0
+        self._cache = OrderedDict()
+        self._random_keys = {}
+        self._uncacheable = set()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def get(self, key, render, random_key=()):
+        '''
+        Return the waveform for the key, calling `render` on a cache miss
+
+        Returns None if the key bypasses the cache. The caller is then
+        responsible for generating the waveform.
+
+        Parameters
+        ----------
+        key : hashable or None
+            Key identifying the waveform. If None, the cache is bypassed.
+        render : callable
+            Function that takes no arguments and returns the waveform.
+        random_key : tuple
+            Values of parameters that control the random state of the waveform
+            (e.g., the seed of a noise generator). If these change for the same
+            key, the waveform is assumed to be non-deterministic and the key
+            bypasses the cache from then on.
+        '''
+        if key is None or key in self._uncacheable:
+            self.bypassed += 1
+            return None
+
+        if random_key:
+            last_random_key = self._random_keys.setdefault(key, random_key)
+            if last_random_key != random_key:
+                log.debug('Random state of waveform changed, bypassing cache')
+                self._uncacheable.add(key)
+                self._random_keys.pop(key)
+                self._remove(key, last_random_key)
+                self.bypassed += 1
+                return None
+
+        full_key = key, random_key
+        try:
+            waveform = self._cache[full_key]
+            self._cache.move_to_end(full_key)
+            self.hits += 1
+            return waveform
+        except KeyError:
+            pass
+
+        self.misses += 1
+        waveform = np.asarray(render())
+        if waveform.nbytes > self.max_bytes:
+            return waveform
+        waveform.flags.writeable = False
+        self._cache[full_key] = waveform
+        self.nbytes += waveform.nbytes
+        while self.nbytes > self.max_bytes:
+            _, evicted = self._cache.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+            self.evictions += 1
+        return waveform
+
+    def _remove(self, key, random_key):
+        waveform = self._cache.pop((key, random_key), None)
+        if waveform is not None:
+            self.nbytes -= waveform.nbytes
+
+    def clear(self):
+        self._cache.clear()
+        self._random_keys.clear()
+        self._uncacheable.clear()
+        self.nbytes = 0
+
+    def get_stats(self):
+        return {
+            'size': len(self._cache),
+            'nbytes': self.nbytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'bypassed': self.bypassed,
+        }
+
+
 def octave_space(lb, ub, step):
     '''
     >>> freq = octave_space(4, 32, 1)
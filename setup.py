@@ -18,6 +18,7 @@ extras_require = {
     'ni': ['pydaqmx'],
     'docs': ['sphinx', 'sphinx_rtd_theme', 'pygments-enaml'],
     'examples': ['matplotlib'],
+    'parquet': ['pyarrow'],
     'test': ['pytest', 'pytest-benchmark'],
 }
 
@@ -0,0 +1,106 @@
+import json
+import os
+
+import pytest
+
+from psi.data.io import Recording
+from psi.data.io.abr import is_abr_experiment
+from psi.data.io.catalog import RecordingCatalog
+
+
+def make_carray(path, n, fs=None):
+    (path / 'meta').mkdir(parents=True)
+    (path / 'data').mkdir()
+    (path / 'meta' / 'sizes').write_text(json.dumps({'shape': [n]}))
+    (path / 'meta' / 'storage').write_text(json.dumps({'dtype': 'float64'}))
+    if fs is not None:
+        (path / '__attrs__').write_text(json.dumps({'fs': fs}))
+
+
+def make_recording(root, name, abr=True):
+    path = root / name
+    path.mkdir()
+    make_carray(path / 'microphone', 2000, fs=100e3)
+    if abr:
+        make_carray(path / 'eeg', 1000, fs=25e3)
+        for column in ('t0', 'level'):
+            make_carray(path / 'erp_metadata' / column, 10)
+    (path / 'event_log.csv').write_text('timestamp,event\n')
+    return path
+
+
+@pytest.fixture
+def root(tmp_path):
+    root = tmp_path / 'data'
+    root.mkdir()
+    make_recording(root, '20200101-120000 bburan B1 left  abr_io')
+    make_recording(root, '20200102-120000 bburan B2 right  abr_io')
+    make_recording(root, '20200103-120000 other B1 left  dpoae', abr=False)
+    return root
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = RecordingCatalog(tmp_path / 'catalog.db')
+    yield catalog
+    catalog.close()
+
+
+def test_catalog_refresh(root, catalog):
+    assert catalog.refresh(root) == \
+        {'added': 3, 'updated': 0, 'removed': 0, 'unchanged': 0}
+    assert catalog.refresh(root)['unchanged'] == 3
+
+    # Only the folders that changed are rescanned.
+    path = root / '20200101-120000 bburan B1 left  abr_io'
+    make_carray(path / 'eeg_filtered', 1000, fs=25e3)
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+    make_recording(root, '20200104-120000 bburan B3 left  abr_io')
+    stats = catalog.refresh(root)
+    assert stats == {'added': 1, 'updated': 1, 'removed': 0, 'unchanged': 2}
+    assert 'eeg_filtered' in catalog.get_items(path).index
+
+    os.rename(root / '20200104-120000 bburan B3 left  abr_io',
+              root.parent / 'moved')
+    assert catalog.refresh(root)['removed'] == 1
+    assert len(catalog.query()) == 3
+
+
+def test_catalog_query(root, catalog):
+    catalog.refresh(root)
+    assert len(catalog.query()) == 3
+    assert len(catalog.query(experiment='abr_io')) == 2
+    assert len(catalog.query(experimenter='other')) == 1
+    assert len(catalog.query(has=['eeg', 'erp_metadata'])) == 2
+    assert len(catalog.query(after='20200102-000000')) == 2
+    assert len(catalog.query(pattern=str(root / '* B1 *'))) == 2
+
+    path = root / '20200101-120000 bburan B1 left  abr_io'
+    items = catalog.get_items(path)
+    assert items.loc['eeg', 'shape'] == [1000]
+    assert items.loc['eeg', 'fs'] == 25e3
+    assert items.loc['erp_metadata', 'kind'] == 'ctable'
+    assert items.loc['erp_metadata', 'columns'] == ['level', 't0']
+    assert items.loc['event_log', 'kind'] == 'csv'
+
+
+def test_catalog_open(root, catalog):
+    catalog.refresh(root)
+    path = root / '20200101-120000 bburan B1 left  abr_io'
+    expected = Recording(path)
+    recording = catalog.open(path)
+    assert recording.carray_names == expected.carray_names
+    assert recording.ctable_names == expected.ctable_names
+    assert recording.ttable_names == expected.ttable_names
+    assert catalog.get_names(root.parent / 'missing') is None
+
+
+def test_is_abr_experiment(root, catalog):
+    # The catalog and the filesystem should agree.
+    catalog.refresh(root)
+    for path in root.iterdir():
+        expected = 'abr_io' in path.name
+        assert is_abr_experiment(path) == expected
+        assert is_abr_experiment(path, catalog) == expected
+    assert not is_abr_experiment(root / 'missing')
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+from scipy import signal
+
+from psi.data.io import Signal
+from psi.data.io.bcolz_tools import read_chunked_segments, sosfiltfilt_chunked
+
+
+class ChunkedArray:
+
+    def __init__(self, array):
+        self.array = array
+        self.reads = []
+
+    def __getitem__(self, s):
+        self.reads.append((s.start, s.stop))
+        return self.array[s]
+
+    def __len__(self):
+        return len(self.array)
+
+
+class ArraySignal(Signal):
+
+    def __init__(self, array, fs):
+        self.array = array
+        self.fs = fs
+        self.shape = array.shape
+        self.duration = len(array) / fs
+
+    def __getitem__(self, s):
+        return self.array[s]
+
+    def get_filtered(self, *args):
+        sos = self.get_filter_sos(*args)
+        out = np.empty_like(self.array)
+        sosfiltfilt_chunked(sos, self.array, out, chunksize=1000)
+        return ArraySignal(out, self.fs)
+
+
+@pytest.mark.parametrize('chunklen', [7, 64, 1000])
+def test_read_chunked_segments(chunklen):
+    data = np.random.uniform(size=5000)
+    indices = np.random.randint(0, 5000-100, size=200)
+    array = ChunkedArray(data)
+    out = np.empty((len(indices), 100))
+    read_chunked_segments(array, indices, 100, chunklen, out)
+
+    expected = np.array([data[i:i+100] for i in indices])
+    assert np.array_equal(out, expected)
+
+    # Each chunk should only be read once
+    assert len(array.reads) == len(set(array.reads))
+
+
+@pytest.mark.parametrize('chunksize', [7, 1000, 10000])
+def test_sosfiltfilt_chunked(chunksize):
+    data = np.random.normal(size=5000)
+    sos = signal.iirfilter(2, (0.05, 0.3), btype='band', output='sos')
+    out = np.empty_like(data)
+    sosfiltfilt_chunked(sos, ChunkedArray(data), out, chunksize)
+    np.testing.assert_allclose(out, signal.sosfiltfilt(sos, data))
+
+
+def test_get_segments_filtered_continuous():
+    fs = 10000
+    data = np.random.normal(size=fs)
+    s = ArraySignal(data, fs)
+    times = np.random.uniform(0.1, 0.8, size=20)
+    args = (times, -1e-3, 10e-3, 300, 3000, 1, None)
+    result = s.get_segments_filtered(*args, filter_method='continuous')
+
+    sos = s.get_filter_sos(300, 3000, 1)
+    filtered = signal.sosfiltfilt(sos, data)
+    for t0, row in result.iterrows():
+        lb = round((t0 - 1e-3) * fs)
+        np.testing.assert_allclose(row.values, filtered[lb:lb+100])
+
+    # Filtering each epoch separately gives nearly the same result except for
+    # the transient at the end of the epoch.
+    expected = s.get_segments_filtered(*args, pad_duration=50e-3)
+    expected.columns = np.round(expected.columns * fs)
+    result.columns = np.round(result.columns * fs)
+    np.testing.assert_allclose(result.loc[:, -9:30], expected.loc[:, -9:30],
+                               atol=1e-3)
+
+    with pytest.raises(ValueError):
+        s.get_segments_filtered(*args, filter_method='none')
+
+
+@pytest.mark.parametrize('filter_method', ['epoch', 'continuous'])
+def test_get_random_segments_filtered(filter_method):
+    # Draw enough segments that some are guaranteed to fall near the edges of
+    # the signal. None of them should be missing.
+    fs = 10000
+    s = ArraySignal(np.random.normal(size=fs), fs)
+    result = s.get_random_segments_filtered(5000, -1e-3, 10e-3, 300, 3000,
+                                            filter_method=filter_method)
+    assert len(result) == 5000
+    assert not result.isnull().any().any()
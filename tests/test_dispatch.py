@@ -0,0 +1,57 @@
+import threading
+import time
+
+import pytest
+
+import numpy as np
+
+from psi.controller.dispatch import AIDispatcher
+
+
+@pytest.mark.parametrize('overflow', ['drop', 'block'])
+def test_dispatcher_overflow(overflow):
+    release = threading.Event()
+    processed = []
+
+    def dispatch(data, channel_names):
+        release.wait()
+        processed.append(data)
+
+    dispatcher = AIDispatcher(dispatch, ['mic'], queue_size=2,
+                              overflow=overflow)
+    dispatcher.start()
+    blocks = [np.full((1, 10), i) for i in range(10)]
+
+    if overflow == 'drop':
+        # The reader is never blocked by a worker that falls behind.
+        start = time.perf_counter()
+        for block in blocks:
+            dispatcher.put(block)
+        assert time.perf_counter() - start < 0.5
+        release.set()
+    else:
+        timer = threading.Timer(0.1, release.set)
+        timer.start()
+        for block in blocks:
+            dispatcher.put(block)
+        timer.join()
+
+    dispatcher.join()
+    dispatcher.stop()
+    metrics, = dispatcher.get_metrics()
+    assert metrics['blocks'] == len(processed)
+    if overflow == 'drop':
+        # The worker holds one block and two more are queued.
+        assert metrics['overflows'] == len(blocks) - len(processed)
+        assert len(processed) < len(blocks)
+        # Blocks that were processed are in order.
+        values = [int(p[0, 0]) for p in processed]
+        assert values == sorted(values)
+    else:
+        assert metrics['overflows'] > 0
+        assert len(processed) == len(blocks)
+
+
+def test_dispatcher_invalid_overflow():
+    with pytest.raises(ValueError):
+        AIDispatcher(lambda *args: None, ['mic'], overflow='wait')
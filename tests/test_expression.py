@@ -52,6 +52,13 @@ class TestExpressionNamespace(unittest.TestCase):
         self.assertEqual(ns.get_value('c', {'a': 2}), 6)
         self.assertEqual(ns.get_value('a', {'a': 2}), 2)
 
+    def test_evaluation_override_dependents(self):
+        # A value provided via the context should be visible to expressions
+        # that are evaluated later.
+        ns = ExpressionNamespace({'a': '1', 'b': 'a*2'})
+        self.assertEqual(ns.get_value('a', {'a': 5}), 5)
+        self.assertEqual(ns.get_value('b'), 10)
+
     def test_cache(self):
         # We know for this particular seed that second and third call to the
         # generator will not return the same value.
@@ -74,6 +81,38 @@ class TestExpressionNamespace(unittest.TestCase):
         self.assertEqual(values['z'], 32)
         self.assertEqual(values['f'], 31)
 
+    def test_circular_dependency(self):
+        expressions = {'a': 'c+1', 'b': 'a*2', 'c': 'b-1', 'd': '5'}
+        with self.assertRaisesRegex(ValueError, 'Circular dependency'):
+            ExpressionNamespace(expressions)
+        ns = ExpressionNamespace({'d': '5'})
+        with self.assertRaisesRegex(ValueError, 'Circular dependency'):
+            ns.update_expressions(expressions)
+
+    def test_set_value_invalidates_dependents(self):
+        ns = ExpressionNamespace(self.EXPRESSIONS, {'bar': 2})
+        self.assertEqual(ns.get_value('c'), 2550)
+        self.assertEqual(ns.get_value('e'), 20)
+
+        # Only values downstream of `a` should be recomputed.
+        ns.set_value('a', 2)
+        self.assertEqual(ns.get_value('c'), 6)
+        self.assertEqual(ns.get_value('b'), 3)
+        self.assertEqual(ns.get_value('e'), 20)
+
+        # Values that were set directly should not be discarded.
+        ns.set_value('b', 10)
+        ns.set_value('a', 3)
+        self.assertEqual(ns.get_value('b'), 10)
+        self.assertEqual(ns.get_value('c'), 30)
+
+    def test_update_expressions(self):
+        ns = ExpressionNamespace(self.EXPRESSIONS)
+        self.assertEqual(ns.get_value('c'), 2550)
+        ns.reset()
+        ns.update_expressions({'a': '2*d'})
+        self.assertEqual(ns.get_value('c'), 420)
+
 
 class ANT(Atom):
 
@@ -1,8 +1,16 @@
+from collections import deque
+from types import SimpleNamespace
+
 import numpy as np
 import pytest
+from scipy import signal
 
+from psi.controller.calibration.util import psd
 from psi.controller.input import (accumulate, blocked, concatenate, coroutine,
-                                  InputData)
+                                  design_iirfilter, detrend, extract_epochs,
+                                  InputData, lfilter, reject_epochs, resample,
+                                  Resample, rms, sosfilter, spectral_average,
+                                  stack_epochs, _gather_epochs)
 
 
 @pytest.fixture
@@ -71,3 +79,340 @@ def test_pipeline_flush(data, pipeline):
     assert data[0].shape == (4, 10)
     assert np.array_equal(expected, data[0])
     assert data[0].metadata == expected.metadata
+
+
+@pytest.mark.parametrize('n_channels', [None, 4])
+def test_extract_epochs(n_channels):
+    fs = 1000
+    shape = (20000,) if n_channels is None else (n_channels, 20000)
+    data = np.random.uniform(size=shape)
+    queue = deque()
+    epochs = []
+    complete = []
+    cb = extract_epochs(fs, queue, 0.1, 0.01, 1, epochs.extend,
+                        lambda: complete.append(True)).send
+
+    # Epochs are requested in no particular order, some before the data is
+    # acquired and some after, and some spanning several blocks.
+    t0 = [0.5, 0.1, 2.05, 3.999, 4.2, 10.3]
+    for t in t0[:3]:
+        queue.append({'t0': t, 'duration': 0.1})
+    for i in range(0, 5000, 125):
+        cb(data[..., i:i+125])
+    for t in t0[3:]:
+        queue.append({'t0': t, 'duration': 0.1})
+    for i in range(5000, 20000, 1000):
+        cb(data[..., i:i+1000])
+
+    assert complete == [True]
+    assert len(epochs) == len(t0)
+    for epoch in epochs:
+        lb = round(epoch['info']['t0']*fs)
+        expected = data[..., lb:lb+110]
+        assert epoch['info']['epoch_size'] == 0.1
+        assert epoch['info']['poststim_time'] == 0.01
+        assert np.array_equal(epoch['signal'], expected)
+
+
+def test_extract_epochs_missed():
+    fs = 1000
+    data = np.random.uniform(size=10000)
+    queue = deque()
+    epochs = []
+    cb = extract_epochs(fs, queue, 0, 0, 0.5, epochs.extend).send
+
+    for i in range(0, 5000, 500):
+        cb(data[i:i+500])
+
+    # The first epoch falls outside the historical buffer and should be
+    # flagged as missed. The second falls within the buffer. The third is
+    # longer than the buffer and needs to keep more history than the buffer
+    # normally holds.
+    queue.append({'t0': 1, 'duration': 0.1})
+    queue.append({'t0': 4.2, 'duration': 0.1})
+    queue.append({'t0': 4.7, 'duration': 2.5})
+    for i in range(5000, 10000, 500):
+        cb(data[i:i+500])
+
+    assert len(epochs) == 3
+    assert epochs[0]['signal'] is None
+    assert np.array_equal(epochs[1]['signal'], data[4200:4300])
+    assert np.array_equal(epochs[2]['signal'], data[4700:7200])
+
+
+@pytest.mark.parametrize('output', ['sos', 'ba'])
+@pytest.mark.parametrize('shape', [(1000,), (16, 1000)])
+def test_iirfilter_streaming(output, shape):
+    coefs = design_iirfilter(4, (300, 3000), 'bandpass', 'butter', 25e3,
+                             output)
+    assert design_iirfilter(4, [300, 3000.0], 'bandpass', 'butter', 25000,
+                            output) is coefs
+
+    x = np.random.normal(size=shape)
+    if output == 'sos':
+        sos, = coefs
+        zi = signal.sosfilt_zi(sos)
+        zi = zi.reshape((zi.shape[0],) + (1,) * (x.ndim - 1) + (2,))
+        expected, _ = signal.sosfilt(sos, x, zi=zi*x[np.newaxis, ..., :1])
+        filter_coroutine = sosfilter
+    else:
+        b, a = coefs
+        zi = signal.lfilter_zi(b, a)
+        expected, _ = signal.lfilter(b, a, x, zi=zi*x[..., :1])
+        filter_coroutine = lfilter
+
+    result = []
+    cb = filter_coroutine(*coefs, result.append).send
+    for i in range(0, 1000, 137):
+        cb(x[..., i:i+137])
+    result = np.concatenate(result, axis=-1)
+    assert result.shape == shape
+    np.testing.assert_allclose(result, expected)
+
+
+@pytest.mark.parametrize('up, down', [(1, 4), (48, 125), (3, 2)])
+@pytest.mark.parametrize('block_size', [1, 137, 5000])
+def test_resample(up, down, block_size):
+    x = np.random.normal(size=(2, 5000))
+
+    # Reference implementation that upsamples by inserting zeros, filters
+    # and then downsamples.
+    max_rate = max(up, down)
+    h = signal.firwin(20*max_rate+1, 1/max_rate, window=('kaiser', 5.0))*up
+    x_up = np.zeros((2, x.shape[-1]*up))
+    x_up[:, ::up] = x
+    expected = signal.lfilter(h, 1, x_up, axis=-1)[:, ::down]
+
+    result = []
+    cb = resample(up, down, result.append).send
+    for i in range(0, x.shape[-1], block_size):
+        cb(x[..., i:i+block_size])
+    result = np.concatenate(result, axis=-1)
+
+    assert result.shape == expected.shape
+    np.testing.assert_allclose(result, expected, atol=1e-12)
+
+
+def test_resample_reset():
+    x = np.random.normal(size=(2, 1000))
+    expected = []
+    cb = resample(3, 2, expected.append).send
+    cb(x)
+
+    # Data following a discontinuity is resampled as if it were new.
+    result = []
+    cb = resample(3, 2, result.append).send
+    cb(np.random.normal(size=(2, 500)))
+    cb(Ellipsis)
+    assert result[-1] is Ellipsis
+    cb(x)
+    np.testing.assert_allclose(result[-1], expected[-1])
+
+    with pytest.raises(ValueError):
+        Resample(name='resample').configure_callback()
+
+
+@pytest.mark.parametrize('block_size', [100, 1234, 20000])
+def test_spectral_average(block_size):
+    fs, n, step = 10e3, 1000, 500
+    t = np.arange(20000)/fs
+    x = np.sin(2*np.pi*1e3*t) + np.random.normal(scale=0.1, size=(2, len(t)))
+
+    window = signal.get_window('hann', n)
+    window /= window.mean()*n
+
+    result = []
+    cb = spectral_average(n, step, window, 'linear', 'linear', 0, 'psd', 1,
+                          result.append).send
+    for i in range(0, x.shape[-1], block_size):
+        cb(x[..., i:i+block_size])
+
+    segments = np.stack([x[..., i:i+n] for i in range(0, 20000-n+1, step)])
+    expected = (psd(segments, fs, 'hann')**2).mean(axis=0)**0.5
+    assert result[-1].metadata['n_segments'] == len(segments)
+    np.testing.assert_allclose(result[-1], expected)
+
+    # 1 kHz tone with RMS amplitude of 1/sqrt(2)
+    assert result[-1][:, 100] == pytest.approx(2**-0.5, rel=1e-2)
+
+    # Reset the average
+    cb(Ellipsis)
+    assert result[-1] is Ellipsis
+    cb(x[..., :n])
+    assert result[-1].metadata['n_segments'] == 1
+
+
+def test_spectral_average_exponential():
+    x = np.random.normal(size=4000)
+    window = np.full(100, 1/100)
+    result = []
+    cb = spectral_average(100, 100, window, None, 'exponential', 4, 'csd', 10,
+                          result.append).send
+    cb(x)
+
+    expected = np.fft.rfft(x[:100])/100
+    for i in range(100, 4000, 100):
+        expected += (np.fft.rfft(x[i:i+100])/100 - expected)/4
+    assert len(result) == 1
+    np.testing.assert_allclose(result[0], expected)
+
+
+def make_epochs(lengths, n_channels=None):
+    epochs = []
+    for i, n in enumerate(lengths):
+        shape = (n,) if n_channels is None else (n_channels, n)
+        s = np.random.normal(size=shape) + np.linspace(0, 1, n)
+        epochs.append({'signal': s, 'info': {'t0': i}})
+    return epochs
+
+
+@pytest.mark.parametrize('lengths', [[100]*8, [100, 101, 100, 99]])
+@pytest.mark.parametrize('mode', ['absolute value', 'amplitude'])
+@pytest.mark.parametrize('n_channels', [None, 4])
+def test_reject_epochs(lengths, mode, n_channels, monkeypatch):
+    monkeypatch.setattr('psi.controller.input.deferred_call',
+                        lambda cb: cb())
+    epochs = make_epochs(lengths, n_channels)
+    if mode == 'absolute value':
+        expected = [e for e in epochs if np.max(np.abs(e['signal'])) < 3]
+    else:
+        expected = [e for e in epochs if np.ptp(e['signal']) < 5]
+    threshold = 3 if mode == 'absolute value' else 5
+
+    status = SimpleNamespace(total=0, rejects=0, reject_ratio=0)
+    valid = []
+    reject_epochs(threshold, mode, status, valid.extend).send(epochs)
+    assert [e['info'] for e in valid] == [e['info'] for e in expected]
+    assert status.total == len(epochs)
+    assert status.rejects == len(epochs) - len(expected)
+
+
+@pytest.mark.parametrize('lengths', [[100]*8, [100, 101, 100, 99]])
+@pytest.mark.parametrize('mode', ['constant', 'linear', None])
+@pytest.mark.parametrize('n_channels', [None, 4])
+def test_detrend(lengths, mode, n_channels):
+    epochs = make_epochs(lengths, n_channels)
+    result = []
+    detrend(mode, result.extend).send(epochs)
+    assert len(result) == len(epochs)
+    for r, e in zip(result, epochs):
+        assert r['info'] is e['info']
+        expected = e['signal'] if mode is None else \
+            signal.detrend(e['signal'], type=mode)
+        np.testing.assert_allclose(r['signal'], expected, atol=1e-12)
+
+    # Epochs of equal length are detrended as a single array
+    if mode is not None and len(set(lengths)) == 1:
+        base = result[0]['signal'].base
+        assert base is not None
+        assert all(r['signal'].base is base for r in result)
+
+
+def random_chunks(x, max_size=250):
+    i = 0
+    while i < x.shape[-1]:
+        n = np.random.randint(1, max_size)
+        yield x[..., i:i+n]
+        i += n
+
+
+@pytest.mark.parametrize('n_channels', [None, 4])
+def test_blocked(n_channels):
+    shape = (10000,) if n_channels is None else (n_channels, 10000)
+    x = InputData(np.random.normal(size=shape), {'n': 1})
+    result = []
+    cb = blocked(100, result.append).send
+    for chunk in random_chunks(x):
+        cb(chunk)
+    assert len(result) == 100
+    for i, block in enumerate(result):
+        assert block.metadata == {'n': 1}
+        assert np.array_equal(block, x[..., i*100:(i+1)*100])
+
+
+@pytest.mark.parametrize('n_channels', [None, 4])
+def test_rms(n_channels):
+    shape = (10000,) if n_channels is None else (n_channels, 10000)
+    x = np.random.normal(size=shape)
+    result = []
+    cb = rms(100, result.append).send
+    for chunk in random_chunks(x):
+        cb(chunk)
+    result = np.concatenate(result, axis=-1)
+    expected = np.mean(x.reshape(shape[:-1] + (100, 100))**2, axis=-1)**0.5
+    np.testing.assert_allclose(result, expected)
+
+
+def test_accumulate_ragged(data):
+    cb = accumulate(3, -1, False, None, data.append).send
+    chunks = [InputData(np.random.normal(size=n), {'n': 1})
+              for n in (5, 5, 3, 5, 5, 5)]
+    for chunk in chunks:
+        cb(chunk)
+    assert len(data) == 2
+    assert np.array_equal(data[0], np.concatenate(chunks[:3]))
+    assert np.array_equal(data[1], np.concatenate(chunks[3:]))
+    assert data[0].metadata == {'n': 1}
+
+    with pytest.raises(ValueError):
+        cb(InputData(np.zeros(5), {'n': 1}))
+        cb(InputData(np.zeros(5), {'n': 2}))
+
+
+def reused_chunks(x, sizes):
+    # Mimics an engine that reads each block into the same buffer.
+    buffer = np.empty(x.shape[:-1] + (max(sizes),))
+    i = 0
+    for n in sizes:
+        buffer[..., :n] = x[..., i:i+n]
+        yield InputData(buffer[..., :n], {'n': 1})
+        i += n
+
+
+def test_reused_source_buffer():
+    x = np.random.normal(size=(2, 3000))
+    sizes = [150, 70, 150, 30, 100] * 6
+
+    window = np.full(500, 1/500)
+    expected = []
+    cb = spectral_average(500, 250, window, None, 'linear', 0, 'csd', 1,
+                          expected.append).send
+    cb(x)
+    result = []
+    cb = spectral_average(500, 250, window, None, 'linear', 0, 'csd', 1,
+                          result.append).send
+    for chunk in reused_chunks(x, sizes):
+        cb(chunk)
+    np.testing.assert_allclose(result[-1], expected[-1])
+
+    result = []
+    cb = accumulate(5, -1, False, None, result.append).send
+    for chunk in reused_chunks(x, sizes):
+        cb(chunk)
+    assert np.array_equal(np.concatenate(result, axis=-1), x)
+
+
+@pytest.mark.parametrize('n_channels', [None, 4])
+def test_stack_epochs(n_channels):
+    shape = (1000,) if n_channels is None else (n_channels, 1000)
+    ring = np.random.normal(size=shape)
+    starts = np.array([10, 500, 950])
+    gathered = _gather_epochs(ring, starts, 100)
+    epochs = [{'signal': s, 'info': {}} for s in gathered]
+
+    # Signals that are views into one array are not copied.
+    stacked = stack_epochs(epochs)
+    assert np.shares_memory(stacked, gathered)
+    assert np.array_equal(stacked, gathered)
+
+    # A subset (e.g., after rejecting epochs) or a reordered list is copied.
+    for subset in (epochs[1:], epochs[::-1]):
+        stacked = stack_epochs(subset)
+        assert not np.shares_memory(stacked, gathered)
+        assert np.array_equal(stacked, [e['signal'] for e in subset])
+
+    # The result of detrending a stack is also reused.
+    detrended = []
+    detrend('constant', detrended.append).send(epochs)
+    signals = [e['signal'] for e in detrended[0]]
+    assert np.shares_memory(stack_epochs(detrended[0]), signals[0])
@@ -0,0 +1,180 @@
+'''
+Benchmarks for the buffering nodes in the input graph
+
+The legacy implementations of `blocked` and `accumulate` (which concatenate
+lists of blocks) are included for comparison. In addition to timing (via
+pytest-benchmark), the number of times each sample is copied by a chain is
+saved with the benchmark results (see `extra_info` in the output of
+`--benchmark-json`). The copy counts can also be printed by running this
+module as a script.
+'''
+from queue import Queue
+from unittest import mock
+
+import numpy as np
+import pytest
+
+from psi.controller import input as input_module
+from psi.controller.input import (accumulate, blocked, capture, concatenate,
+                                  coroutine, design_iirfilter, InputData,
+                                  sosfilter)
+
+
+@coroutine
+def legacy_blocked(block_size, target):
+    data = []
+    n = 0
+
+    while True:
+        d = (yield)
+        if d is Ellipsis:
+            data = []
+            target(d)
+            continue
+
+        n += d.shape[-1]
+        data.append(d)
+        if n >= block_size:
+            merged = concatenate(data, axis=-1)
+            while merged.shape[-1] >= block_size:
+                target(merged[..., :block_size])
+                merged = merged[..., block_size:]
+            data = [merged]
+            n = merged.shape[-1]
+
+
+@coroutine
+def legacy_accumulate(n, axis, newaxis, status_cb, target):
+    data = []
+    while True:
+        d = (yield)
+        if d is Ellipsis:
+            data = []
+            target(d)
+            continue
+
+        if newaxis:
+            data.append(d[np.newaxis])
+        else:
+            data.append(d)
+        if len(data) == n:
+            data = concatenate(data, axis=axis)
+            target(data)
+            data = []
+
+        if status_cb is not None:
+            status_cb(len(data))
+
+
+IMPLEMENTATIONS = {
+    'legacy': (legacy_blocked, legacy_accumulate),
+    'current': (blocked, accumulate),
+}
+
+FS = 25e3
+READ_SIZE = 2500
+
+
+def dpoae_chain(implementation, sink):
+    # Capture -> Blocked, with a response window of 100 msec.
+    blocked, _ = IMPLEMENTATIONS[implementation]
+    queue = Queue()
+    queue.put(0)
+    cb = blocked(int(0.1*FS), sink).send
+    return capture(FS, queue, cb).send
+
+
+def efr_chain(implementation, sink):
+    # Blocked -> Accumulate -> IIRFilter as in the dual EFR experiment.
+    blocked, accumulate = IMPLEMENTATIONS[implementation]
+    sos, = design_iirfilter(2, (300, 3000), 'bandpass', 'butter', FS)
+    cb = sosfilter(sos, sink).send
+    cb = accumulate(25, -1, False, None, cb).send
+    return blocked(int(0.25*FS), cb).send
+
+
+CHAINS = {
+    'dpoae': dpoae_chain,
+    'efr': efr_chain,
+}
+
+
+def get_reads(n_reads=250, read_size=READ_SIZE):
+    # The defaults give 100 seconds of data, which is a whole number of
+    # blocks for both chains.
+    data = np.random.normal(size=n_reads*read_size)
+    return [InputData(data[i:i+read_size], {})
+            for i in range(0, len(data), read_size)]
+
+
+class AllocationCounter:
+    '''
+    Wraps numpy to track memory allocated by functions that create arrays
+    '''
+    functions = ('concatenate', 'empty', 'stack', 'zeros')
+
+    def __init__(self):
+        self.nbytes = 0
+
+    def __getattr__(self, name):
+        attr = getattr(np, name)
+        if name not in self.functions:
+            return attr
+
+        def wrapper(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            self.nbytes += result.nbytes
+            return result
+        return wrapper
+
+
+def get_copies_per_sample(chain, implementation, reads):
+    '''
+    Return number of times each sample is copied by the buffering nodes
+
+    Every array allocated by the nodes in `psi.controller.input` is filled with
+    a copy of the input data, so this is calculated as the number of bytes
+    allocated per byte of input.
+    '''
+    counter = AllocationCounter()
+    with mock.patch.object(input_module, 'np', counter):
+        cb = CHAINS[chain](implementation, lambda d: None)
+        for data in reads:
+            cb(data)
+    return counter.nbytes / sum(r.nbytes for r in reads)
+
+
+def test_copies_per_sample():
+    reads = get_reads()
+    # Reads are the same size as the DPOAE segment, so Blocked passes them
+    # through without copying.
+    assert get_copies_per_sample('dpoae', 'legacy', reads) == 1
+    assert get_copies_per_sample('dpoae', 'current', reads) == 0
+    # Blocked and Accumulate each copy the data once. The legacy Blocked
+    # copies samples left over from each read a second time.
+    assert get_copies_per_sample('efr', 'legacy', reads) > 2
+    assert get_copies_per_sample('efr', 'current', reads) == 2
+
+
+@pytest.mark.parametrize('implementation', ['legacy', 'current'])
+@pytest.mark.parametrize('chain', ['dpoae', 'efr'])
+def test_chain_benchmark(benchmark, chain, implementation):
+    reads = get_reads()
+
+    def run():
+        cb = CHAINS[chain](implementation, lambda d: None)
+        for data in reads:
+            cb(data)
+
+    benchmark.extra_info['copies_per_sample'] = \
+        get_copies_per_sample(chain, implementation, reads)
+    benchmark(run)
+
+
+if __name__ == '__main__':
+    reads = get_reads()
+    for chain in CHAINS:
+        for implementation in IMPLEMENTATIONS:
+            copies = get_copies_per_sample(chain, implementation, reads)
+            print('{} ({}): {:.2f} copies per sample' \
+                  .format(chain, implementation, copies))
@@ -2,6 +2,7 @@ import pytest
 
 import numpy as np
 
+from psi.controller.api import EpochOutput
 from psi.token.primitives import Cos2EnvelopeFactory, ToneFactory
 
 
@@ -93,3 +94,30 @@ def test_epoch_output_buffer(epoch_output, tb1, tb2):
     epoch_output.get_samples(500, 1000*25, temp)
     epoch_output.get_samples(500, 1000, out)
     assert np.all(out == 0)
+
+
+def test_ao_channel_sum(ao_channel, epoch_output, tb1, tb2):
+    full_waveform1 = tb1.next(3000)
+    tb1.reset()
+    full_waveform2 = tb2.next(3000)
+    tb2.reset()
+
+    epoch_output.source = tb1
+    epoch_output.activate(0)
+    output2 = EpochOutput()
+    ao_channel.add_output(output2)
+    output2.source = tb2
+    output2.activate(500)
+
+    out = np.empty(1000)
+    ao_channel.get_samples(0, 1000, out)
+    expected = full_waveform1[:1000].copy()
+    expected[500:] += full_waveform2[:500]
+    assert np.allclose(out, expected)
+
+    # The scratch space used to sum the outputs is reused.
+    scratch = ao_channel._scratch
+    ao_channel.get_samples(1000, 1000, out)
+    expected = full_waveform1[1000:2000] + full_waveform2[500:1500]
+    assert np.allclose(out, expected)
+    assert ao_channel._scratch is scratch
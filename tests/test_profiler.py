@@ -0,0 +1,51 @@
+import json
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from psi.controller.input import blocked, InputData
+from psi.controller.profiler import InputProfiler
+
+
+def Node(name, channel_name='ai'):
+    return SimpleNamespace(name=name, channel=SimpleNamespace(name=channel_name))
+
+
+def test_input_profiler(tmpdir):
+    profiler = InputProfiler()
+    received = []
+
+    def sink(data):
+        time.sleep(1e-3)
+        received.append(data)
+
+    sink_cb = profiler.wrap(Node('sink'), sink)
+    blocked_cb = profiler.wrap(Node('blocked'), blocked(100, sink_cb).send)
+
+    data = InputData(np.random.normal(size=1000), {})
+    for i in range(20):
+        blocked_cb(data[i*50:(i+1)*50])
+
+    stats = {s['input']: s for s in profiler.get_stats()}
+    assert stats['blocked']['calls'] == 20
+    assert stats['blocked']['samples'] == 1000
+    assert stats['sink']['calls'] == 10
+    assert stats['sink']['samples'] == 1000
+
+    # Time spent in the sink is excluded from the self time of blocked.
+    b = stats['blocked']
+    assert b['self_time'] <= b['total_time']
+    assert b['total_time'] >= stats['sink']['total_time']
+    assert b['self_time'] < stats['sink']['self_time']
+
+    filename = str(tmpdir / 'trace.json')
+    profiler.export_trace(filename)
+    with open(filename) as fh:
+        trace = json.load(fh)
+    assert len(trace['traceEvents']) == 30
+
+    profiler.reset()
+    stats = {s['input']: s for s in profiler.get_stats()}
+    assert stats['blocked']['calls'] == 0
+    assert profiler.get_trace()['traceEvents'] == []
@@ -87,3 +87,24 @@ def test_queue(queue, tone1, tone2):
     # Set resolution to a fraction of a sample
     assert conn.popleft()[0]['t0'] == pytest.approx(0, abs=0.1/100e3)
     assert conn.popleft()[0]['t0'] == pytest.approx(2, abs=0.1/100e3)
+
+
+def test_queue_pop_buffer_into():
+    # Short tokens with an intertrial interval (e.g., clicks) should fill a
+    # large buffer in place.
+    click = np.ones(10)
+    queue = FIFOSignalQueue()
+    queue.set_fs(1e3)
+    queue.set_t0(0)
+    queue.append(click, 2000, delays=2e-3)
+
+    out = np.full(12000, np.nan)
+    assert not queue.pop_buffer_into(out)
+    expected = np.tile(np.r_[click, np.zeros(2)], 1000)
+    assert np.all(out == expected)
+
+    # Remaining samples after the queue is empty are set to 0.
+    out = np.full(20000, np.nan)
+    assert queue.pop_buffer_into(out)
+    assert np.all(out[:12000] == expected)
+    assert np.all(out[12000:] == 0)
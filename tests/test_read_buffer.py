@@ -0,0 +1,28 @@
+import numpy as np
+
+from psi.controller.read_buffer import AIReadBuffer
+
+
+def test_ai_read_buffer():
+    buffer = AIReadBuffer(3, 100)
+    a = buffer.get(100)
+    b = buffer.get(50)
+    c = buffer.get(80)
+    assert a.shape == (3, 100)
+    assert b.shape == (3, 50)
+    assert b.flags['C_CONTIGUOUS']
+    assert np.shares_memory(a, c)
+    assert not np.shares_memory(a, b)
+    assert buffer.get_stats()['allocations'] == 2
+
+    # Buffers grow when a read requires more samples than are available.
+    d = buffer.get(150)
+    assert d.shape == (3, 150)
+    assert buffer.get_stats()['allocations'] == 4
+    assert buffer.get_stats()['reads'] == 4
+
+    d[:] = 1
+    e = buffer.copy(d)
+    d[:] = 0
+    assert np.all(e == 1)
+    assert buffer.get_stats()['copied_bytes'] == e.nbytes
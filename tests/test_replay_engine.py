@@ -0,0 +1,105 @@
+from collections import deque
+
+import pytest
+
+import numpy as np
+import pandas as pd
+
+from psi.controller.engines.replay import (load_events, ReplayEngine,
+                                           ReplayHardwareAIChannel)
+from psi.controller.input import extract_epochs
+
+
+class ArraySignal:
+
+    def __init__(self, array, fs):
+        self.array = array
+        self.fs = fs
+
+    def __getitem__(self, slice):
+        return self.array[slice]
+
+    @property
+    def shape(self):
+        return self.array.shape
+
+
+class ArrayRecording:
+
+    def __init__(self, **items):
+        self.__dict__.update(items)
+
+
+@pytest.fixture()
+def recording():
+    fs = 1000
+    t0 = np.arange(0.05, 4.5, 0.237)
+    return ArrayRecording(
+        eeg=ArraySignal(np.random.uniform(size=5000), fs),
+        microphone=ArraySignal(np.random.uniform(size=5200), fs),
+        erp_metadata=pd.DataFrame({
+            'level': np.arange(len(t0)) % 3,
+            't0': t0[::-1],
+            'duration': 5e-3,
+        }),
+    )
+
+
+def test_load_events(recording):
+    events = load_events(recording.erp_metadata)
+    assert [e['t0'] for e in events] == sorted(recording.erp_metadata['t0'])
+    assert set(events[0]['metadata']) == {'level'}
+    assert events[0]['duration'] == 5e-3
+
+    event_log = pd.DataFrame({'event': ['start', 'end'],
+                              'timestamp': [2, 1]})
+    events = load_events(event_log)
+    assert [e['metadata']['event'] for e in events] == ['end', 'start']
+
+
+@pytest.mark.parametrize('hw_ai_workers,reuse_buffers',
+                         [(0, False), (2, False), (0, True)])
+def test_replay(recording, hw_ai_workers, reuse_buffers):
+    engine = ReplayEngine(name='replay', recording=recording, speed=0,
+                          hw_ai_monitor_period=0.1, read_duration=0.35,
+                          hw_ai_workers=hw_ai_workers,
+                          hw_ai_reuse_buffers=reuse_buffers)
+    ReplayHardwareAIChannel(name='eeg', parent=engine)
+    ReplayHardwareAIChannel(name='mic', signal_name='microphone', fs=1000,
+                            parent=engine)
+    engine.configure(active=False)
+
+    # Epochs are extracted from the replayed data using the t0 provided by
+    # the saved metadata.
+    queue = deque()
+    epochs = []
+    extract = extract_epochs(1000, queue, 10e-3, 0, 0, epochs.extend)
+    acquired = []
+    done = []
+    engine.register_ai_callback(acquired.append, 'mic', copy=True)
+    engine.register_ai_callback(extract.send, 'eeg')
+    engine.register_event_callback(queue.append, 'erp_metadata')
+    engine.register_done_callback(lambda: done.append(True))
+    engine.start()
+    assert engine.join(10)
+    engine.stop()
+
+    assert done == [True]
+    assert engine.get_metrics()['hw_ai_samples'] == 5000
+    assert np.array_equal(np.concatenate(acquired),
+                          recording.microphone[:5000])
+
+    expected = recording.erp_metadata.sort_values('t0')
+    assert len(epochs) == len(expected)
+    for epoch, (_, row) in zip(epochs, expected.iterrows()):
+        assert epoch['info']['t0'] == row['t0']
+        assert epoch['info']['metadata']['level'] == row['level']
+        lb = round(row['t0'] * 1000)
+        assert np.array_equal(epoch['signal'], recording.eeg[lb:lb+10])
+
+
+def test_replay_fs_mismatch(recording):
+    engine = ReplayEngine(name='replay', recording=recording)
+    ReplayHardwareAIChannel(name='eeg', fs=2000, parent=engine)
+    with pytest.raises(ValueError):
+        engine.configure(active=False)
@@ -0,0 +1,143 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from psi.data.io.result_cache import (canonical_arguments, fingerprint,
+                                      make_key, ResultCache)
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'eeg'
+    path.mkdir()
+    (path / 'data').write_bytes(b'0' * 100)
+    return path
+
+
+@pytest.fixture
+def result_cache(tmp_path, source):
+    return ResultCache(tmp_path / 'cache', [source])
+
+
+def make_epochs(n=10):
+    index = pd.MultiIndex.from_arrays([np.arange(n) % 2, np.arange(n) * 0.1],
+                                      names=['polarity', 't0'])
+    columns = pd.Index(np.arange(20) / 1e3, name='time')
+    return pd.DataFrame(np.random.uniform(size=(n, 20)), index=index,
+                        columns=columns)
+
+
+def test_key_is_stable():
+    # Argument order does not matter and the key does not depend on the
+    # process (unlike `hash`).
+    a = canonical_arguments('get_epochs', {'offset': 0, 'duration': 1e-3})
+    b = canonical_arguments('get_epochs', {'duration': 1e-3, 'offset': 0})
+    assert a == b
+    assert make_key(a) == make_key(b)
+    assert make_key(a) == 'cd371097f13910d2c6ea6b0d30359d3d'
+
+
+def test_cache_hit_miss(result_cache):
+    expected = make_epochs()
+    calls = []
+
+    def compute():
+        calls.append(True)
+        return expected
+
+    args = {'offset': 0, 'reject_threshold': np.inf, 'columns': 'auto'}
+    for i in range(3):
+        result = result_cache.get('get_epochs', args, compute)
+        pd.testing.assert_frame_equal(result, expected)
+    assert len(calls) == 1
+
+    result_cache.get('get_epochs', args, compute, refresh=True)
+    assert len(calls) == 2
+
+    stats = result_cache.get_stats()
+    assert stats['hits'] == 2
+    assert stats['misses'] == 2
+    assert stats['entries'] == 1
+
+    # Results that are not numeric data frames are also supported.
+    result_cache.get('get_setting', {}, lambda: {'level': 80})
+    assert result_cache.get('get_setting', {}, None) == {'level': 80}
+
+
+def test_cache_invalidate(result_cache, source):
+    result_cache.get('get_epochs', {}, make_epochs)
+    (source / 'data').write_bytes(b'0' * 200)
+    result_cache.get('get_epochs', {}, make_epochs)
+    stats = result_cache.get_stats()
+    assert stats['invalidated'] == 1
+    assert stats['misses'] == 2
+    assert stats['entries'] == 1
+
+
+def test_cache_evict(result_cache):
+    for i in range(3):
+        result_cache.get('get_epochs', {'i': i}, make_epochs)
+    size = result_cache.get_stats()['size']
+    result_cache.max_size = size * 0.7
+
+    # The first entry is now the most recently used.
+    result_cache.get('get_epochs', {'i': 0}, None)
+    result_cache.get('get_epochs', {'i': 3}, make_epochs)
+
+    stats = result_cache.get_stats()
+    assert stats['evicted'] == 2
+    assert stats['entries'] == 2
+    assert result_cache.get('get_epochs', {'i': 0}, None) is not None
+
+
+def test_fingerprint_carray(tmp_path):
+    path = tmp_path / 'eeg'
+    (path / 'meta').mkdir(parents=True)
+    (path / 'data').mkdir()
+    (path / 'meta' / 'sizes').write_text('{"shape": [1000]}')
+    (path / 'data' / '__0.blp').write_bytes(b'0' * 100)
+    expected = fingerprint([path])
+
+    # The chunks are not checked.
+    (path / 'data' / '__0.blp').write_bytes(b'0' * 200)
+    assert fingerprint([path]) == expected
+
+    # Appending data updates the sizes and adds chunks.
+    (path / 'meta' / 'sizes').write_text('{"shape": [2000]}')
+    assert fingerprint([path]) != expected
+    expected = fingerprint([path])
+    (path / 'data' / '__1.blp').write_bytes(b'0' * 100)
+    assert fingerprint([path]) != expected
+
+
+def test_cache_folder(result_cache, source):
+    calls = []
+
+    def create(path):
+        calls.append(path)
+        path.mkdir()
+        (path / 'data').write_bytes(b'0' * 1000)
+
+    folder = result_cache.get_folder('filtered', {'lb': 300}, create)
+    assert (folder / 'data').exists()
+    assert result_cache.get_folder('filtered', {'lb': 300}, create) == folder
+    assert len(calls) == 1
+    stats = result_cache.get_stats()
+    assert stats['hits'] == 1
+    assert stats['size'] > 1000
+
+    # Folders are evicted along with other entries.
+    result_cache.max_size = 1500
+    other = result_cache.get_folder('filtered', {'lb': 500}, create)
+    assert not folder.exists()
+    assert other.exists()
+    assert result_cache.get_stats()['evicted'] == 1
+
+    # Folders are removed if the source data changes.
+    (source / 'data').write_bytes(b'0' * 200)
+    result_cache.get_folder('filtered', {'lb': 500}, create)
+    assert result_cache.get_stats()['invalidated'] == 1
+    assert len(calls) == 3
+
+    result_cache.clear()
+    assert not other.exists()
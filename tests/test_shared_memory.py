@@ -0,0 +1,82 @@
+import uuid
+
+import numpy as np
+import pytest
+
+from psi.data.io.shared_memory import (DataOverwrittenError,
+                                       SharedMemoryRingBuffer,
+                                       SharedMemoryStreamReader)
+
+
+@pytest.fixture
+def ring_buffer():
+    name = 'psi_test_{}'.format(uuid.uuid4().hex[:8])
+    buffer = SharedMemoryRingBuffer(name, 1000, ['a', 'b'], 100,
+                                    metadata={'units': ['V', 'V']})
+    yield buffer
+    buffer.close()
+    buffer.unlink()
+
+
+@pytest.fixture
+def reader(ring_buffer):
+    reader = SharedMemoryStreamReader(ring_buffer.name)
+    yield reader
+    reader.close()
+
+
+def test_header(ring_buffer, reader):
+    assert reader.fs == 1000
+    assert reader.capacity == 100
+    assert reader.channel_names == ['a', 'b']
+    assert reader.dtype == np.dtype('float64')
+    assert reader.metadata == {'units': ['V', 'V']}
+    assert not reader.finished
+    ring_buffer.set_finished()
+    assert reader.finished
+
+
+def test_round_trip(ring_buffer, reader):
+    data = np.random.uniform(size=(2, 250))
+    for lb in range(0, 250, 30):
+        ring_buffer.write('a', data[0, lb:lb+30])
+        ring_buffer.write(1, data[1, lb:lb+30])
+        end = min(lb + 30, 250)
+        # Include reads that wrap around the end of the buffer.
+        start = max(0, end-80)
+        assert np.array_equal(reader.read(start, end), data[:, start:end])
+
+    assert reader.get_available() == (150, 250)
+    assert np.array_equal(reader.read_latest(100), data[:, 150:])
+
+    views = reader.get_views('b', 180, 230)
+    assert np.array_equal(np.concatenate(views), data[1, 180:230])
+    assert reader.is_valid(180)
+
+
+def test_read_errors(ring_buffer, reader):
+    ring_buffer.write('a', np.arange(150))
+    ring_buffer.write('b', np.arange(120))
+
+    # Only 120 samples have been acquired for all channels
+    with pytest.raises(ValueError):
+        reader.read(100, 130)
+
+    # Samples 0 through 49 have been overwritten in channel a
+    with pytest.raises(DataOverwrittenError):
+        reader.read(40, 100)
+
+
+def test_read_new(ring_buffer, reader):
+    ring_buffer.write('a', np.arange(60))
+    ring_buffer.write('b', np.arange(60))
+    assert np.array_equal(reader.read_new()[0], np.arange(60))
+    assert reader.read_new().shape == (2, 0)
+
+    # Reader falls behind and 50 samples are lost
+    ring_buffer.write('a', np.arange(60, 210))
+    ring_buffer.write('b', np.arange(60, 210))
+    data = reader.read_new()
+    assert np.array_equal(data[0], np.arange(110, 210))
+    assert reader.samples_lost == 50
+    assert reader.cursor == 210
@@ -178,3 +178,45 @@ def test_buffer_invalidate_past_end(sb):
     sb.invalidate_samples(4999)
     assert sb.get_samples_lb() == 4000
     assert sb.get_samples_ub() == 4999
+
+
+def test_buffer_wrap(sb):
+    data = np.random.uniform(size=2300)
+    for i in range(0, 2300, 300):
+        sb.append_data(data[i:i+300])
+        ub = min(i+300, 2300)
+        lb = max(ub-1000, 0)
+        assert sb.get_samples_lb() == lb
+        assert sb.get_samples_ub() == ub
+        assert np.all(sb.get_range_samples() == data[lb:ub])
+
+    # Contiguous ranges should be returned as a view into the buffer.
+    result = sb.get_range_samples(1500, 1900)
+    assert np.shares_memory(result, sb._buffer)
+    assert np.all(result == data[1500:1900])
+
+    # Ranges that wrap around the end of the buffer cannot be a view.
+    result = sb.get_range_samples(1800, 2200)
+    assert not np.shares_memory(result, sb._buffer)
+    assert np.all(result == data[1800:2200])
+
+
+def test_buffer_multichannel():
+    sb = SignalBuffer(fs=100, size=10, n_channels=3)
+    data = np.random.uniform(size=(3, 2500))
+    for i in range(0, 2500, 700):
+        sb.append_data(data[:, i:i+700])
+    assert sb.get_samples_lb() == 1500
+    assert sb.get_samples_ub() == 2500
+    assert np.all(sb.get_range(15, 25) == data[:, 1500:])
+
+    result = sb.get_range_filled(20, 30, np.nan)
+    assert result.shape == (3, 1000)
+    assert np.all(result[:, :500] == data[:, 2000:])
+    assert np.all(np.isnan(result[:, 500:]))
+
+    sb.invalidate(20)
+    assert sb.get_samples_ub() == 2000
+    sb.append_data(data[:, :100])
+    assert np.all(sb.get_range(19, 21) == \
+                  np.concatenate((data[:, 1900:2000], data[:, :100]), axis=-1))
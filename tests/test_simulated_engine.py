@@ -0,0 +1,189 @@
+import threading
+import time
+
+import pytest
+
+import numpy as np
+
+from psi.controller.input import Blocked, Capture
+from psi.controller.engines.simulated import (SimulatedEngine,
+                                              SimulatedHardwareAIChannel,
+                                              SimulatedHardwareAOChannel)
+
+
+class RampAOChannel(SimulatedHardwareAOChannel):
+
+    def _get_active(self):
+        return True
+
+    def get_samples(self, offset, samples, out=None):
+        out[:] = np.arange(offset, offset+samples)
+        return out
+
+
+@pytest.fixture()
+def simulated_engine():
+    engine = SimulatedEngine(name='simulated', speed=0, start_skew=0.01,
+                             hw_ai_monitor_period=0.1,
+                             hw_ao_monitor_period=0.5, hw_ao_buffer_size=2)
+    RampAOChannel(name='speaker', fs=1000, samples=5000, parent=engine)
+    return engine
+
+
+@pytest.mark.parametrize('start_trigger', ['', 'ao/StartTrigger'])
+def test_simulated_loopback(simulated_engine, start_trigger):
+    SimulatedHardwareAIChannel(name='microphone', fs=1000, samples=5000,
+                               loopback='speaker', loopback_gain=2,
+                               latency=0.005, start_trigger=start_trigger,
+                               gain=20, parent=simulated_engine)
+    simulated_engine.configure(active=False)
+
+    acquired = []
+    done = []
+    simulated_engine.register_ai_callback(acquired.append, 'microphone')
+    simulated_engine.register_done_callback(lambda: done.append(True))
+    simulated_engine.start()
+    assert simulated_engine.join(10)
+    simulated_engine.stop()
+
+    # Untriggered channels start acquiring before the analog output starts.
+    delay = 5 if start_trigger else 15
+    expected = 2 * np.r_[np.zeros(delay), np.arange(5000-delay)]
+    assert np.allclose(np.concatenate(acquired), expected)
+    assert done == [True]
+
+    metrics = simulated_engine.get_metrics()
+    assert metrics['ao_underflow_samples'] == 0
+    assert metrics['hw_ai_samples'] == 5000
+
+
+def test_simulated_write_hw_ao(simulated_engine):
+    simulated_engine.configure(active=False)
+    simulated_engine.start()
+    assert simulated_engine.join(10)
+    simulated_engine.stop()
+    with pytest.raises(SystemError):
+        simulated_engine.write_hw_ao(np.zeros((1, 10)), 100)
+
+
+@pytest.mark.parametrize('hw_ai_workers', [1, 2])
+def test_simulated_ai_workers(simulated_engine, hw_ai_workers):
+    simulated_engine.hw_ai_workers = hw_ai_workers
+    simulated_engine.hw_ai_queue_size = 2
+    simulated_engine.hw_ai_queue_overflow = 'block'
+    for name in ('microphone', 'eeg'):
+        SimulatedHardwareAIChannel(name=name, fs=1000, samples=5000,
+                                   loopback='speaker', start_trigger='ao',
+                                   parent=simulated_engine)
+    simulated_engine.configure(active=False)
+
+    acquired = {'microphone': [], 'eeg': []}
+    threads = {'microphone': set(), 'eeg': set()}
+    done = []
+
+    def make_callback(name):
+        def cb(data):
+            # Simulate processing that is slower than acquisition.
+            time.sleep(0.005)
+            threads[name].add(threading.current_thread().name)
+            acquired[name].append(data)
+        return cb
+
+    for name in acquired:
+        simulated_engine.register_ai_callback(make_callback(name), name)
+
+    def done_cb():
+        # All data must be processed before the done callback is invoked.
+        done.append(sum(len(a) for a in acquired.values()))
+
+    simulated_engine.register_done_callback(done_cb)
+    simulated_engine.start()
+    assert simulated_engine.join(10)
+    metrics = simulated_engine.get_metrics()['ai_workers']
+    simulated_engine.stop()
+
+    expected = np.arange(5000)
+    for name in acquired:
+        assert np.array_equal(np.concatenate(acquired[name]), expected)
+        assert len(threads[name]) == 1
+    n_blocks = len(acquired['eeg'])
+    assert done == [2 * n_blocks]
+
+    assert len(metrics) == hw_ai_workers
+    assert sum(m['blocks'] for m in metrics) == n_blocks * hw_ai_workers
+    assert all(m['max_queued'] <= 2 for m in metrics)
+    assert all(m['queued'] == 0 for m in metrics)
+    if hw_ai_workers == 2:
+        assert threads['microphone'] != threads['eeg']
+
+
+def test_simulated_reuse_buffers(simulated_engine):
+    simulated_engine.hw_ai_reuse_buffers = True
+    for name in ('microphone', 'eeg'):
+        SimulatedHardwareAIChannel(name=name, fs=1000, samples=5000,
+                                   loopback='speaker', start_trigger='ao',
+                                   parent=simulated_engine)
+    simulated_engine.configure(active=False)
+
+    copied = []
+    views = []
+    simulated_engine.register_ai_callback(copied.append, 'microphone',
+                                          copy=True)
+    simulated_engine.register_ai_callback(views.append, 'eeg')
+    simulated_engine.start()
+    assert simulated_engine.join(10)
+    stats = simulated_engine.get_metrics()['ai_read_buffer']
+    simulated_engine.stop()
+
+    # Copies are valid after the callback returns.
+    assert np.array_equal(np.concatenate(copied), np.arange(5000))
+
+    # Views rotate through the two preallocated buffers.
+    assert np.shares_memory(views[0], views[2])
+    assert not np.shares_memory(views[0], views[1])
+    assert stats['allocations'] == 2
+    assert stats['reads'] == len(views)
+    assert stats['copies'] == len(copied)
+
+
+@pytest.mark.parametrize('copy_data', [True, False])
+def test_simulated_reuse_buffers_inputs(simulated_engine, copy_data):
+    simulated_engine.hw_ai_reuse_buffers = True
+    channel = SimulatedHardwareAIChannel(name='microphone', fs=1000,
+                                         samples=5000, loopback='speaker',
+                                         start_trigger='ao',
+                                         parent=simulated_engine)
+
+    # Blocks that fit in a read are passed through as views of the read
+    # buffer. The callback holds on to them until acquisition is done.
+    capture = Capture(name='capture')
+    block = Blocked(name='block', duration=0.05)
+    blocks = []
+    channel.add_input(capture)
+    capture.add_input(block)
+    block.add_callback(blocks.append, copy_data=copy_data)
+    assert capture.requires_copy() == copy_data
+
+    simulated_engine.configure(active=False)
+    capture.queue.put(0)
+    simulated_engine.start()
+    assert simulated_engine.join(10)
+    stats = simulated_engine.get_metrics()['ai_read_buffer']
+    simulated_engine.stop()
+
+    blocks = [b for b in blocks if b is not Ellipsis]
+    if copy_data:
+        assert stats['copies'] == stats['reads']
+        assert np.array_equal(np.concatenate(blocks), np.arange(5000))
+    else:
+        assert stats['copies'] == 0
+
+
+def test_simulated_ao_staging(simulated_engine):
+    simulated_engine.configure(active=False)
+    a = simulated_engine._get_hw_ao_samples(0, 100)
+    assert np.array_equal(a[0], np.arange(100))
+    b = simulated_engine._get_hw_ao_samples(100, 50)
+    assert np.array_equal(b[0], np.arange(100, 150))
+    assert b.flags['C_CONTIGUOUS']
+    assert np.shares_memory(a, b)
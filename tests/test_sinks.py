@@ -1,8 +1,10 @@
+import time
+
 import numpy as np
 import pandas as pd
 import random
 
-from psi.data.sinks.api import TableStore
+from psi.data.sinks.api import BColzStore, TableStore
 
 
 def test_table_create_append():
@@ -51,3 +53,44 @@ def test_table_append_10k_rows_speed(benchmark):
     store.process_table(data)
     row = _random_row()
     benchmark(store.process_table, row)
+
+
+class SlowStore:
+
+    def __init__(self):
+        self.data = []
+        self.n_flush = 0
+
+    def append(self, data):
+        time.sleep(0.01)
+        self.data.append(data)
+
+    def flush(self):
+        self.n_flush += 1
+
+
+def test_bcolz_store_async_write():
+    store = BColzStore(async_write=True)
+    slow_store = SlowStore()
+    store._stores = {'eeg': slow_store}
+    store.start_writer()
+
+    blocks = [np.random.uniform(size=10) for i in range(20)]
+    for block in blocks:
+        store.process_ai_continuous('eeg', block)
+
+    # The data should have been copied before being queued.
+    expected = [b.copy() for b in blocks]
+    blocks[0][:] = 0
+
+    # Flush waits for the queued data to be written.
+    store.flush()
+    assert len(slow_store.data) == 20
+    for actual, e in zip(slow_store.data, expected):
+        np.testing.assert_array_equal(actual, e)
+    assert slow_store.n_flush >= 1
+    assert store.writer is None
+
+    # Data that arrives after the flush is written directly.
+    store.process_ai_continuous('eeg', expected[0])
+    assert len(slow_store.data) == 21
@@ -0,0 +1,68 @@
+import json
+import time
+
+import pytest
+
+from psi.data.io.summarize_abr import estimate_memory, map_files, process_files
+
+
+def sleep_task(filename):
+    start = time.time()
+    time.sleep(0.2)
+    return {'filename': filename, 'start': start, 'end': time.time()}
+
+
+def get_overlap(results):
+    results = sorted(results, key=lambda r: r['start'])
+    return any(b['start'] < a['end'] for a, b in zip(results, results[1:]))
+
+
+@pytest.mark.parametrize('jobs', [1, 3])
+def test_map_files(jobs):
+    filenames = ['a', 'b', 'c']
+    results = list(map_files(sleep_task, filenames, jobs))
+    assert sorted(r['filename'] for r in results) == filenames
+    assert get_overlap(results) == (jobs > 1)
+
+
+def test_map_files_memory_budget():
+    # Only one file fits in the memory budget at a time.
+    filenames = ['a', 'b', 'c']
+    results = list(map_files(sleep_task, filenames, 3, memory_budget=10,
+                             estimate=lambda f: 6))
+    assert sorted(r['filename'] for r in results) == filenames
+    assert not get_overlap(results)
+
+
+def test_process_files_errors(tmp_path):
+    # Errors are reported in the summary rather than stopping the batch.
+    filenames = [str(tmp_path / f'missing_abr_{i}') for i in range(2)]
+    summary = process_files(filenames, jobs=2)
+    assert summary['status'].tolist() == ['error', 'error']
+    assert summary['error'].notnull().all()
+
+
+def test_process_files_skip(tmp_path):
+    # Processed files are skipped without loading them (the folder does not
+    # contain any data).
+    path = tmp_path / 'processed_abr'
+    path.mkdir()
+    for name in ('individual waveforms', 'average waveforms',
+                 'number of epochs', 'reject ratio'):
+        (path / f'ABR -1.0ms to 9.0ms {name}.csv').touch()
+    summary = process_files([str(path)])
+    assert summary['status'].tolist() == ['skipped']
+
+    # The saved filter settings are needed to determine the filenames, so
+    # the file is loaded by the worker.
+    summary = process_files([str(path)], filter_settings='saved')
+    assert summary['status'].tolist() == ['error']
+
+
+def test_estimate_memory(tmp_path):
+    meta = tmp_path / 'abr' / 'eeg' / 'meta'
+    meta.mkdir(parents=True)
+    (meta / 'sizes').write_text(json.dumps({'shape': [1000]}))
+    (meta / 'storage').write_text(json.dumps({'dtype': 'float32'}))
+    assert estimate_memory(tmp_path / 'abr') == 4000
+    assert estimate_memory(tmp_path / 'missing') == 0
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from psi.data.io.table_format import find_table, get_format
+
+
+@pytest.fixture(params=['csv', 'parquet'])
+def fmt(request):
+    if request.param == 'parquet':
+        pytest.importorskip('pyarrow')
+    return get_format(request.param)
+
+
+def make_epochs():
+    index = pd.MultiIndex.from_product([[1000.0, 2000.0], [10, 80], [-1, 1]],
+                                       names=['frequency', 'level',
+                                              'polarity'])
+    columns = pd.Index(np.arange(-10, 90) / 10e3, name='time')
+    return pd.DataFrame(np.random.normal(size=(len(index), len(columns))),
+                        index=index, columns=columns)
+
+
+def test_epochs_round_trip(fmt, tmp_path):
+    expected = make_epochs()
+    filename = tmp_path / f'epochs{fmt.suffix}'
+    fmt.write_epochs(expected, filename)
+    actual = fmt.read_epochs(filename)
+    pd.testing.assert_frame_equal(actual, expected, check_exact=False,
+                                  check_index_type=False)
+
+    actual = fmt.read_epochs(filename, columns=slice(0, 5e-3))
+    assert actual.columns[0] == 0
+    assert actual.columns[-1] == 5e-3
+    assert len(actual.columns) == 51
+
+
+def test_table_round_trip(fmt, tmp_path):
+    expected = pd.DataFrame({
+        'level': np.arange(20) % 4 * 10.0,
+        'experiment': ['abr_io'] * 20,
+        't0': np.arange(20) * 0.05,
+    })
+    filename = tmp_path / f'erp_metadata{fmt.suffix}'
+    fmt.write(expected, filename, index=False)
+    pd.testing.assert_frame_equal(fmt.read(filename), expected)
+    actual = fmt.read(filename, columns=['t0'])
+    assert actual.columns.tolist() == ['t0']
+    assert find_table(tmp_path / 'erp_metadata') == (filename, fmt)
+
+
+def test_parquet_dictionary_columns(tmp_path):
+    pytest.importorskip('pyarrow')
+    fmt = get_format('parquet')
+    df = pd.DataFrame({'experiment': ['abr_io', 'dpoae'] * 10,
+                       'level': np.arange(20.0)})
+    filename = tmp_path / 'table.parquet'
+    fmt.write(df, filename, index=False, dictionary_columns=['experiment'])
+    actual = fmt.read(filename)
+    assert isinstance(actual['experiment'].dtype, pd.CategoricalDtype)
+    pd.testing.assert_frame_equal(actual.astype(df.dtypes), df)
+
+
+def test_get_format():
+    with pytest.raises(ValueError):
+        get_format('xlsx')
@@ -1,8 +1,10 @@
 import pytest
 
+import numpy as np
+
 from atom.api import Atom, Value
 
-from psi.util import get_tagged_values
+from psi.util import EpochAccumulator, WaveformCache, get_tagged_values
 
 
 class PreferencesContainer(Atom):
@@ -21,3 +23,67 @@ def preferences():
 def test_get_tagged_values(preferences):
     result = get_tagged_values(preferences, 'preference')
     assert result == {'b': 2, 'd': 4}
+
+
+@pytest.mark.parametrize('mode', ['sum', 'welford', 'list'])
+@pytest.mark.parametrize('history', [0, 5])
+def test_epoch_accumulator(mode, history):
+    epochs = np.random.normal(size=(20, 100))
+    acc = EpochAccumulator(mode, history)
+    assert acc.get_mean() is None
+    for i, epoch in enumerate(epochs):
+        acc.append(epoch)
+        expected = epochs[max(0, i+1-history):i+1] if history else \
+            epochs[:i+1]
+        assert len(acc) == len(expected)
+        assert acc.total == i + 1
+        assert np.allclose(acc.get_mean(), expected.mean(axis=0))
+        if mode != 'sum':
+            assert np.allclose(acc.get_var(), expected.var(axis=0))
+
+
+def test_epoch_accumulator_complex():
+    epochs = np.fft.rfft(np.random.normal(size=(20, 100)), axis=-1)
+    acc = EpochAccumulator('welford')
+    for epoch in epochs:
+        acc.append(epoch)
+    assert np.allclose(acc.get_mean(), epochs.mean(axis=0))
+    assert np.allclose(acc.get_var(), epochs.var(axis=0))
+
+
+def test_waveform_cache():
+    rendered = []
+
+    def render(i):
+        rendered.append(i)
+        return np.full(100, i, dtype=np.double)
+
+    # Room for two waveforms
+    cache = WaveformCache(1600)
+    w1 = cache.get('a', lambda: render(1))
+    assert not w1.flags.writeable
+    assert cache.get('a', lambda: render(1)) is w1
+    cache.get('b', lambda: render(2))
+    cache.get('a', lambda: render(1))
+    cache.get('c', lambda: render(3))
+    assert rendered == [1, 2, 3]
+    assert cache.get_stats() == {'size': 2, 'nbytes': 1600, 'max_bytes': 1600,
+                                 'hits': 2, 'misses': 3, 'evictions': 1,
+                                 'bypassed': 0}
+
+    # 'b' was the least recently used and should have been evicted.
+    cache.get('b', lambda: render(2))
+    assert rendered == [1, 2, 3, 2]
+
+
+def test_waveform_cache_random_key():
+    cache = WaveformCache(1e6)
+    render = lambda: np.zeros(100)
+    assert cache.get('noise', render, (1,)) is not None
+    assert cache.get('noise', render, (1,)) is not None
+    assert cache.hits == 1
+    assert cache.get('noise', render, (2,)) is None
+    assert cache.get('noise', render, (1,)) is None
+    assert cache.get(None, render) is None
+    assert cache.bypassed == 3
+    assert len(cache) == 0